@@ -10,6 +10,8 @@ from app.config import settings
 from app.database import Base
 from app.models.currency import Currency
 from app.models.exchangerate import ExchangeRate
+from app.models.exchangerate_candle import ExchangeRateCandle
+from app.models.exchangerate_history import ExchangeRateHistory
 
 config = context.config
 
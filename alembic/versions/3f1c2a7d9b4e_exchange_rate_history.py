@@ -0,0 +1,59 @@
+"""Exchange rate history
+
+Revision ID: 3f1c2a7d9b4e
+Revises: 8be710088486
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f1c2a7d9b4e"
+down_revision: str | Sequence[str] | None = "8be710088486"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "exchange_rate_history",
+        sa.Column("base_currency_id", sa.Integer(), nullable=False),
+        sa.Column("target_currency_id", sa.Integer(), nullable=False),
+        sa.Column("rate", sa.DECIMAL(precision=21, scale=6), nullable=False),
+        sa.Column("valid_from", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.ForeignKeyConstraint(["base_currency_id"], ["currencies.id"]),
+        sa.ForeignKeyConstraint(["target_currency_id"], ["currencies.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_exchange_rate_history_pair_valid_from",
+        "exchange_rate_history",
+        ["base_currency_id", "target_currency_id", "valid_from"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_exchange_rate_history_valid_from_brin",
+        "exchange_rate_history",
+        ["valid_from"],
+        unique=False,
+        postgresql_using="brin",
+    )
+    # Текущие курсы становятся первой точкой истории
+    op.execute(
+        "INSERT INTO exchange_rate_history (base_currency_id, target_currency_id, rate, valid_from) "
+        "SELECT base_currency_id, target_currency_id, rate, now() FROM exchange_rates"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_exchange_rate_history_valid_from_brin", table_name="exchange_rate_history")
+    op.drop_index("ix_exchange_rate_history_pair_valid_from", table_name="exchange_rate_history")
+    op.drop_table("exchange_rate_history")
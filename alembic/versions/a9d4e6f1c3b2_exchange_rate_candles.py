@@ -0,0 +1,65 @@
+"""Exchange rate candles
+
+Revision ID: a9d4e6f1c3b2
+Revises: 3f1c2a7d9b4e
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a9d4e6f1c3b2"
+down_revision: str | Sequence[str] | None = "3f1c2a7d9b4e"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+INTERVALS = ("minute", "hour", "day")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "exchange_rate_candles",
+        sa.Column("base_currency_id", sa.Integer(), nullable=False),
+        sa.Column("target_currency_id", sa.Integer(), nullable=False),
+        sa.Column("interval", sa.VARCHAR(length=6), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("open", sa.DECIMAL(precision=21, scale=6), nullable=False),
+        sa.Column("high", sa.DECIMAL(precision=21, scale=6), nullable=False),
+        sa.Column("low", sa.DECIMAL(precision=21, scale=6), nullable=False),
+        sa.Column("close", sa.DECIMAL(precision=21, scale=6), nullable=False),
+        sa.Column("rate_sum", sa.DECIMAL(precision=30, scale=6), nullable=False),
+        sa.Column("samples", sa.Integer(), nullable=False),
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.ForeignKeyConstraint(["base_currency_id"], ["currencies.id"]),
+        sa.ForeignKeyConstraint(["target_currency_id"], ["currencies.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_exchange_rate_candles_pair_interval_bucket",
+        "exchange_rate_candles",
+        ["base_currency_id", "target_currency_id", "interval", "bucket_start"],
+        unique=True,
+    )
+    # Свёртки по уже накопленной истории
+    for interval in INTERVALS:
+        op.execute(
+            "INSERT INTO exchange_rate_candles "
+            "(base_currency_id, target_currency_id, interval, bucket_start, open, high, low, close, rate_sum, samples) "
+            f"SELECT base_currency_id, target_currency_id, '{interval}', "
+            f"date_trunc('{interval}', valid_from AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', "
+            "(array_agg(rate ORDER BY valid_from, id))[1], max(rate), min(rate), "
+            "(array_agg(rate ORDER BY valid_from DESC, id DESC))[1], sum(rate), count(*) "
+            "FROM exchange_rate_history GROUP BY 1, 2, 4"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_exchange_rate_candles_pair_interval_bucket", table_name="exchange_rate_candles")
+    op.drop_table("exchange_rate_candles")
@@ -6,18 +6,26 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 
 from app.dependencies import MyProvider
-from app.exception_handler import http_exception_handler, ownexception_handler, validation_exception_handler
-from app.exceptions import BaseOwnException
+from app.exception_handler import (
+    http_exception_handler,
+    not_modified_handler,
+    ownexception_handler,
+    validation_exception_handler,
+)
+from app.exceptions import BaseOwnException, NotModifiedError
+from app.instrumentation import QueryTimingMiddleware
 from app.lifespan import lifespan
 from app.routers.currency import currency_router
 from app.routers.exchange import exchange_router
 from app.routers.exchangerate import exchange_rate_router
+from app.routers.health import health_router
+from app.routers.internal import internal_router, metrics_router
 
 
-def create_app() -> FastAPI:
+def create_app(provider: MyProvider | None = None) -> FastAPI:
     app = FastAPI(lifespan=lifespan)
 
-    container = make_async_container(MyProvider())
+    container = make_async_container(provider or MyProvider())
     setup_dishka(container, app)
     origins = [
         "http://localhost",
@@ -27,6 +35,7 @@ def create_app() -> FastAPI:
         "http://127.0.0.1:80",
     ]
 
+    app.add_middleware(QueryTimingMiddleware)
     app.add_middleware(
         CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"]
     )
@@ -35,11 +44,15 @@ def create_app() -> FastAPI:
     app.add_exception_handler(RequestValidationError, validation_exception_handler)  # type: ignore[arg-type]
     app.add_exception_handler(HTTPException, http_exception_handler)  # type: ignore[arg-type]
     app.add_exception_handler(BaseOwnException, ownexception_handler)  # type: ignore[arg-type]
+    app.add_exception_handler(NotModifiedError, not_modified_handler)  # type: ignore[arg-type]
 
     # Подключаем свои роутеры
     app.include_router(exchange_router)
     app.include_router(exchange_rate_router)
     app.include_router(currency_router)
+    app.include_router(internal_router)
+    app.include_router(metrics_router)
+    app.include_router(health_router)
 
     @app.get("/", tags=["Перенаправление"])
     async def root() -> RedirectResponse:
@@ -0,0 +1,85 @@
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from decimal import Decimal
+
+from app import metrics
+from app.cache.rate_graph import CodePair
+from app.schemas import ConvertedExchangeRateResponse
+
+ConversionKey = tuple[str, str, Decimal]
+
+
+class ConversionCache:
+    """Готовые результаты конвертации по ключу (from, to, amount).
+
+    Хранит не больше max_entries записей, вытесняя давно не запрошенные (LRU), каждая живёт ttl секунд.
+    При изменении курса удаляются записи только тех пар, чей курс от него зависит;
+    результат, посчитанный до изменения, но сохраняемый после него, отбрасывается.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries: OrderedDict[ConversionKey, tuple[float, ConvertedExchangeRateResponse]] = OrderedDict()
+        self._by_pair: dict[CodePair, set[ConversionKey]] = {}
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """Номер поколения, который нужно запомнить до расчёта и передать в put."""
+        return self._generation
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, from_: str, to: str, amount: Decimal) -> ConvertedExchangeRateResponse | None:
+        key = (from_, to, amount)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() >= entry[0]:
+            self._remove(key)
+            entry = None
+        if entry is None:
+            metrics.cache_requests.inc("conversions", "miss")
+            return None
+
+        self._entries.move_to_end(key)
+        metrics.cache_requests.inc("conversions", "hit")
+        return entry[1]
+
+    def put(
+        self, from_: str, to: str, amount: Decimal, converted: ConvertedExchangeRateResponse, generation: int
+    ) -> None:
+        if self._max_entries <= 0 or generation != self._generation:
+            return
+
+        key = (from_, to, amount)
+        self._entries[key] = (time.monotonic() + self._ttl, converted)
+        self._entries.move_to_end(key)
+        self._by_pair.setdefault((from_, to), set()).add(key)
+        while len(self._entries) > self._max_entries:
+            oldest, _ = self._entries.popitem(last=False)
+            self._forget(oldest)
+
+    def invalidate(self, pairs: Iterable[CodePair] | None) -> None:
+        """Удаляет записи пар, чей курс изменился; None — курсы могли измениться у всех пар."""
+        self._generation += 1
+        if pairs is None:
+            self._entries.clear()
+            self._by_pair.clear()
+            return
+        for pair in pairs:
+            for key in self._by_pair.pop(pair, ()):
+                del self._entries[key]
+
+    def _remove(self, key: ConversionKey) -> None:
+        del self._entries[key]
+        self._forget(key)
+
+    def _forget(self, key: ConversionKey) -> None:
+        pair = (key[0], key[1])
+        keys = self._by_pair.get(pair)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_pair[pair]
@@ -0,0 +1,58 @@
+import time
+from email.utils import formatdate
+
+
+class DataVersion:
+    """Монотонно растущая версия данных о валютах и курсах.
+
+    Каждая запись в репозиториях увеличивает версию, по ней строятся ETag и Last-Modified.
+    Версия — время последнего изменения в наносекундах, поэтому после перезапуска воркера не откатывается назад.
+    Если задан refresh_every, версия растёт и сама — не реже раза в refresh_every секунд: так ETag и
+    собранные по версии ответы устаревают, даже когда о записях в других воркерах узнать неоткуда.
+    """
+
+    def __init__(self, value: int | None = None, refresh_every: float | None = None):
+        self._value = time.time_ns() if value is None else value
+        self._refresh_ns = None if refresh_every is None else max(int(refresh_every * 1_000_000_000), 1)
+        # Время последнего изменения по монотонным часам процесса. Когда была последняя запись до старта,
+        # воркер не знает, поэтому отсчёт начинается с создания
+        self._changed_at = time.monotonic()
+
+    @property
+    def value(self) -> int:
+        if self._refresh_ns is None:
+            return self._value
+        # Начало текущего интервала одинаково у всех воркеров, поэтому без записей их ETag совпадают
+        return max(self._value, time.time_ns() // self._refresh_ns * self._refresh_ns)
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.value:x}"'
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.value // 1_000_000_000, usegmt=True)
+
+    def bump(self) -> int:
+        self._value = max(self.value + 1, time.time_ns())
+        self._changed_at = time.monotonic()
+        return self.value
+
+    def observe(self, value: int) -> None:
+        """Учитывает версию, выставленную другим воркером."""
+        if value > self._value:
+            self._value = value
+            self._changed_at = time.monotonic()
+
+    def reset(self, value: int) -> None:
+        self._value = value
+        self._changed_at = time.monotonic()
+
+    def changed_within(self, seconds: float) -> bool:
+        """Менялись ли данные за последние seconds секунд."""
+        return time.monotonic() - self._changed_at < seconds
+
+    def matches(self, if_none_match: str) -> bool:
+        """Проверяет заголовок If-None-Match (слабое сравнение, как требует RFC 9110 для GET)."""
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or self.etag in tags
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import sys
+import time
+from collections.abc import Awaitable, Callable, Iterable, Sequence
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Self
+
+from redis.exceptions import RedisError
+
+from app import metrics
+from app.cache.data_version import DataVersion
+from app.cache.rate_graph import CodePair, CrossRateGraph
+from app.cache.redis_store import RedisRateStore, load_exchangerate
+from app.schemas import ConvertedExchangeRate, CurrencyResponse, ExchangeRateResponse
+
+logger = logging.getLogger(__name__)
+
+SnapshotLoader = Callable[[], Awaitable[tuple[list[CurrencyResponse], list[ExchangeRateResponse]]]]
+# Получает пары, чей курс изменился, или None, если измениться могли курсы любых пар
+RatesListener = Callable[[set[CodePair] | None], None]
+
+
+@dataclass(slots=True)
+class RateSnapshot:
+    currencies: dict[str, CurrencyResponse]
+    rates: dict[CodePair, ExchangeRateResponse]
+    graph: CrossRateGraph
+    loaded_at: float
+
+    @classmethod
+    def build(
+        cls,
+        currencies: Iterable[CurrencyResponse],
+        exchangerates: Iterable[ExchangeRateResponse],
+        pivots: Sequence[str] = (),
+    ) -> Self:
+        # Ключи интернируются, как и коды из валидатора запроса, — поиск по ним сводится к сравнению ссылок
+        rates = {
+            (sys.intern(rate.base_currency.code), sys.intern(rate.target_currency.code)): rate for rate in exchangerates
+        }
+        return cls(
+            currencies={sys.intern(currency.code): currency for currency in currencies},
+            rates=rates,
+            graph=CrossRateGraph({pair: rate.rate for pair, rate in rates.items()}, pivots),
+            loaded_at=time.monotonic(),
+        )
+
+    def get_effective_rate(self, from_: str, to: str) -> ConvertedExchangeRate | None:
+        base_currency = self.currencies.get(from_)
+        target_currency = self.currencies.get(to)
+        if base_currency is None or target_currency is None:
+            return None
+
+        rate = Decimal(1) if from_ == to else self.graph.resolve(from_, to)
+        if rate is None:
+            return None
+        return ConvertedExchangeRate(base_currency=base_currency, target_currency=target_currency, rate=rate)
+
+    def path_kind(self, from_: str, to: str) -> str:
+        """Как получен курс пары: same, direct, reverse или cross (через другие валюты)."""
+        if from_ == to:
+            return "same"
+        path = self.graph.path(from_, to)
+        if path is not None and len(path) == 2:
+            return "direct" if (from_, to) in self.rates else "reverse"
+        return "cross"
+
+    def set_rates(self, exchangerates: Iterable[ExchangeRateResponse]) -> set[CodePair]:
+        changed = {}
+        for exchangerate in exchangerates:
+            pair = (exchangerate.base_currency.code, exchangerate.target_currency.code)
+            self.rates[pair] = exchangerate
+            for currency in (exchangerate.base_currency, exchangerate.target_currency):
+                self.currencies.setdefault(currency.code, currency)
+            changed[pair] = exchangerate.rate
+        return self.graph.set_rates(changed)
+
+
+class RateCache:
+    """Снимок всех валют и курсов в памяти воркера.
+
+    Снимок загружается целиком при первом обращении и живёт ttl секунд,
+    либо до явной инвалидации. Изменение одного курса применяется к снимку на месте.
+    Если подключено общее хранилище в Redis, снимок берётся из него, а записи
+    рассылаются остальным воркерам вместе с новой версией данных.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        pivots: Sequence[str] = (),
+        data_version: DataVersion | None = None,
+        single_process: bool = False,
+        negative_ttl: float = 0,
+    ):
+        self._ttl = ttl
+        self._single_process = single_process
+        self._negative_ttl = negative_ttl
+        # Коды, которых недавно не нашлось в БД, и момент, до которого этому верим
+        self._missing: dict[str, float] = {}
+        self.data_version = data_version or DataVersion()
+        self._pivots = tuple(pivots)
+        self._snapshot: RateSnapshot | None = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._store: RedisRateStore | None = None
+        self._listeners: list[RatesListener] = []
+
+    @property
+    def pivots(self) -> tuple[str, ...]:
+        return self._pivots
+
+    def attach(self, store: RedisRateStore | None) -> None:
+        self._store = store
+        self._drop()
+
+    def on_rates_changed(self, listener: RatesListener) -> None:
+        """Подписывает кеш, построенный поверх курсов, на их изменения — свои и пришедшие от других воркеров."""
+        self._listeners.append(listener)
+
+    def peek(self) -> RateSnapshot | None:
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > self._ttl:
+            return None
+        return snapshot
+
+    def knows_currency(self, code: str) -> bool | None:
+        """Есть ли валюта, без обращения к БД.
+
+        False — валюты нет в снимке единственного процесса, либо её недавно не нашлось в БД (remember_missing).
+        None — ответа нет: снимок не загружен, либо валюты в нём нет, но её мог добавить другой воркер,
+        а рассылка изменений через Redis (если она есть) приходит с задержкой.
+        """
+        snapshot = self.peek()
+        if snapshot is not None and code in snapshot.currencies:
+            return True
+        if snapshot is not None and self._single_process:
+            return False
+        expires_at = self._missing.get(code)
+        if expires_at is not None and expires_at > time.monotonic():
+            return False
+        return None
+
+    def remember_missing(self, codes: Iterable[str]) -> None:
+        """Запоминает коды, которых не нашлось в БД, на negative_ttl секунд."""
+        if self._negative_ttl <= 0:
+            return
+        expires_at = time.monotonic() + self._negative_ttl
+        for code in codes:
+            self._missing[code] = expires_at
+
+    async def get_snapshot(self, loader: SnapshotLoader) -> RateSnapshot:
+        snapshot = self.peek()
+        if snapshot is not None:
+            metrics.cache_requests.inc("rates", "hit")
+            return snapshot
+
+        async with self._lock:
+            snapshot = self.peek()
+            if snapshot is not None:
+                # Снимок загрузил запрос, державший блокировку
+                metrics.cache_requests.inc("rates", "hit")
+                return snapshot
+
+            metrics.cache_requests.inc("rates", "miss")
+
+            generation = self._generation
+            currencies, exchangerates = await self._load(loader)
+            snapshot = RateSnapshot.build(currencies, exchangerates, self._pivots)
+            # Пока шла загрузка, снимок могли инвалидировать — такой сохранять нельзя
+            if generation == self._generation:
+                self._snapshot = snapshot
+                # Новый снимок мог принести изменения, о которых этот воркер не знал
+                self._notify(None)
+            logger.info("Загружен снимок курсов: %d валют, %d курсов", len(snapshot.currencies), len(snapshot.rates))
+            return snapshot
+
+    async def set_rate(self, exchangerate: ExchangeRateResponse) -> None:
+        await self.set_rates([exchangerate])
+
+    async def set_rates(self, exchangerates: list[ExchangeRateResponse]) -> None:
+        """Точечно обновляет курсы в снимке, пересчитывая только зависящие от них кросс-курсы."""
+        if not exchangerates:
+            return
+        self._apply_rates(exchangerates)
+        if self._store is not None:
+            try:
+                await self._store.publish_exchangerates(exchangerates, self.data_version.value)
+            except RedisError:
+                logger.exception("Не удалось разослать изменение курса через Redis")
+
+    async def add_currency(self, currency: CurrencyResponse) -> None:
+        self._apply_currency(currency)
+        if self._store is not None:
+            try:
+                await self._store.publish_currency(currency, self.data_version.value)
+            except RedisError:
+                logger.exception("Не удалось разослать добавление валюты через Redis")
+
+    async def invalidate(self) -> None:
+        self._drop()
+        if self._store is not None:
+            try:
+                await self._store.publish_invalidate()
+            except RedisError:
+                logger.exception("Не удалось разослать инвалидацию снимка курсов через Redis")
+
+    def handle_message(self, message: dict[str, Any]) -> None:
+        """Применяет к локальному снимку изменение, сделанное другим воркером."""
+        event = message.get("event")
+        if "version" in message:
+            self.data_version.observe(message["version"])
+        if event == "exchangerates":
+            self._apply_rates([load_exchangerate(raw) for raw in message["data"]])
+        elif event == "currency":
+            self._apply_currency(CurrencyResponse.model_validate(message["data"]))
+        else:
+            self._drop()
+
+    async def _load(self, loader: SnapshotLoader) -> tuple[list[CurrencyResponse], list[ExchangeRateResponse]]:
+        if self._store is None:
+            return await loader()
+
+        try:
+            shared = await self._store.load()
+        except RedisError:
+            logger.exception("Не удалось прочитать снимок курсов из Redis")
+            return await loader()
+        if shared is not None:
+            return shared
+
+        currencies, exchangerates = await loader()
+        try:
+            await self._store.save(currencies, exchangerates)
+        except RedisError:
+            logger.exception("Не удалось сохранить снимок курсов в Redis")
+        return currencies, exchangerates
+
+    def _apply_rates(self, exchangerates: list[ExchangeRateResponse]) -> None:
+        self._generation += 1
+        snapshot = self.peek()
+        if snapshot is None:
+            self._snapshot = None
+            self._notify(None)
+            return
+        self._notify(snapshot.set_rates(exchangerates))
+
+    def _apply_currency(self, currency: CurrencyResponse) -> None:
+        self._generation += 1
+        self._missing.pop(currency.code, None)
+        snapshot = self.peek()
+        if snapshot is None:
+            self._snapshot = None
+            return
+        snapshot.currencies[currency.code] = currency
+
+    def _drop(self) -> None:
+        self._generation += 1
+        self._snapshot = None
+        self._missing.clear()
+        self._notify(None)
+
+    def _notify(self, pairs: set[CodePair] | None) -> None:
+        for listener in self._listeners:
+            listener(pairs)
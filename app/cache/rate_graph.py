@@ -0,0 +1,120 @@
+from collections import deque
+from collections.abc import Collection, Mapping, Sequence
+from decimal import Decimal
+from itertools import pairwise
+
+CodePair = tuple[str, str]
+
+
+class CrossRateGraph:
+    """Граф курсов с заранее посчитанными кросс-курсами для всех пар валют.
+
+    Вершины — коды валют, рёбра — сохранённые в БД курсы (ходить по ребру можно в обе стороны).
+    Для каждой пары выбирается путь с наименьшим числом переходов, при равной длине
+    предпочтение отдаётся переходам через валюты из pivots (в порядке списка).
+    Если задан sources, пути считаются только из этих валют — для разового запроса по одной паре.
+    """
+
+    def __init__(
+        self, rates: Mapping[CodePair, Decimal], pivots: Sequence[str] = (), sources: Collection[str] | None = None
+    ):
+        self._rates = dict(rates)
+        self._pivots = {code: priority for priority, code in enumerate(pivots)}
+        self._sources = sources
+        self._paths: dict[CodePair, tuple[str, ...]] = {}
+        self._resolved: dict[CodePair, Decimal] = {}
+        # Какие пары используют сохранённый курс — чтобы при его изменении пересчитать только их
+        self._dependents: dict[CodePair, set[CodePair]] = {}
+        self._rebuild()
+
+    def resolve(self, from_: str, to: str) -> Decimal | None:
+        return self._resolved.get((from_, to))
+
+    def path(self, from_: str, to: str) -> tuple[str, ...] | None:
+        return self._paths.get((from_, to))
+
+    def dependents(self, base_code: str, target_code: str) -> set[CodePair]:
+        return set(self._dependents.get((base_code, target_code), ()))
+
+    def set_rate(self, base_code: str, target_code: str, rate: Decimal) -> set[CodePair]:
+        """Обновляет один курс и возвращает пары, чей кросс-курс изменился."""
+        return self.set_rates({(base_code, target_code): rate})
+
+    def set_rates(self, rates: Mapping[CodePair, Decimal]) -> set[CodePair]:
+        """Обновляет несколько курсов и возвращает пары, чей кросс-курс изменился."""
+        new_edges = rates.keys() - self._rates.keys()
+        self._rates.update(rates)
+        if new_edges:
+            # Новое ребро меняет топологию графа — пути пересчитываем целиком
+            self._rebuild()
+            return set(self._resolved)
+
+        affected: set[CodePair] = set()
+        for key in rates:
+            affected |= self._dependents.get(key, set())
+        for pair in affected:
+            self._resolved[pair] = self._path_rate(self._paths[pair])
+        return affected
+
+    def _edge(self, from_: str, to: str) -> tuple[CodePair, bool]:
+        """Сохранённый курс для перехода from_ -> to и признак того, что он берётся в обратную сторону."""
+        if (from_, to) in self._rates:
+            return (from_, to), False
+        return (to, from_), True
+
+    def _path_rate(self, path: Sequence[str]) -> Decimal:
+        # Числитель и знаменатель копим отдельно и делим один раз,
+        # так прямой, обратный и кросс-курс через одну валюту считаются как раньше
+        numerator = Decimal(1)
+        denominator = Decimal(1)
+        for from_, to in pairwise(path):
+            key, reverse = self._edge(from_, to)
+            if reverse:
+                denominator *= self._rates[key]
+            else:
+                numerator *= self._rates[key]
+        return numerator / denominator
+
+    def _neighbours(self) -> dict[str, list[str]]:
+        adjacency: dict[str, set[str]] = {}
+        for base_code, target_code in self._rates:
+            adjacency.setdefault(base_code, set()).add(target_code)
+            adjacency.setdefault(target_code, set()).add(base_code)
+
+        no_priority = len(self._pivots)
+        return {
+            code: sorted(neighbours, key=lambda neighbour: (self._pivots.get(neighbour, no_priority), neighbour))
+            for code, neighbours in adjacency.items()
+        }
+
+    def _rebuild(self) -> None:
+        self._paths.clear()
+        self._resolved.clear()
+        self._dependents.clear()
+
+        adjacency = self._neighbours()
+        sources = adjacency if self._sources is None else [code for code in self._sources if code in adjacency]
+        for source in sources:
+            parents: dict[str, str] = {}
+            queue = deque([source])
+            while queue:
+                node = queue.popleft()
+                for neighbour in adjacency[node]:
+                    if neighbour != source and neighbour not in parents:
+                        parents[neighbour] = node
+                        queue.append(neighbour)
+
+            for target in parents:
+                path = [target]
+                while path[-1] != source:
+                    path.append(parents[path[-1]])
+                path.reverse()
+                self._store(source, target, tuple(path))
+
+    def _store(self, source: str, target: str, path: tuple[str, ...]) -> None:
+        pair = (source, target)
+        self._paths[pair] = path
+        self._resolved[pair] = self._path_rate(path)
+        for from_, to in pairwise(path):
+            key, _ = self._edge(from_, to)
+            self._dependents.setdefault(key, set()).add(pair)
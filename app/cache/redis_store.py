@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+from collections.abc import Callable
+from typing import Any
+from uuid import uuid4
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import RedisError
+
+from app.schemas import CurrencyResponse, ExchangeRateResponse
+
+logger = logging.getLogger(__name__)
+
+RATES_KEY = "rate_cache:exchange_rates"
+CURRENCIES_KEY = "rate_cache:currencies"
+INVALIDATION_CHANNEL = "rate_cache:invalidation"
+VERSION_KEY = "rate_cache:data_version"
+# Поле-метка полного снимка: save пишет его вместе со всеми валютами и курсами, хеш без неё — не снимок
+COMPLETE_FIELD = "__complete__"
+
+MessageHandler = Callable[[dict[str, Any]], None]
+
+
+def dump_currency(currency: CurrencyResponse) -> dict[str, Any]:
+    return currency.model_dump()
+
+
+def dump_exchangerate(exchangerate: ExchangeRateResponse) -> dict[str, Any]:
+    # Курс сериализуем строкой: float из RoundedDecimal теряет точность на больших значениях
+    return {
+        "id": exchangerate.id,
+        "base_currency": dump_currency(exchangerate.base_currency),
+        "target_currency": dump_currency(exchangerate.target_currency),
+        "rate": str(exchangerate.rate),
+    }
+
+
+def load_exchangerate(raw: dict[str, Any]) -> ExchangeRateResponse:
+    return ExchangeRateResponse.model_validate(raw)
+
+
+class RedisRateStore:
+    """Общий для всех воркеров снимок курсов в Redis и канал уведомлений об изменениях.
+
+    Курсы лежат в одном хеше (поле на каждую пару), валюты — во втором. Оба хеша пишутся целиком
+    одной транзакцией с полем-меткой COMPLETE_FIELD; хеш без метки считается промахом.
+    Каждая запись публикует сообщение, по которому остальные воркеры правят свой снимок в памяти,
+    и обновляет поле в хеше, только если полный снимок в Redis есть.
+    """
+
+    def __init__(self, connection: Redis, ttl: float):
+        self._redis = connection
+        self._ttl = max(int(ttl), 1)
+        self.sender_id = uuid4().hex
+
+    async def load(self) -> tuple[list[CurrencyResponse], list[ExchangeRateResponse]] | None:
+        # Оба хеша читаются одной транзакцией, чтобы не застать их между удалением и записью в save
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(CURRENCIES_KEY)
+            pipe.hgetall(RATES_KEY)
+            raw_currencies, raw_rates = await pipe.execute()
+        if not _pop_complete(raw_currencies) or not _pop_complete(raw_rates):
+            return None
+
+        currencies = [CurrencyResponse.model_validate_json(value) for value in raw_currencies.values()]
+        exchangerates = [load_exchangerate(json.loads(value)) for value in raw_rates.values()]
+        return currencies, exchangerates
+
+    async def save(self, currencies: list[CurrencyResponse], exchangerates: list[ExchangeRateResponse]) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(CURRENCIES_KEY, RATES_KEY)
+            pipe.hset(
+                CURRENCIES_KEY,
+                mapping={
+                    COMPLETE_FIELD: "1",
+                    **{currency.code: json.dumps(dump_currency(currency)) for currency in currencies},
+                },
+            )
+            pipe.hset(
+                RATES_KEY,
+                mapping={
+                    COMPLETE_FIELD: "1",
+                    **{_codepair(rate): json.dumps(dump_exchangerate(rate)) for rate in exchangerates},
+                },
+            )
+            # Срок жизни ограничивает окно, в котором общий снимок может разойтись с БД
+            pipe.expire(CURRENCIES_KEY, self._ttl)
+            pipe.expire(RATES_KEY, self._ttl)
+            await pipe.execute()
+
+    async def sync_version(self, version: int) -> int:
+        """Возвращает общую для всех воркеров версию данных; первый запущенный воркер задаёт её своей."""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(VERSION_KEY, version, nx=True)
+            pipe.get(VERSION_KEY)
+            _, shared = await pipe.execute()
+        return int(shared)
+
+    async def publish_exchangerates(self, exchangerates: list[ExchangeRateResponse], version: int) -> None:
+        payload = [dump_exchangerate(exchangerate) for exchangerate in exchangerates]
+        await self._publish(
+            RATES_KEY,
+            {_codepair(rate): json.dumps(raw) for rate, raw in zip(exchangerates, payload, strict=True)},
+            self._message("exchangerates", payload, version),
+            version,
+        )
+
+    async def publish_currency(self, currency: CurrencyResponse, version: int) -> None:
+        payload = dump_currency(currency)
+        await self._publish(
+            CURRENCIES_KEY, {currency.code: json.dumps(payload)}, self._message("currency", payload, version), version
+        )
+
+    async def _publish(self, key: str, fields: dict[str, str], message: str, version: int) -> None:
+        async def write(pipe: Pipeline) -> None:
+            # HSET в отсутствующий хеш создал бы неполный снимок без срока жизни — такой хеш не трогаем.
+            # Если между проверкой и EXEC хеш изменили, WATCH отменит транзакцию и она повторится
+            complete = await pipe.hexists(key, COMPLETE_FIELD)  # type: ignore[misc]
+            pipe.multi()
+            if complete:
+                pipe.hset(key, mapping=fields)
+                # Срок жизни у полного снимка уже есть; NX лишь гарантирует его и не продлевает
+                pipe.expire(key, self._ttl, nx=True)
+            pipe.set(VERSION_KEY, version)
+            pipe.publish(INVALIDATION_CHANNEL, message)
+
+        await self._redis.transaction(write, key)
+
+    async def publish_invalidate(self) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(CURRENCIES_KEY, RATES_KEY)
+            pipe.publish(INVALIDATION_CHANNEL, self._message("invalidate", None))
+            await pipe.execute()
+
+    async def listen(self, handler: MessageHandler, retry_delay: float = 1.0) -> None:
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    # Пока не были подписаны, могли пропустить сообщения — снимок сбрасываем
+                    handler({"event": "invalidate"})
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        data = json.loads(message["data"])
+                        if data.get("sender") != self.sender_id:
+                            handler(data)
+            except RedisError:
+                logger.exception("Потеряно соединение с каналом инвалидации курсов, переподключение")
+                await asyncio.sleep(retry_delay)
+
+    def _message(
+        self, event: str, payload: dict[str, Any] | list[dict[str, Any]] | None, version: int | None = None
+    ) -> str:
+        message: dict[str, Any] = {"sender": self.sender_id, "event": event, "data": payload}
+        if version is not None:
+            message["version"] = version
+        return json.dumps(message)
+
+
+def _pop_complete(raw: dict[Any, Any]) -> bool:
+    # Поля приходят bytes или str в зависимости от decode_responses соединения
+    return raw.pop(COMPLETE_FIELD.encode(), None) is not None or raw.pop(COMPLETE_FIELD, None) is not None
+
+
+def _codepair(exchangerate: ExchangeRateResponse) -> str:
+    return exchangerate.base_currency.code + exchangerate.target_currency.code
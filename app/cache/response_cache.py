@@ -0,0 +1,47 @@
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any
+
+from pydantic import TypeAdapter
+
+from app import metrics
+
+
+class ResponseCache:
+    """Готовые JSON-ответы горячих списков, привязанные к версии данных.
+
+    Тело ответа хранится до первой записи: после неё версия меняется,
+    и ответ пересобирается при следующем запросе.
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[str, tuple[int, bytes]] = {}
+
+    def get(self, key: str, version: int) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def put(self, key: str, version: int, body: bytes) -> None:
+        entry = self._entries.get(key)
+        # Медленный запрос со старой версией не должен затереть более свежий ответ
+        if entry is None or entry[0] <= version:
+            self._entries[key] = (version, body)
+
+    async def get_or_build(self, key: str, version: int, build: Callable[[], Awaitable[bytes]]) -> bytes:
+        body = self.get(key, version)
+        if body is not None:
+            metrics.cache_requests.inc("responses", "hit")
+            return body
+        metrics.cache_requests.inc("responses", "miss")
+        body = await build()
+        self.put(key, version, body)
+        return body
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def dump_json_list(rows: Iterable[Any], adapter: TypeAdapter[list[Any]]) -> bytes:
+    """Сериализует ORM-объекты так же, как это сделал бы response_model."""
+    return adapter.dump_json(adapter.validate_python(rows, from_attributes=True), by_alias=True)
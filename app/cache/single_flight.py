@@ -0,0 +1,41 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from app import metrics
+
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые обращения к БД внутри воркера.
+
+    Первый вызов с ключом запускает загрузку отдельной задачей, остальные вызовы с тем же ключом,
+    пришедшие до её завершения, ждут ту же задачу. Отмена одного из ожидающих (например,
+    клиент оборвал соединение) не отменяет загрузку для остальных. Поэтому загрузка не должна
+    пользоваться ресурсами запроса, запустившего её (его сессиями БД), — они закрываются вместе с ним.
+    Результат не кешируется: после завершения задачи следующий вызов снова идёт в БД.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Task[Any]] = {}
+
+    async def do[T](self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            metrics.cache_requests.inc("single_flight", "miss")
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            metrics.cache_requests.inc("single_flight", "hit")
+        result: T = await asyncio.shield(task)
+        return result
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, task: asyncio.Task[Any]) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Если все ожидающие отменены, исключение никто не заберёт — помечаем его обработанным
+        if not task.cancelled():
+            task.exception()
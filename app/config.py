@@ -1,7 +1,7 @@
 import os
-from typing import Annotated
+from typing import Annotated, Literal, Self
 
-from pydantic import Field, computed_field
+from pydantic import Field, computed_field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -17,12 +17,106 @@ class Settings(BaseSettings):
     def database_url(self) -> str:
         return f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}@{self.host_db}:{self.port_db}/{self.postgres_db}"
 
+    # Реплика для чтения (необязательно). Пользователь, пароль и имя БД — как у основной
+    host_db_replica: str | None = None
+    port_db_replica: int | None = None
+    # Верхняя граница отставания реплики, секунды: столько времени после изменения данных чтение идёт в основную БД
+    db_replica_max_lag: float = 5
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def database_replica_url(self) -> str | None:
+        if self.host_db_replica is None:
+            return None
+        port = self.port_db_replica or self.port_db
+        return f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}@{self.host_db_replica}:{port}/{self.postgres_db}"
+
+    # dev — один процесс с перезагрузкой при изменении кода, production — несколько воркеров на uvloop/httptools
+    server_mode: Literal["dev", "production"] = "dev"
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    # Число воркеров в режиме production, по умолчанию — по числу ядер
+    server_workers: int | None = None
+    # Сколько секунд при остановке ждать завершения начатых запросов
+    server_graceful_timeout: float = 20
+    server_keepalive_timeout: int = 5
+    # Упавший воркер перезапускается с задержкой, удваивающейся с каждым падением в окне;
+    # если за server_restart_window секунд упало server_restart_max_failures воркеров, сервер останавливается
+    server_restart_backoff: float = 0.5
+    server_restart_max_failures: int = 5
+    server_restart_window: float = 60
+
     db_scale: Annotated[int, Field(le=6)]
     db_integer_digits: Annotated[int, Field(le=15)]
 
+    # Пул соединений с БД
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    # Через сколько секунд пересоздавать соединение, -1 — никогда
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: bool = False
+    # Кеш подготовленных выражений asyncpg и кеш скомпилированных запросов SQLAlchemy
+    db_statement_cache_size: int = 100
+    db_query_cache_size: int = 500
+    # Совместимость с PgBouncer (pool_mode=transaction): отключает кеши подготовленных выражений
+    db_pgbouncer_mode: bool = False
+
+    # Без Redis кеш курсов живёт только в памяти воркера, а лимитер должен быть memory
+    redis_enabled: bool = True
     redis_host: str = "localhost"
     redis_times: int = 15
     redis_seconds: int = 60
+    # redis — общий счётчик запросов в Redis, memory — счётчик в памяти каждого воркера
+    rate_limiter_backend: Literal["redis", "memory"] = "redis"
+    # Как часто (в секундах) счётчики memory-лимитера сводятся в Redis, 0 — не сводить
+    rate_limiter_sync_interval: float = 1
+    # Без Redis воркер не узнаёт о записях других воркеров: если воркеров может быть несколько, версия данных
+    # (ETag, Last-Modified и собранные по ней ответы) обновляется не реже раза в столько секунд
+    local_data_version_ttl: float = 5
+
+    # Сколько соединений пула открыть при старте воркера (не больше db_pool_size)
+    warm_up_connections: int = 2
+    # Сколько секунд старт воркера ждёт прогрева, прежде чем продолжить его в фоне
+    warm_up_timeout: float = 10
+
+    # Время жизни снимка курсов в памяти воркера, секунды
+    rate_cache_ttl: float = 60
+    # Сколько секунд код, которого не нашлось в БД, отсекается без запроса к ней (в одном процессе
+    # отсутствию валюты в снимке верим и так); добавление валюты на этом воркере или через Redis сбрасывает запись
+    currency_negative_cache_ttl: float = 5
+    # Валюты, через которые в первую очередь ищутся кросс-курсы (при равном числе переходов)
+    cross_rate_pivots: list[str] = ["USD"]
+
+    # Кеш результатов GET /exchange по (from, to, amount): время жизни записи, секунды, и максимум записей
+    # на воркер (запись занимает около 2 КБ), 0 — не кешировать
+    conversion_cache_ttl: float = 60
+    conversion_cache_max_entries: int = 10000
+
+    # Максимальное число конвертаций в одном запросе POST /exchange/batch
+    exchange_batch_max_items: int = 10000
+    # Максимальное число курсов в одном запросе POST /exchangeRates/bulk
+    exchangerate_bulk_max_items: int = 5000
+
+    # Максимальный размер страницы для ?limit= в списках валют и курсов
+    page_max_limit: int = 1000
+    # Сколько строк за раз читается с серверного курсора и отправляется клиенту при ?stream=true
+    stream_chunk_size: int = 500
+
+    # max-age в Cache-Control для списков и отдельных валют/курсов: короткий, чтобы nginx мог делать микрокеш
+    http_cache_max_age: int = 1
+
+    # Заголовок Server-Timing с числом SQL-запросов и временем в БД
+    server_timing_enabled: bool = True
+    # Порог в мс, после которого в лог пишется список SQL-запросов, выполненных за HTTP-запрос; None — не писать
+    slow_request_threshold_ms: float | None = None
+
+    @model_validator(mode="after")
+    def _check_rate_limiter_backend(self) -> Self:
+        if self.rate_limiter_backend == "redis" and not self.redis_enabled:
+            raise ValueError("Для RATE_LIMITER_BACKEND=redis нужен Redis (REDIS_ENABLED=true)")
+        return self
+
     model_config = SettingsConfigDict(env_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env"))
 
 
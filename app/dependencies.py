@@ -1,15 +1,33 @@
-from collections.abc import AsyncIterable
+import csv
+import json
+from collections.abc import AsyncIterable, AsyncIterator
+from dataclasses import dataclass
+from typing import Annotated, Any
 
 from dishka import Provider, Scope, provide
+from dishka.integrations.fastapi import FromDishka, inject
+from fastapi import Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
+from app.cache.conversion_cache import ConversionCache
+from app.cache.data_version import DataVersion
+from app.cache.rate_cache import RateCache
+from app.cache.response_cache import ResponseCache
+from app.cache.single_flight import SingleFlight
 from app.config import settings
+from app.engine import engine_options
+from app.exceptions import NotModifiedError
+from app.instrumentation import instrument_engine
 from app.repositories.currency_repository import CurrencyRepository
 from app.repositories.exchangerate_repository import ExchangeRateRepository
 from app.schemas import CurrencyCodepair, _validate_different_codes
+from app.server import is_single_worker
 from app.service.currency_service import CurrencyService
 from app.service.exchange_service import ExchangeService
 from app.service.exchangerate_service import ExchangeRateService
+from app.sessions import DatabaseSessions, ReplicaEngine, ReplicaSessionmaker, SessionsFactory
 
 
 def _divide_codepair(codepair: CurrencyCodepair) -> tuple[str, str]:
@@ -22,38 +40,247 @@ def _divide_codepair(codepair: CurrencyCodepair) -> tuple[str, str]:
     return base_code, target_code
 
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv"
+
+
+def _is_media_type(request: Request, header: str, media_type: str) -> bool:
+    return request.headers.get(header, "").startswith(media_type)
+
+
+async def _read_list_body[T](request: Request, adapter: TypeAdapter[list[T]], max_items: int) -> list[T]:
+    """Читает список объектов из тела запроса в JSON, NDJSON или CSV (с заголовком) и валидирует его.
+
+    NDJSON разбирается построчно по мере поступления тела, и лишние элементы отсекаются, не дочитывая его.
+    """
+    try:
+        if _is_media_type(request, "content-type", NDJSON_MEDIA_TYPE):
+            raw_items: Any = await _read_ndjson(request, max_items)
+        else:
+            body = await request.body()
+            if _is_media_type(request, "content-type", CSV_MEDIA_TYPE):
+                raw_items = list(csv.DictReader(body.decode().splitlines()))
+            else:
+                raw_items = json.loads(body)
+    except ValueError as e:
+        raise RequestValidationError([{"type": "json_invalid", "loc": ("body",), "msg": str(e)}]) from e
+
+    if isinstance(raw_items, list) and len(raw_items) > max_items:
+        raise _too_many_items(max_items)
+    try:
+        return adapter.validate_python(raw_items)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors()) from e
+
+
+async def _read_ndjson(request: Request, max_items: int) -> list[Any]:
+    items: list[Any] = []
+    tail = b""
+    async for chunk in request.stream():
+        *lines, tail = (tail + chunk).split(b"\n")
+        for line in lines:
+            if line.strip():
+                items.append(json.loads(line))
+        if len(items) > max_items:
+            raise _too_many_items(max_items)
+    if tail.strip():
+        items.append(json.loads(tail))
+    return items
+
+
+def _too_many_items(max_items: int) -> RequestValidationError:
+    return RequestValidationError(
+        [
+            {
+                "type": "value_error",
+                "loc": ("body",),
+                "ctx": {"error": f"Максимальное число элементов в запросе: {max_items}"},
+            }
+        ]
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class PageParams:
+    after_id: int | None
+    limit: int | None
+    stream: bool
+
+    @property
+    def paginated(self) -> bool:
+        return self.after_id is not None or self.limit is not None
+
+
+def _page_params(
+    after_id: Annotated[int | None, Query(ge=0)] = None,
+    limit: Annotated[int | None, Query(ge=1, le=settings.page_max_limit)] = None,
+    stream: bool = False,
+) -> PageParams:
+    return PageParams(after_id=after_id, limit=limit, stream=stream)
+
+
+async def _stream_json_array(rows: AsyncIterator[Any], model: type[BaseModel], chunk_size: int) -> AsyncIterator[bytes]:
+    """Сериализует строки в JSON-массив кусками по chunk_size элементов, не собирая весь ответ в памяти."""
+    yield b"["
+    separator = b""
+    chunk: list[bytes] = []
+    async for row in rows:
+        chunk.append(model.model_validate(row, from_attributes=True).model_dump_json(by_alias=True).encode())
+        if len(chunk) >= chunk_size:
+            yield separator + b",".join(chunk)
+            separator = b","
+            chunk.clear()
+    if chunk:
+        yield separator + b",".join(chunk)
+    yield b"]"
+
+
+@dataclass(frozen=True, slots=True)
+class CacheValidators:
+    version: int
+    headers: dict[str, str]
+
+
+@inject
+async def _conditional_get(
+    request: Request, response: Response, data_version: FromDishka[DataVersion]
+) -> CacheValidators:
+    """Отвечает 304, если у клиента актуальная версия данных, иначе проставляет заголовки кеширования.
+
+    Версию читаем до обращения к БД: если запись случится во время чтения, ответ получит
+    старый ETag и следующий запрос клиента уже не совпадёт с новой версией.
+    If-Modified-Since не проверяем: Last-Modified точен до секунды и пропустил бы запись в ту же секунду.
+    """
+    version = data_version.value
+    headers = {
+        "ETag": data_version.etag,
+        "Last-Modified": data_version.last_modified,
+        "Cache-Control": f"public, max-age={settings.http_cache_max_age}",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and data_version.matches(if_none_match):
+        raise NotModifiedError(headers)
+    response.headers.update(headers)
+    return CacheValidators(version, headers)
+
+
 class MyProvider(Provider):
     @provide(scope=Scope.APP)
     def get_engine(self) -> AsyncEngine:
-        return create_async_engine(settings.database_url)
+        engine = create_async_engine(settings.database_url, **engine_options(settings))
+        instrument_engine(engine)
+        return engine
+
+    @provide(scope=Scope.APP)
+    def get_replica_engine(self, engine: AsyncEngine) -> ReplicaEngine:
+        if settings.database_replica_url is None:
+            return ReplicaEngine(engine)
+        replica_engine = create_async_engine(settings.database_replica_url, **engine_options(settings))
+        instrument_engine(replica_engine)
+        return ReplicaEngine(replica_engine)
 
     @provide(scope=Scope.APP)
     async def get_async_sessionmaker(self, engine: AsyncEngine) -> async_sessionmaker[AsyncSession]:
         return async_sessionmaker(engine, expire_on_commit=False)
 
+    @provide(scope=Scope.APP)
+    async def get_replica_sessionmaker(
+        self, engine: AsyncEngine, replica_engine: ReplicaEngine, sessionmaker: async_sessionmaker[AsyncSession]
+    ) -> ReplicaSessionmaker:
+        if replica_engine is engine:
+            return ReplicaSessionmaker(sessionmaker)
+        return ReplicaSessionmaker(async_sessionmaker(replica_engine, expire_on_commit=False))
+
+    @provide(scope=Scope.APP)
+    def get_sessions_factory(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        replica_sessionmaker: ReplicaSessionmaker,
+        data_version: DataVersion,
+    ) -> SessionsFactory:
+        replica = None if replica_sessionmaker is sessionmaker else replica_sessionmaker
+        return SessionsFactory(sessionmaker, replica, data_version, settings.db_replica_max_lag)
+
     @provide(scope=Scope.REQUEST)
-    async def get_session(self, sessionmaker: async_sessionmaker[AsyncSession]) -> AsyncIterable[AsyncSession]:
-        async with sessionmaker() as new_session:
-            yield new_session
+    async def get_sessions(self, sessions_factory: SessionsFactory) -> AsyncIterable[DatabaseSessions]:
+        sessions = sessions_factory()
+        try:
+            yield sessions
+        finally:
+            await sessions.close()
+
+    @provide(scope=Scope.APP)
+    def get_data_version(self) -> DataVersion:
+        if settings.redis_enabled or is_single_worker():
+            return DataVersion()
+        return DataVersion(refresh_every=settings.local_data_version_ttl)
+
+    @provide(scope=Scope.APP)
+    def get_response_cache(self) -> ResponseCache:
+        return ResponseCache()
+
+    @provide(scope=Scope.APP)
+    def get_single_flight(self) -> SingleFlight:
+        return SingleFlight()
+
+    @provide(scope=Scope.APP)
+    def get_rate_cache(self, data_version: DataVersion) -> RateCache:
+        return RateCache(
+            ttl=settings.rate_cache_ttl,
+            pivots=settings.cross_rate_pivots,
+            data_version=data_version,
+            # В одном процессе все записи проходят через этот кеш, и отсутствию валюты в снимке можно верить
+            single_process=is_single_worker(),
+            negative_ttl=settings.currency_negative_cache_ttl,
+        )
+
+    @provide(scope=Scope.APP)
+    def get_conversion_cache(self, rate_cache: RateCache) -> ConversionCache:
+        conversion_cache = ConversionCache(
+            ttl=settings.conversion_cache_ttl, max_entries=settings.conversion_cache_max_entries
+        )
+        rate_cache.on_rates_changed(conversion_cache.invalidate)
+        return conversion_cache
 
     @provide(scope=Scope.REQUEST)
-    def get_currency_repository(self, session: AsyncSession) -> CurrencyRepository:
-        return CurrencyRepository(session)
+    def get_currency_repository(self, sessions: DatabaseSessions, data_version: DataVersion) -> CurrencyRepository:
+        return CurrencyRepository(sessions, data_version)
 
     @provide(scope=Scope.REQUEST)
-    def get_currency_service(self, rep: CurrencyRepository) -> CurrencyService:
-        return CurrencyService(rep)
+    def get_currency_service(
+        self,
+        rep: CurrencyRepository,
+        rate_cache: RateCache,
+        single_flight: SingleFlight,
+        sessions_factory: SessionsFactory,
+    ) -> CurrencyService:
+        return CurrencyService(rep, rate_cache, single_flight, sessions_factory)
 
     @provide(scope=Scope.REQUEST)
-    def get_exchangerate_repository(self, session: AsyncSession) -> ExchangeRateRepository:
-        return ExchangeRateRepository(session)
+    def get_exchangerate_repository(
+        self, sessions: DatabaseSessions, data_version: DataVersion
+    ) -> ExchangeRateRepository:
+        return ExchangeRateRepository(sessions, data_version)
 
     @provide(scope=Scope.REQUEST)
     def get_exchangerate_service(
-        self, exchangerate_rep: ExchangeRateRepository, currency_rep: CurrencyRepository
+        self,
+        exchangerate_rep: ExchangeRateRepository,
+        currency_rep: CurrencyRepository,
+        rate_cache: RateCache,
+        single_flight: SingleFlight,
+        sessions_factory: SessionsFactory,
     ) -> ExchangeRateService:
-        return ExchangeRateService(exchangerate_rep=exchangerate_rep, currency_rep=currency_rep)
+        return ExchangeRateService(
+            exchangerate_rep=exchangerate_rep,
+            currency_rep=currency_rep,
+            rate_cache=rate_cache,
+            single_flight=single_flight,
+            sessions_factory=sessions_factory,
+        )
 
     @provide(scope=Scope.REQUEST)
-    def get_exchange_service(self, exchangerate_service: ExchangeRateService) -> ExchangeService:
-        return ExchangeService(exchangerate_service)
+    def get_exchange_service(
+        self, exchangerate_service: ExchangeRateService, conversion_cache: ConversionCache
+    ) -> ExchangeService:
+        return ExchangeService(exchangerate_service, conversion_cache)
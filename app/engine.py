@@ -0,0 +1,75 @@
+import time
+import uuid
+from typing import Any
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
+
+from app.config import Settings
+from app.schemas import PoolStatusResponse
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который считает время ожидания свободного соединения."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.wait_count += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+def engine_options(settings: Settings) -> dict[str, Any]:
+    options: dict[str, Any] = {
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "query_cache_size": settings.db_query_cache_size,
+    }
+    if settings.db_pgbouncer_mode:
+        # PgBouncer в режиме transaction не переносит подготовленные выражения между соединениями
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    else:
+        options["connect_args"] = {
+            "statement_cache_size": settings.db_statement_cache_size,
+            "prepared_statement_cache_size": settings.db_statement_cache_size,
+        }
+    return options
+
+
+def pool_status(engine: AsyncEngine) -> PoolStatusResponse:
+    pool = engine.pool
+    status = PoolStatusResponse(pool_class=type(pool).__name__)
+    if isinstance(pool, QueuePool):
+        status.size = pool.size()
+        status.checked_in = pool.checkedin()
+        status.checked_out = pool.checkedout()
+        status.overflow = pool.overflow()
+    if isinstance(pool, TimedQueuePool):
+        status.wait_count = pool.wait_count
+        status.wait_seconds_total = pool.wait_seconds_total
+        status.wait_seconds_max = pool.wait_seconds_max
+        status.timeouts = pool.timeouts
+    return status
@@ -1,8 +1,8 @@
 from fastapi import Request, status
 from fastapi.exceptions import HTTPException, RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
-from app.exceptions import BaseOwnException
+from app.exceptions import BaseOwnException, NotModifiedError
 
 
 async def validation_exception_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
@@ -44,9 +44,13 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 
 async def http_exception_handler(request: Request, exc: HTTPException) -> JSONResponse:
     content = {"message": exc.detail}
-    return JSONResponse(content, status_code=exc.status_code)
+    return JSONResponse(content, status_code=exc.status_code, headers=exc.headers)
 
 
 async def ownexception_handler(request: Request, exc: BaseOwnException) -> JSONResponse:
     content = {"message": exc.message}
     return JSONResponse(content, status_code=exc.code)
+
+
+async def not_modified_handler(request: Request, exc: NotModifiedError) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=exc.headers)
@@ -1,6 +1,13 @@
 from fastapi import status
 
 
+class NotModifiedError(Exception):
+    """У клиента актуальная версия данных — отвечаем 304 без тела."""
+
+    def __init__(self, headers: dict[str, str]):
+        self.headers = headers
+
+
 class BaseOwnException(Exception):
     def __init__(self, message: str, code: int):
         self.message = message
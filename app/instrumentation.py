@@ -0,0 +1,137 @@
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Сколько символов SQL выводить в лог медленного запроса
+STATEMENT_LOG_LIMIT = 500
+
+
+@dataclass(slots=True)
+class RequestQueries:
+    count: int = 0
+    seconds: float = 0
+    # Заполняется, только если включён лог медленных запросов
+    statements: list[tuple[str, float]] | None = None
+    started: dict[int, float] = field(default_factory=dict)
+
+
+_current_queries: ContextVar[RequestQueries | None] = ContextVar("current_queries", default=None)
+
+
+def current_queries() -> RequestQueries | None:
+    return _current_queries.get()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Подключает к движку подсчёт запросов и времени в БД для текущего HTTP-запроса."""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _before_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    queries = _current_queries.get()
+    if queries is not None:
+        queries.started[id(context)] = time.perf_counter()
+
+
+def _after_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    queries = _current_queries.get()
+    if queries is None:
+        return
+    started = queries.started.pop(id(context), None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    queries.count += 1
+    queries.seconds += elapsed
+    if queries.statements is not None:
+        queries.statements.append((statement, elapsed))
+
+
+class QueryTimingMiddleware:
+    """Считает SQL-запросы и время в БД для каждого HTTP-запроса.
+
+    Итог уходит в заголовок Server-Timing, в поля лога и в метрики, а при превышении
+    slow_request_threshold_ms в лог выводятся все выполненные запросы.
+    У потоковых ответов в заголовок попадает только то, что выполнено до отправки первого байта.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        threshold = settings.slow_request_threshold_ms
+        queries = RequestQueries(statements=[] if threshold is not None else None)
+        token = _current_queries.set(queries)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.server_timing_enabled:
+                    total_ms = (time.perf_counter() - started) * 1000
+                    header = (
+                        f'db;dur={queries.seconds * 1000:.3f};desc="{queries.count} queries", total;dur={total_ms:.3f}'
+                    )
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_queries.reset(token)
+            elapsed = time.perf_counter() - started
+            total_ms = elapsed * 1000
+            # Метки — шаблон роута, а не путь, иначе каждая валютная пара стала бы отдельным рядом
+            route = getattr(scope.get("route"), "path", "unmatched")
+            metrics.http_requests.inc(scope["method"], route, str(status_code))
+            metrics.http_request_duration.observe(elapsed, scope["method"], route)
+            fields = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status_code": status_code,
+                "db_queries": queries.count,
+                "db_ms": round(queries.seconds * 1000, 3),
+                "total_ms": round(total_ms, 3),
+            }
+            if threshold is not None and total_ms >= threshold:
+                logger.warning(
+                    "Медленный запрос %s %s: %.1f мс, %d SQL-запросов (%.1f мс в БД)\n%s",
+                    scope["method"],
+                    scope["path"],
+                    total_ms,
+                    queries.count,
+                    queries.seconds * 1000,
+                    _format_statements(queries.statements or []),
+                    extra=fields,
+                )
+            else:
+                logger.debug("Запрос %s %s обработан", scope["method"], scope["path"], extra=fields)
+
+
+def _format_statements(statements: list[tuple[str, float]]) -> str:
+    return "\n".join(
+        f"  {number}. [{elapsed * 1000:.1f} мс] {' '.join(statement.split())[:STATEMENT_LOG_LIMIT]}"
+        for number, (statement, elapsed) in enumerate(statements, start=1)
+    )
@@ -1,17 +1,117 @@
+import asyncio
+import contextlib
+import logging
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 
 import redis.asyncio as redis
 from fastapi import FastAPI
 from fastapi_limiter import FastAPILimiter
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncEngine
 
+from app.cache.rate_cache import RateCache
+from app.cache.redis_store import RedisRateStore
 from app.config import settings
+from app.limiter import sync_local_limiters
+from app.service.exchangerate_service import ExchangeRateService
+from app.sessions import ReplicaEngine
+
+logger = logging.getLogger(__name__)
+
+# Пауза между попытками прогрева, если БД ещё недоступна
+WARM_UP_RETRY_INTERVAL = 1
 
 
 @asynccontextmanager
-async def lifespan(_: FastAPI) -> AsyncGenerator:
-    redis_url = f"redis://{settings.redis_host}:6379"
-    redis_connection = redis.from_url(redis_url, encoding="utf8")
-    await FastAPILimiter.init(redis_connection)
+async def lifespan(app: FastAPI) -> AsyncGenerator:
+    app.state.readiness = "starting"
+    background_tasks: list[asyncio.Task] = []
+    redis_connection = None
+    rate_cache = await app.state.dishka_container.get(RateCache)
+
+    if settings.redis_enabled:
+        redis_connection = redis.from_url(f"redis://{settings.redis_host}:6379", encoding="utf8")
+        if settings.rate_limiter_backend == "redis":
+            await FastAPILimiter.init(redis_connection)
+        elif settings.rate_limiter_sync_interval > 0:
+            background_tasks.append(
+                asyncio.create_task(sync_local_limiters(redis_connection, settings.rate_limiter_sync_interval))
+            )
+
+        # Общий кеш курсов: снимок в Redis и рассылка изменений между воркерами
+        store = RedisRateStore(redis_connection, ttl=settings.rate_cache_ttl)
+        rate_cache.attach(store)
+        # Все воркеры отдают одинаковый ETag, пока данные не меняли
+        try:
+            rate_cache.data_version.reset(await store.sync_version(rate_cache.data_version.value))
+        except RedisError:
+            logger.exception("Не удалось получить общую версию данных из Redis")
+        background_tasks.append(asyncio.create_task(store.listen(rate_cache.handle_message)))
+    else:
+        logger.info("Redis отключён: кеш курсов и ограничение запросов работают в памяти воркера")
+
+    # Прогрев ждём не дольше warm_up_timeout, дальше он продолжается в фоне, а /health/ready отвечает 503
+    warm_up_task = asyncio.create_task(warm_up(app))
+    background_tasks.append(warm_up_task)
+    await asyncio.wait([warm_up_task], timeout=settings.warm_up_timeout)
+    if not warm_up_task.done():
+        logger.warning("Прогрев не завершился за %s с, воркер стартует непрогретым", settings.warm_up_timeout)
+
     yield
-    await FastAPILimiter.close()
+
+    app.state.readiness = "stopping"
+    for task in background_tasks:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    if redis_connection is not None:
+        rate_cache.attach(None)
+        await redis_connection.aclose()
+
+
+async def warm_up(app: FastAPI) -> None:
+    """Открывает соединения пула и загружает снимок курсов, после чего воркер считается готовым."""
+    container = app.state.dishka_container
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            engine = await container.get(AsyncEngine)
+            await _open_connections(engine, min(settings.warm_up_connections, settings.db_pool_size))
+            replica_engine = await container.get(ReplicaEngine)
+            if replica_engine is not engine:
+                await _open_connections(replica_engine, min(settings.warm_up_connections, settings.db_pool_size))
+
+            async with container() as request_container:
+                service = await request_container.get(ExchangeRateService)
+                await service.warm_up()
+        except Exception as e:
+            # Полный traceback только у первой неудачи, чтобы недоступная БД не засыпала лог
+            logger.warning(
+                "Прогрев не удался (попытка %d): %r, повтор через %s с",
+                attempt,
+                e,
+                WARM_UP_RETRY_INTERVAL,
+                exc_info=attempt == 1,
+            )
+            await asyncio.sleep(WARM_UP_RETRY_INTERVAL)
+            continue
+
+        app.state.readiness = "ok"
+        logger.info("Воркер прогрет и готов принимать запросы")
+        return
+
+
+async def _open_connections(engine: AsyncEngine, count: int) -> None:
+    # Соединения открываются одновременно и сразу возвращаются в пул. Если часть не открылась, остальные
+    # всё равно дожидаемся и закрываем: иначе они остались бы выданными из пула, а прогрев повторяется каждую секунду
+    results = await asyncio.gather(*(engine.connect().start() for _ in range(count)), return_exceptions=True)
+    errors = []
+    for result in results:
+        if isinstance(result, BaseException):
+            errors.append(result)
+        else:
+            await result.close()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from math import ceil
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi_limiter import default_identifier, http_default_callback
+from fastapi_limiter.depends import RateLimiter
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+SYNC_KEY_PREFIX = "rate_limit"
+
+
+@dataclass(slots=True)
+class _Window:
+    index: int
+    count: int = 0
+    previous: int = 0
+    # Свои запросы, ещё не отправленные в Redis
+    pending: int = 0
+
+
+class LocalRateLimiter:
+    """Ограничение частоты запросов в памяти воркера по скользящему окну.
+
+    Запросы считаются в окнах фиксированной длины, а число запросов за последние period
+    оценивается как текущее окно плюс пропорциональная доля предыдущего.
+    """
+
+    def __init__(self, times: int, milliseconds: int, clock: Callable[[], float] = time.monotonic):
+        self.times = times
+        self.period = milliseconds / 1000
+        self._clock = clock
+        self._windows: dict[str, _Window] = {}
+        self._current_index = 0
+
+    def hit(self, key: str) -> int:
+        """Учитывает запрос и возвращает 0, если он разрешён, иначе сколько миллисекунд ждать."""
+        now = self._clock()
+        index = int(now // self.period)
+        if index != self._current_index:
+            self._current_index = index
+            self._evict(index)
+
+        window = self._window(key, index)
+        elapsed = (now % self.period) / self.period
+        estimated = window.previous * (1 - elapsed) + window.count
+        if estimated + 1 > self.times:
+            return max(ceil((self.period - now % self.period) * 1000), 1)
+        window.count += 1
+        window.pending += 1
+        return 0
+
+    async def sync(self, connection: Redis, name: str) -> None:
+        """Отправляет свои запросы в Redis и узнаёт, сколько запросов сделали все воркеры вместе."""
+        batch = [(key, window.index, window.pending) for key, window in self._windows.items() if window.pending]
+        if not batch:
+            return
+        for key, _, _ in batch:
+            self._windows[key].pending = 0
+
+        expire = ceil(self.period * 2000)
+        try:
+            async with connection.pipeline(transaction=False) as pipe:
+                for key, index, pending in batch:
+                    redis_key = f"{SYNC_KEY_PREFIX}:{name}:{key}:{index}"
+                    pipe.incrby(redis_key, pending)
+                    pipe.pexpire(redis_key, expire)
+                results = await pipe.execute()
+        except RedisError:
+            # Не отправленные запросы попробуем досчитать при следующей синхронизации
+            for key, index, pending in batch:
+                window = self._windows.get(key)
+                if window is not None and window.index == index:
+                    window.pending += pending
+            raise
+
+        for (key, index, _), total in zip(batch, results[::2], strict=True):
+            window = self._windows.get(key)
+            if window is not None and window.index == index:
+                window.count = max(window.count, int(total) + window.pending)
+
+    def _window(self, key: str, index: int) -> _Window:
+        window = self._windows.get(key)
+        if window is None or window.index < index - 1:
+            window = self._windows[key] = _Window(index)
+        elif window.index == index - 1:
+            window = self._windows[key] = _Window(index, previous=window.count)
+        return window
+
+    def _evict(self, index: int) -> None:
+        # Окна старше предыдущего уже не влияют на оценку
+        stale = [key for key, window in self._windows.items() if window.index < index - 1]
+        for key in stale:
+            del self._windows[key]
+
+
+_local_limiters: list[LocalRateLimiter] = []
+
+
+class RateLimit:
+    """Зависимость, ограничивающая частоту запросов к роуту.
+
+    Бэкенд выбирается настройкой rate_limiter_backend: redis — общий счётчик fastapi_limiter,
+    memory — счётчик в памяти воркера без обращения к Redis на каждый запрос.
+    """
+
+    def __init__(self, times: int, seconds: int):
+        self._redis_limiter = RateLimiter(times=times, seconds=seconds)
+        self._local_limiter = LocalRateLimiter(times, seconds * 1000)
+        _local_limiters.append(self._local_limiter)
+
+    async def __call__(self, request: Request, response: Response) -> None:
+        if settings.rate_limiter_backend == "redis":
+            try:
+                await self._redis_limiter(request, response)
+            except HTTPException as e:
+                if e.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+                    metrics.rate_limit_rejections.inc(request.scope["route"].path)
+                raise
+            return
+
+        key = await default_identifier(request)
+        pexpire = self._local_limiter.hit(key)
+        if pexpire:
+            metrics.rate_limit_rejections.inc(request.scope["route"].path)
+            await http_default_callback(request, response, pexpire)
+
+
+async def sync_local_limiters(connection: Redis, interval: float) -> None:
+    """Фоном сводит счётчики воркеров в Redis, чтобы общий лимит соблюдался приблизительно."""
+    while True:
+        await asyncio.sleep(interval)
+        # Лимитеры создаются при импорте роутеров в одном порядке во всех воркерах, номер — их общее имя
+        for position, limiter in enumerate(_local_limiters):
+            try:
+                await limiter.sync(connection, str(position))
+            except RedisError:
+                logger.exception("Не удалось синхронизировать счётчики ограничения запросов с Redis")
@@ -0,0 +1,146 @@
+from bisect import bisect_left
+from collections.abc import Iterable, Sequence
+
+from app.schemas import PoolStatusResponse
+
+# Границы корзин гистограммы длительности запросов, секунды
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+Labels = tuple[str, ...]
+
+
+class Counter:
+    """Счётчик в памяти воркера, экспортируемый в текстовом формате Prometheus."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterable[tuple[str, Labels, Labels, float]]:
+        for labels, value in self._values.items():
+            yield "_total", self.labelnames, labels, value
+
+    def clear(self) -> None:
+        self._values.clear()
+
+
+class Histogram:
+    """Гистограмма в памяти воркера: на каждое наблюдение — бинарный поиск корзины и два сложения."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DURATION_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Для каждого набора меток: число попаданий в каждую корзину (последняя — +Inf) и сумма значений
+        self._values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return 0 if entry is None else sum(entry[0])
+
+    def samples(self) -> Iterable[tuple[str, Labels, Labels, float]]:
+        bucket_labelnames = (*self.labelnames, "le")
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            bounds = [*map(_format_value, self.buckets), "+Inf"]
+            for bound, count in zip(bounds, counts, strict=True):
+                cumulative += count
+                yield "_bucket", bucket_labelnames, (*labels, bound), cumulative
+            yield "_sum", self.labelnames, labels, total[0]
+            yield "_count", self.labelnames, labels, cumulative
+
+    def clear(self) -> None:
+        self._values.clear()
+
+
+http_requests = Counter("http_requests", "Обработанные HTTP-запросы", ("method", "route", "status"))
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Длительность обработки HTTP-запросов", ("method", "route")
+)
+conversions = Counter(
+    "exchange_conversions",
+    "Найденные курсы конвертации: как получен курс (direct, reverse, cross, same) и откуда (cache, database, history)",
+    ("path", "source"),
+)
+cache_requests = Counter("cache_requests", "Обращения к кешам в памяти воркера", ("cache", "result"))
+rate_limit_rejections = Counter("rate_limit_rejections", "Запросы, отклонённые ограничением частоты", ("route",))
+
+REGISTRY: tuple[Counter | Histogram, ...] = (
+    http_requests,
+    http_request_duration,
+    conversions,
+    cache_requests,
+    rate_limit_rejections,
+)
+
+
+def render(pools: Sequence[tuple[str, PoolStatusResponse]] = ()) -> str:
+    """Все метрики воркера в текстовом формате Prometheus (version=0.0.4)."""
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for suffix, labelnames, labels, value in metric.samples():
+            lines.append(f"{metric.name}{suffix}{_format_labels(labelnames, labels)} {_format_value(value)}")
+
+    # Состояние пулов соединений снимается в момент запроса метрик, на горячий путь это не влияет
+    pool_gauges = (
+        ("db_pool_size", "Размер пула соединений", "size"),
+        ("db_pool_checked_out", "Выданные из пула соединения", "checked_out"),
+        ("db_pool_overflow", "Соединения сверх pool_size", "overflow"),
+        ("db_pool_wait_seconds_max", "Максимальное ожидание свободного соединения", "wait_seconds_max"),
+    )
+    pool_counters = (
+        ("db_pool_wait_seconds_total", "Суммарное ожидание свободного соединения", "wait_seconds_total"),
+        ("db_pool_timeouts_total", "Таймауты ожидания свободного соединения", "timeouts"),
+    )
+    for kind, metrics in (("gauge", pool_gauges), ("counter", pool_counters)):
+        for name, documentation, field in metrics:
+            values = [(role, getattr(status, field)) for role, status in pools if getattr(status, field) is not None]
+            if not values:
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{_format_labels(('pool',), (role,))} {_format_value(value)}" for role, value in values)
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(labelnames: Labels, labels: Labels) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels, strict=True))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float | str) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
@@ -0,0 +1,49 @@
+from datetime import UTC, datetime
+from decimal import Decimal
+
+from sqlalchemy import VARCHAR, DateTime, ForeignKey, Index, Integer
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.types import DECIMAL
+
+from app.database import Base
+
+CANDLE_INTERVALS = ("minute", "hour", "day")
+
+
+def bucket_start(moment: datetime, interval: str) -> datetime:
+    """Начало интервала, в который попадает момент (интервалы отсчитываются в UTC)."""
+    moment = moment.astimezone(UTC) if moment.tzinfo is not None else moment.replace(tzinfo=UTC)
+    moment = moment.replace(second=0, microsecond=0)
+    if interval in ("hour", "day"):
+        moment = moment.replace(minute=0)
+    if interval == "day":
+        moment = moment.replace(hour=0)
+    return moment
+
+
+class ExchangeRateCandle(Base):
+    # Свёртка истории курсов по интервалам (minute/hour/day), обновляется при каждой записи курса
+    __tablename__ = "exchange_rate_candles"
+
+    base_currency_id: Mapped[int] = mapped_column(Integer, ForeignKey("currencies.id"))
+    target_currency_id: Mapped[int] = mapped_column(Integer, ForeignKey("currencies.id"))
+    interval: Mapped[str] = mapped_column(VARCHAR(6))
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    open: Mapped[Decimal] = mapped_column(DECIMAL(21, 6))
+    high: Mapped[Decimal] = mapped_column(DECIMAL(21, 6))
+    low: Mapped[Decimal] = mapped_column(DECIMAL(21, 6))
+    close: Mapped[Decimal] = mapped_column(DECIMAL(21, 6))
+    # Сумма и число значений курса в интервале — из них считается среднее
+    rate_sum: Mapped[Decimal] = mapped_column(DECIMAL(30, 6))
+    samples: Mapped[int] = mapped_column(Integer)
+
+    __table_args__ = (
+        Index(
+            "ix_exchange_rate_candles_pair_interval_bucket",
+            "base_currency_id",
+            "target_currency_id",
+            "interval",
+            "bucket_start",
+            unique=True,
+        ),
+    )
@@ -0,0 +1,25 @@
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, func
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.types import DECIMAL
+
+from app.database import Base
+
+
+class ExchangeRateHistory(Base):
+    # Только добавление: каждая запись курса оставляет строку с моментом, с которого значение действует
+    __tablename__ = "exchange_rate_history"
+
+    base_currency_id: Mapped[int] = mapped_column(Integer, ForeignKey("currencies.id"))
+    target_currency_id: Mapped[int] = mapped_column(Integer, ForeignKey("currencies.id"))
+    rate: Mapped[Decimal] = mapped_column(DECIMAL(21, 6))
+    valid_from: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # "Последний курс пары до момента t" — обратный проход по этому индексу с LIMIT 1
+        Index("ix_exchange_rate_history_pair_valid_from", "base_currency_id", "target_currency_id", "valid_from"),
+        # Диапазоны по времени на растущей таблице: BRIN почти ничего не весит
+        Index("ix_exchange_rate_history_valid_from_brin", "valid_from", postgresql_using="brin"),
+    )
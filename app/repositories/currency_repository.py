@@ -1,38 +1,70 @@
 import logging
+from collections.abc import AsyncIterator, Iterable
+from typing import Self
 
-from sqlalchemy import select
+from sqlalchemy import insert
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.cache.data_version import DataVersion
 from app.exceptions import CurrencyAlreadyExistsError, CurrencyNotFoundError
 from app.models.currency import Currency
+from app.repositories.rows import CurrencyRow, currency_row, select_currencies
 from app.schemas import CurrencySchema
+from app.sessions import DatabaseSessions
 
 logger = logging.getLogger(__name__)
 
 
 class CurrencyRepository:
-    def __init__(self, session: AsyncSession):
-        self._session = session
+    def __init__(self, sessions: DatabaseSessions, data_version: DataVersion):
+        self._sessions = sessions
+        self._data_version = data_version
 
-    async def get_all(self) -> list[Currency]:
-        currencies = await self._session.execute(select(Currency))
-        result = currencies.scalars().all()
-        return list(result)
+    def with_sessions(self, sessions: DatabaseSessions) -> Self:
+        """Тот же репозиторий поверх других сессий."""
+        return type(self)(sessions, self._data_version)
 
-    async def get_currency_by(self, code: str) -> Currency:
-        currency = await self._session.execute(select(Currency).filter(Currency.code == code))
-        result = currency.scalars().first()
+    # Чтение идёт запросами Core по нужным колонкам: строки сразу превращаются в CurrencyRow без ORM-объектов
+    async def get_all(self) -> list[CurrencyRow]:
+        currencies = await self._sessions.execute_read(select_currencies())
+        return [currency_row(row) for row in currencies]
+
+    async def get_page(self, after_id: int | None, limit: int) -> list[CurrencyRow]:
+        query = select_currencies().order_by(Currency.id).limit(limit)
+        if after_id is not None:
+            query = query.filter(Currency.id > after_id)
+        currencies = await self._sessions.execute_read(query)
+        return [currency_row(row) for row in currencies]
+
+    async def stream_all(self, chunk_size: int) -> AsyncIterator[CurrencyRow]:
+        currencies = await self._sessions.read.stream(
+            select_currencies().order_by(Currency.id).execution_options(yield_per=chunk_size)
+        )
+        async for row in currencies:
+            yield currency_row(row)
+
+    async def get_currency_by(self, code: str) -> CurrencyRow:
+        currency = await self._sessions.execute_read(select_currencies().filter(Currency.code == code))
+        result = currency.first()
         if result is None:
             raise CurrencyNotFoundError
-        return result
+        return currency_row(result)
+
+    async def get_currencies_by_codes(self, codes: Iterable[str]) -> list[CurrencyRow]:
+        currencies = await self._sessions.execute_read(select_currencies().filter(Currency.code.in_(list(codes))))
+        return [currency_row(row) for row in currencies]
 
-    async def add_currency(self, currency: CurrencySchema) -> None:
-        db_object = Currency(name=currency.name, code=currency.code, sign=currency.sign)
-        self._session.add(db_object)
+    async def add_currency(self, currency: CurrencySchema) -> Currency:
+        session = self._sessions.write
         try:
-            await self._session.commit()
+            result = await session.execute(
+                insert(Currency).values(name=currency.name, code=currency.code, sign=currency.sign).returning(Currency)
+            )
+            created_currency = result.scalar_one()
+            await session.commit()
+            self._data_version.bump()
         except IntegrityError as e:
             logger.error("Не удалось добавить валюту из-за проблем с БД")
-            await self._session.rollback()
+            await session.rollback()
             raise CurrencyAlreadyExistsError from e
+        return created_currency
@@ -1,67 +1,325 @@
 import logging
+from collections.abc import AsyncIterator, Iterable, Sequence
+from datetime import datetime
 from decimal import Decimal
+from typing import Any, Self
 
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import Boolean, Row, case, insert, literal_column, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import aliased, contains_eager, joinedload
+from sqlalchemy.sql.selectable import ScalarSelect
 
+from app.cache.data_version import DataVersion
+from app.database import Base
 from app.exceptions import ExchangeRateAlreadyExistsError, ExchangeRateNotFoundError
 from app.models.currency import Currency
 from app.models.exchangerate import ExchangeRate
+from app.models.exchangerate_candle import CANDLE_INTERVALS, ExchangeRateCandle, bucket_start
+from app.models.exchangerate_history import ExchangeRateHistory
+from app.repositories.rows import (
+    CurrencyRow,
+    ExchangeRateRow,
+    currency_columns,
+    exchangerate_row,
+    exchangerate_rows,
+    select_exchangerates,
+)
 from app.schemas import ExchangeRateSchema
+from app.sessions import DatabaseSessions
 
 logger = logging.getLogger(__name__)
 
+# Каждая пара в IN — два параметра запроса, а asyncpg принимает их не больше 32767
+CODEPAIRS_PER_QUERY = 10000
+
 
 class ExchangeRateRepository:
-    def __init__(self, session: AsyncSession):
-        self._session = session
+    def __init__(self, sessions: DatabaseSessions, data_version: DataVersion):
+        self._sessions = sessions
+        self._data_version = data_version
 
-    async def get_all(self) -> list[ExchangeRate]:
-        exchangerates = await self._session.execute(
-            select(ExchangeRate).options(
-                joinedload(ExchangeRate.base_currency), joinedload(ExchangeRate.target_currency)
-            )
+    def with_sessions(self, sessions: DatabaseSessions) -> Self:
+        """Тот же репозиторий поверх других сессий."""
+        return type(self)(sessions, self._data_version)
+
+    # Чтение идёт запросами Core с JOIN валют: строки сразу превращаются в ExchangeRateRow без ORM-объектов
+    async def get_all(self) -> list[ExchangeRateRow]:
+        query, _, _ = select_exchangerates()
+        exchangerates = await self._sessions.execute_read(query)
+        return exchangerate_rows(exchangerates)
+
+    async def get_page(self, after_id: int | None, limit: int) -> list[ExchangeRateRow]:
+        query, _, _ = select_exchangerates()
+        query = query.order_by(ExchangeRate.id).limit(limit)
+        if after_id is not None:
+            query = query.filter(ExchangeRate.id > after_id)
+        exchangerates = await self._sessions.execute_read(query)
+        return exchangerate_rows(exchangerates)
+
+    async def stream_all(self, chunk_size: int) -> AsyncIterator[ExchangeRateRow]:
+        # Серверный курсор: в памяти одновременно не больше chunk_size строк
+        query, _, _ = select_exchangerates()
+        exchangerates = await self._sessions.read.stream(
+            query.order_by(ExchangeRate.id).execution_options(yield_per=chunk_size)
         )
-        result = exchangerates.scalars().all()
-        return list(result)
+        currencies: dict[int, CurrencyRow] = {}
+        async for row in exchangerates:
+            yield exchangerate_row(row, currencies)
 
-    async def update_exchangerate(self, base_code: str, target_code: str, rate: Decimal) -> None:
-        try:
-            exchangerate = await self.get_exchangerate_by_codepair(base_code, target_code)
-            exchangerate.rate = rate
-            await self._session.commit()
-        except ExchangeRateNotFoundError as e:
+    async def update_exchangerate(self, base_code: str, target_code: str, rate: Decimal) -> tuple[int, Decimal]:
+        session = self._sessions.write
+        updated = await session.execute(
+            update(ExchangeRate)
+            .where(
+                ExchangeRate.base_currency_id == _currency_id_by_code(base_code),
+                ExchangeRate.target_currency_id == _currency_id_by_code(target_code),
+            )
+            .values(rate=rate)
+            .returning(
+                ExchangeRate.id, ExchangeRate.rate, ExchangeRate.base_currency_id, ExchangeRate.target_currency_id
+            )
+            # Объекты курсов в сессии не держим, синхронизировать нечего. Синхронизация же ORM-ом после
+            # конкурентных чтений путала колонки RETURNING, и в историю уходил курс вместо id валюты
+            .execution_options(synchronize_session=False)
+        )
+        result = updated.first()
+        if result is None:
             logger.info("Валютная пара отсутствует в базе данных")
-            await self._session.rollback()
-            raise ExchangeRateNotFoundError(message="Валютная пара отсутствует в базе данных") from e
+            await session.rollback()
+            raise ExchangeRateNotFoundError(message="Валютная пара отсутствует в базе данных")
+        await self._add_history(session, [(result.base_currency_id, result.target_currency_id, result.rate)])
+        await session.commit()
+        self._data_version.bump()
+        return result.id, result.rate
 
-    async def add_exchangerate(self, exchangerate: ExchangeRateSchema, base_id: int, target_id: int) -> None:
-        rate = exchangerate.rate
-        db_object = ExchangeRate(base_currency_id=base_id, target_currency_id=target_id, rate=rate)
-        self._session.add(db_object)
+    async def add_exchangerate(self, exchangerate: ExchangeRateSchema, base_id: int, target_id: int) -> int:
+        session = self._sessions.write
         try:
-            await self._session.commit()
+            created = await session.execute(
+                insert(ExchangeRate)
+                .values(base_currency_id=base_id, target_currency_id=target_id, rate=exchangerate.rate)
+                .returning(ExchangeRate.id)
+            )
+            exchangerate_id = created.scalar_one()
+            await self._add_history(session, [(base_id, target_id, exchangerate.rate)])
+            await session.commit()
+            self._data_version.bump()
         except IntegrityError as e:
             logger.exception("Не удалось добавить exchangerate. Обменный курс уже существует")
-            await self._session.rollback()
+            await session.rollback()
             raise ExchangeRateAlreadyExistsError from e
+        return exchangerate_id
+
+    async def upsert_exchangerates(self, rates: Sequence[tuple[int, int, Decimal]]) -> list[tuple[int, bool]]:
+        """Вставляет или обновляет курсы одной транзакцией.
+
+        Возвращает для каждой строки id курса и признак того, что курс был создан, а не обновлён.
+        """
+        if not rates:
+            return []
+        session = self._sessions.write
+        values = [
+            {"base_currency_id": base_id, "target_currency_id": target_id, "rate": rate}
+            for base_id, target_id, rate in rates
+        ]
+        try:
+            if session.bind.dialect.name == "sqlite":
+                written = await _upsert_sqlite(session, values)
+            else:
+                written = await _upsert_postgresql(session, values)
+            await self._add_history(session, rates)
+            await session.commit()
+            self._data_version.bump()
+        except DBAPIError:
+            logger.exception("Не удалось выполнить пакетную загрузку курсов")
+            await session.rollback()
+            raise
+        return written
+
+    async def get_rates_at(
+        self, codepairs: Iterable[tuple[str, str]] | None, at: datetime
+    ) -> list[tuple[CurrencyRow, CurrencyRow, Decimal | None]]:
+        """Курсы пар, действовавшие в момент at (None, если на тот момент курса ещё не было).
+
+        codepairs=None — курсы всех пар.
+        """
+        if codepairs is not None:
+            codepairs = list(codepairs)
+            if not codepairs:
+                return []
+        _, base, target = select_exchangerates()
+        # Для каждой пары — одна строка истории через индекс (пара, valid_from), а не просмотр всей истории
+        rate_at = (
+            select(ExchangeRateHistory.rate)
+            .filter(
+                ExchangeRateHistory.base_currency_id == ExchangeRate.base_currency_id,
+                ExchangeRateHistory.target_currency_id == ExchangeRate.target_currency_id,
+                ExchangeRateHistory.valid_from <= at,
+            )
+            .order_by(ExchangeRateHistory.valid_from.desc(), ExchangeRateHistory.id.desc())
+            .limit(1)
+            .correlate(ExchangeRate)
+            .scalar_subquery()
+        )
+        query = (
+            select(*currency_columns(base), *currency_columns(target), rate_at)
+            .join_from(ExchangeRate, base, ExchangeRate.base_currency_id == base.c.id)
+            .join(target, ExchangeRate.target_currency_id == target.c.id)
+        )
+        if codepairs is not None:
+            query = query.filter(tuple_(base.c.code, target.c.code).in_(codepairs))
+        rates = await self._sessions.execute_read(query)
+        return [(CurrencyRow(*row[0:4]), CurrencyRow(*row[4:8]), row[8]) for row in rates]
 
-    async def get_exchangerate_by_codepair(self, base_code: str, target_code: str) -> ExchangeRate:
-        base_alias = aliased(Currency)
-        target_alias = aliased(Currency)
-        exchangerate = await self._session.execute(
-            select(ExchangeRate)
-            .join(base_alias, ExchangeRate.base_currency_id == base_alias.id)
-            .join(target_alias, ExchangeRate.target_currency_id == target_alias.id)
-            .options(
-                contains_eager(ExchangeRate.base_currency, alias=base_alias),
-                contains_eager(ExchangeRate.target_currency, alias=target_alias),
+    async def get_candles(
+        self, base_code: str, target_code: str, interval: str, start: datetime | None, end: datetime | None, limit: int
+    ) -> list[ExchangeRateCandle]:
+        """Последние limit свёрток пары в [start, end), по возрастанию начала интервала."""
+        query = (
+            select(ExchangeRateCandle)
+            .filter(
+                ExchangeRateCandle.base_currency_id == _currency_id_by_code(base_code),
+                ExchangeRateCandle.target_currency_id == _currency_id_by_code(target_code),
+                ExchangeRateCandle.interval == interval,
             )
-            .filter(base_alias.code == base_code, target_alias.code == target_code)
+            .order_by(ExchangeRateCandle.bucket_start.desc())
+            .limit(limit)
         )
-        result = exchangerate.scalars().first()
+        if start is not None:
+            query = query.filter(ExchangeRateCandle.bucket_start >= start)
+        if end is not None:
+            query = query.filter(ExchangeRateCandle.bucket_start < end)
+        candles = await self._sessions.execute_read(query)
+        return list(reversed(candles.scalars().all()))
+
+    async def get_exchangerate_by_codepair(self, base_code: str, target_code: str) -> ExchangeRateRow:
+        query, base, target = select_exchangerates()
+        exchangerate = await self._sessions.execute_read(
+            query.filter(base.c.code == base_code, target.c.code == target_code)
+        )
+        result = exchangerate.first()
         if result is None:
             raise ExchangeRateNotFoundError
-        return result
+        return exchangerate_row(result)
+
+    async def get_exchangerates_by_codepairs(self, codepairs: Iterable[tuple[str, str]]) -> list[ExchangeRateRow]:
+        codepairs = list(codepairs)
+        if not codepairs:
+            return []
+        query, base, target = select_exchangerates()
+        exchangerates: list[Row[Any]] = []
+        # Обычно это один запрос, на очень больших пакетах — по одному на CODEPAIRS_PER_QUERY пар
+        for start in range(0, len(codepairs), CODEPAIRS_PER_QUERY):
+            chunk = codepairs[start : start + CODEPAIRS_PER_QUERY]
+            exchangerates.extend(
+                await self._sessions.execute_read(query.filter(tuple_(base.c.code, target.c.code).in_(chunk)))
+            )
+        return exchangerate_rows(exchangerates)
+
+    @staticmethod
+    async def _add_history(session: AsyncSession, rates: Sequence[tuple[int, int, Decimal]]) -> None:
+        """Дописывает курсы в историю и учитывает их в свёртках по интервалам."""
+        added = await session.execute(
+            insert(ExchangeRateHistory).returning(ExchangeRateHistory.valid_from, sort_by_parameter_order=True),
+            [
+                {"base_currency_id": base_id, "target_currency_id": target_id, "rate": rate}
+                for base_id, target_id, rate in rates
+            ],
+        )
+        valid_from = added.scalars().all()
+
+        insert_statement = _dialect_insert(session, ExchangeRateCandle)
+        # Открытие интервала — первый курс, закрытие — последний, максимум и минимум сравниваем через CASE
+        upsert_statement = insert_statement.on_conflict_do_update(
+            index_elements=[
+                ExchangeRateCandle.base_currency_id,
+                ExchangeRateCandle.target_currency_id,
+                ExchangeRateCandle.interval,
+                ExchangeRateCandle.bucket_start,
+            ],
+            set_={
+                "high": case(
+                    (insert_statement.excluded.high > ExchangeRateCandle.high, insert_statement.excluded.high),
+                    else_=ExchangeRateCandle.high,
+                ),
+                "low": case(
+                    (insert_statement.excluded.low < ExchangeRateCandle.low, insert_statement.excluded.low),
+                    else_=ExchangeRateCandle.low,
+                ),
+                "close": insert_statement.excluded.close,
+                "rate_sum": ExchangeRateCandle.rate_sum + insert_statement.excluded.rate_sum,
+                "samples": ExchangeRateCandle.samples + insert_statement.excluded.samples,
+            },
+        )
+        await session.execute(
+            upsert_statement,
+            [
+                {
+                    "base_currency_id": base_id,
+                    "target_currency_id": target_id,
+                    "interval": interval,
+                    "bucket_start": bucket_start(moment, interval),
+                    "open": rate,
+                    "high": rate,
+                    "low": rate,
+                    "close": rate,
+                    "rate_sum": rate,
+                    "samples": 1,
+                }
+                for (base_id, target_id, rate), moment in zip(rates, valid_from, strict=True)
+                for interval in CANDLE_INTERVALS
+            ],
+        )
+
+
+async def _upsert_postgresql(session: AsyncSession, values: list[dict[str, Any]]) -> list[tuple[int, bool]]:
+    # Строка, вставленная этой командой, ещё не заблокирована ни одной транзакцией: xmax = 0.
+    # У обновлённой через ON CONFLICT в xmax стоит текущая транзакция — признак берётся из того же запроса
+    insert_statement = postgresql.insert(ExchangeRate)
+    upserted = await session.execute(
+        insert_statement.on_conflict_do_update(
+            index_elements=[ExchangeRate.base_currency_id, ExchangeRate.target_currency_id],
+            set_={"rate": insert_statement.excluded.rate},
+        ).returning(ExchangeRate.id, literal_column("xmax = 0", Boolean), sort_by_parameter_order=True),
+        values,
+    )
+    return [(exchangerate_id, created) for exchangerate_id, created in upserted.all()]
+
+
+async def _upsert_sqlite(session: AsyncSession, values: list[dict[str, Any]]) -> list[tuple[int, bool]]:
+    # xmax в SQLite нет: сначала вставляем новые пары, затем обновляем конфликтующие.
+    # Первая же команда берёт блокировку записи, и до commit другие соединения не могут ничего изменить между ними
+    pairs = [(value["base_currency_id"], value["target_currency_id"]) for value in values]
+    inserted = await session.execute(
+        sqlite.insert(ExchangeRate)
+        .on_conflict_do_nothing()
+        .returning(ExchangeRate.base_currency_id, ExchangeRate.target_currency_id, ExchangeRate.id),
+        values,
+    )
+    created = {(base_id, target_id): exchangerate_id for base_id, target_id, exchangerate_id in inserted.all()}
+
+    updated: dict[tuple[int, int], int] = {}
+    conflicting = [value for value, pair in zip(values, pairs, strict=True) if pair not in created]
+    if conflicting:
+        insert_statement = sqlite.insert(ExchangeRate)
+        upserted = await session.execute(
+            insert_statement.on_conflict_do_update(
+                index_elements=[ExchangeRate.base_currency_id, ExchangeRate.target_currency_id],
+                set_={"rate": insert_statement.excluded.rate},
+            ).returning(ExchangeRate.base_currency_id, ExchangeRate.target_currency_id, ExchangeRate.id),
+            conflicting,
+        )
+        updated = {(base_id, target_id): exchangerate_id for base_id, target_id, exchangerate_id in upserted.all()}
+    return [(created[pair], True) if pair in created else (updated[pair], False) for pair in pairs]
+
+
+def _currency_id_by_code(code: str) -> ScalarSelect[int]:
+    return select(Currency.id).filter(Currency.code == code).scalar_subquery()
+
+
+def _dialect_insert(session: AsyncSession, model: type[Base]) -> postgresql.Insert | sqlite.Insert:
+    # ON CONFLICT ... DO UPDATE есть только в диалектных insert, у postgresql и sqlite синтаксис одинаковый
+    if session.bind.dialect.name == "sqlite":
+        return sqlite.insert(model)
+    return postgresql.insert(model)
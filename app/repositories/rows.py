@@ -0,0 +1,80 @@
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any
+
+from sqlalchemy import Row, Select, select
+from sqlalchemy.sql import FromClause
+
+from app.models.currency import Currency
+from app.models.exchangerate import ExchangeRate
+
+_currencies = Currency.__table__
+_exchangerates = ExchangeRate.__table__
+
+
+@dataclass(frozen=True, slots=True)
+class CurrencyRow:
+    """Валюта для чтения: без identity map и отслеживания изменений ORM."""
+
+    id: int
+    name: str
+    code: str
+    sign: str
+
+
+@dataclass(frozen=True, slots=True)
+class ExchangeRateRow:
+    id: int
+    base_currency: CurrencyRow
+    target_currency: CurrencyRow
+    rate: Decimal
+
+
+def currency_columns(table: FromClause = _currencies) -> tuple[Any, ...]:
+    return table.c.id, table.c.name, table.c.code, table.c.sign
+
+
+def select_currencies() -> Select[Any]:
+    return select(*currency_columns())
+
+
+def currency_row(row: Row[Any]) -> CurrencyRow:
+    return CurrencyRow(*row)
+
+
+def select_exchangerates() -> tuple[Select[Any], FromClause, FromClause]:
+    """Курсы с обеими валютами одним запросом; возвращает запрос и алиасы таблиц валют для фильтров."""
+    base = _currencies.alias("base_currency")
+    target = _currencies.alias("target_currency")
+    query = (
+        select(_exchangerates.c.id, _exchangerates.c.rate, *currency_columns(base), *currency_columns(target))
+        .join_from(_exchangerates, base, _exchangerates.c.base_currency_id == base.c.id)
+        .join(target, _exchangerates.c.target_currency_id == target.c.id)
+    )
+    return query, base, target
+
+
+def exchangerate_row(row: Row[Any], currencies: dict[int, CurrencyRow] | None = None) -> ExchangeRateRow:
+    # Порядок колонок — как в select_exchangerates: id, rate, затем по четыре колонки на каждую валюту
+    if currencies is None:
+        currencies = {}
+    return ExchangeRateRow(
+        id=row[0],
+        base_currency=_shared_currency(currencies, row[2:6]),
+        target_currency=_shared_currency(currencies, row[6:10]),
+        rate=row[1],
+    )
+
+
+def exchangerate_rows(rows: Iterable[Row[Any]]) -> list[ExchangeRateRow]:
+    # Одна валюта встречается во многих курсах — её объект создаётся один раз на весь список
+    currencies: dict[int, CurrencyRow] = {}
+    return [exchangerate_row(row, currencies) for row in rows]
+
+
+def _shared_currency(currencies: dict[int, CurrencyRow], values: Sequence[Any]) -> CurrencyRow:
+    currency = currencies.get(values[0])
+    if currency is None:
+        currency = currencies[values[0]] = CurrencyRow(*values)
+    return currency
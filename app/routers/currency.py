@@ -1,25 +1,59 @@
 from typing import Annotated
 
 from dishka.integrations.fastapi import FromDishka, inject
-from fastapi import APIRouter, Depends, Form, status
-from fastapi_limiter.depends import RateLimiter
+from fastapi import APIRouter, Depends, Form, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 
+from app.cache.response_cache import ResponseCache, dump_json_list
 from app.config import settings
+from app.dependencies import CacheValidators, PageParams, _conditional_get, _page_params, _stream_json_array
+from app.limiter import RateLimit
 from app.models.currency import Currency
+from app.repositories.rows import CurrencyRow
 from app.schemas import ApiErrorSchema, CurrencyCode, CurrencyResponse, CurrencySchema
 from app.service.currency_service import CurrencyService
 
 currency_router = APIRouter(tags=["Операции с валютой"])
 
+_currencies_adapter = TypeAdapter(list[CurrencyResponse])
+
 
 @currency_router.get(
     "/currencies",
     response_model=list[CurrencyResponse],
-    responses={500: {"model": ApiErrorSchema, "description": "База данных недоступна"}},
+    responses={
+        304: {"description": "Данные не менялись с версии из If-None-Match"},
+        500: {"model": ApiErrorSchema, "description": "База данных недоступна"},
+    },
 )
 @inject
-async def get_all_currencies(currency_service: FromDishka[CurrencyService]) -> list[Currency]:
-    currencies = await currency_service.get_all_currencies()
+async def get_all_currencies(
+    page: Annotated[PageParams, Depends(_page_params)],
+    validators: Annotated[CacheValidators, Depends(_conditional_get)],
+    response: Response,
+    currency_service: FromDishka[CurrencyService],
+    response_cache: FromDishka[ResponseCache],
+) -> Response | list[CurrencyRow]:
+    if page.stream:
+        rows = currency_service.stream_currencies(settings.stream_chunk_size)
+        return StreamingResponse(
+            _stream_json_array(rows, CurrencyResponse, settings.stream_chunk_size),
+            media_type="application/json",
+            headers=validators.headers,
+        )
+    if not page.paginated:
+
+        async def build() -> bytes:
+            return dump_json_list(await currency_service.get_all_currencies(), _currencies_adapter)
+
+        body = await response_cache.get_or_build("currencies", validators.version, build)
+        return Response(body, media_type="application/json", headers=validators.headers)
+
+    limit = page.limit or settings.page_max_limit
+    currencies = await currency_service.get_currencies_page(page.after_id, limit)
+    if len(currencies) == limit:
+        response.headers["X-Next-After-Id"] = str(currencies[-1].id)
     return currencies
 
 
@@ -27,7 +61,7 @@ async def get_all_currencies(currency_service: FromDishka[CurrencyService]) -> l
     "/currencies",
     response_model=CurrencyResponse,
     status_code=status.HTTP_201_CREATED,
-    dependencies=[Depends(RateLimiter(times=settings.redis_times, seconds=settings.redis_seconds))],
+    dependencies=[Depends(RateLimit(times=settings.redis_times, seconds=settings.redis_seconds))],
     responses={
         400: {"model": ApiErrorSchema, "description": "Отсутствует нужное поле формы"},
         409: {"model": ApiErrorSchema, "description": "Валюта с таким кодом уже существует"},
@@ -45,13 +79,15 @@ async def add_new_currency(
 @currency_router.get(
     "/currency/{code}",
     response_model=CurrencyResponse,
+    dependencies=[Depends(_conditional_get)],
     responses={
+        304: {"description": "Данные не менялись с версии из If-None-Match"},
         400: {"model": ApiErrorSchema, "description": "Код валюты отсутствует в адресе"},
         404: {"model": ApiErrorSchema, "description": "Валюта не найдена"},
         500: {"model": ApiErrorSchema, "description": "База данных недоступна"},
     },
 )
 @inject
-async def get_currency(code: CurrencyCode, currency_service: FromDishka[CurrencyService]) -> Currency:
+async def get_currency(code: CurrencyCode, currency_service: FromDishka[CurrencyService]) -> CurrencyRow:
     currency = await currency_service.get_currency_by(code)
     return currency
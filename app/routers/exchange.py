@@ -1,20 +1,29 @@
+from datetime import datetime
 from typing import Annotated
 
 from dishka.integrations.fastapi import FromDishka, inject
-from fastapi import APIRouter, Depends, Query
-from fastapi_limiter.depends import RateLimiter
+from fastapi import APIRouter, Depends, Query, Request, Response
+from pydantic import TypeAdapter
 
 from app.config import settings
-from app.schemas import ApiErrorSchema, ConvertedExchangeRateResponse, CurrencyCode, InputDecimal
+from app.dependencies import NDJSON_MEDIA_TYPE, _is_media_type, _read_list_body
+from app.limiter import RateLimit
+from app.schemas import ApiErrorSchema, ConvertedExchangeRateResponse, CurrencyCode, ExchangeBatchItem, InputDecimal
 from app.service.exchange_service import ExchangeService
 
 exchange_router = APIRouter(tags=["Операции с обменом"])
 
+_batch_items_adapter = TypeAdapter(list[ExchangeBatchItem])
+_batch_response_adapter = TypeAdapter(list[ConvertedExchangeRateResponse])
+
 
 @exchange_router.get(
     "/exchange",
-    dependencies=[Depends(RateLimiter(times=settings.redis_times, seconds=settings.redis_seconds))],
-    responses={500: {"model": ApiErrorSchema, "description": "База данных недоступна"}},
+    dependencies=[Depends(RateLimit(times=settings.redis_times, seconds=settings.redis_seconds))],
+    responses={
+        404: {"model": ApiErrorSchema, "description": "Обменный курс для пары не найден"},
+        500: {"model": ApiErrorSchema, "description": "База данных недоступна"},
+    },
 )
 @inject
 async def convert_amount(
@@ -22,6 +31,41 @@ async def convert_amount(
     to: CurrencyCode,
     amount: InputDecimal,
     exchange_service: FromDishka[ExchangeService],
+    at: Annotated[datetime | None, Query(description="Конвертировать по курсу, действовавшему в этот момент")] = None,
 ) -> ConvertedExchangeRateResponse:
-    converted = await exchange_service.convert(from_, to, amount)
+    converted = await exchange_service.convert(from_, to, amount, at)
     return converted
+
+
+@exchange_router.post(
+    "/exchange/batch",
+    response_model=list[ConvertedExchangeRateResponse],
+    dependencies=[Depends(RateLimit(times=settings.redis_times, seconds=settings.redis_seconds))],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": _batch_items_adapter.json_schema(by_alias=True)},
+                NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}},
+            },
+        }
+    },
+    responses={
+        200: {"content": {NDJSON_MEDIA_TYPE: {}}},
+        400: {"model": ApiErrorSchema, "description": "Некорректный список конвертаций"},
+        404: {"model": ApiErrorSchema, "description": "Обменный курс для пары не найден"},
+        500: {"model": ApiErrorSchema, "description": "База данных недоступна"},
+    },
+)
+@inject
+async def convert_amounts(request: Request, exchange_service: FromDishka[ExchangeService]) -> Response:
+    items = await _read_list_body(request, _batch_items_adapter, settings.exchange_batch_max_items)
+    converted = await exchange_service.convert_many(items)
+
+    ndjson = _is_media_type(request, "content-type", NDJSON_MEDIA_TYPE)
+    if ndjson or _is_media_type(request, "accept", NDJSON_MEDIA_TYPE):
+        # Ответ собирается целиком: ошибка любой пары (404) должна прийти статусом, а не оборвать поток
+        body = b"".join(item.model_dump_json(by_alias=True).encode() + b"\n" for item in converted)
+        return Response(body, media_type=NDJSON_MEDIA_TYPE)
+
+    return Response(_batch_response_adapter.dump_json(converted, by_alias=True), media_type="application/json")
@@ -1,36 +1,84 @@
+from datetime import datetime
 from typing import Annotated
 
 from dishka.integrations.fastapi import FromDishka, inject
-from fastapi import APIRouter, Depends, Form, HTTPException, status
-from fastapi_limiter.depends import RateLimiter
+from fastapi import APIRouter, Depends, Form, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 
+from app.cache.response_cache import ResponseCache, dump_json_list
 from app.config import settings
-from app.dependencies import _divide_codepair
-from app.exceptions import CurrencyNotFoundError
-from app.models.exchangerate import ExchangeRate
-from app.schemas import ApiErrorSchema, ExchangeRateResponse, ExchangeRateSchema, InputDecimal
-from app.service.currency_service import CurrencyService
+from app.dependencies import (
+    CSV_MEDIA_TYPE,
+    CacheValidators,
+    PageParams,
+    _conditional_get,
+    _divide_codepair,
+    _page_params,
+    _read_list_body,
+    _stream_json_array,
+)
+from app.limiter import RateLimit
+from app.repositories.rows import ExchangeRateRow
+from app.schemas import (
+    ApiErrorSchema,
+    CandleInterval,
+    CandleResponse,
+    ExchangeRateResponse,
+    ExchangeRateSchema,
+    ExchangeRateUpsertResult,
+    InputDecimal,
+)
 from app.service.exchangerate_service import ExchangeRateService
 
 exchange_rate_router = APIRouter(tags=["Операции с обменным курсами"])
 
+_upsert_items_adapter = TypeAdapter(list[ExchangeRateSchema])
+_exchangerates_adapter = TypeAdapter(list[ExchangeRateResponse])
+
 
 @exchange_rate_router.get(
     "/exchangeRates",
     response_model=list[ExchangeRateResponse],
-    responses={500: {"model": ApiErrorSchema, "description": "База данных недоступна"}},
+    responses={
+        304: {"description": "Данные не менялись с версии из If-None-Match"},
+        500: {"model": ApiErrorSchema, "description": "База данных недоступна"},
+    },
 )
 @inject
-async def get_all_exchangerates(exchangerate_service: FromDishka[ExchangeRateService]) -> list[ExchangeRate]:
-    exchangerates = await exchangerate_service.get_all_exchangerates()
+async def get_all_exchangerates(
+    page: Annotated[PageParams, Depends(_page_params)],
+    validators: Annotated[CacheValidators, Depends(_conditional_get)],
+    response: Response,
+    exchangerate_service: FromDishka[ExchangeRateService],
+    response_cache: FromDishka[ResponseCache],
+) -> Response | list[ExchangeRateRow]:
+    if page.stream:
+        rows = exchangerate_service.stream_exchangerates(settings.stream_chunk_size)
+        return StreamingResponse(
+            _stream_json_array(rows, ExchangeRateResponse, settings.stream_chunk_size),
+            media_type="application/json",
+            headers=validators.headers,
+        )
+    if not page.paginated:
+
+        async def build() -> bytes:
+            return dump_json_list(await exchangerate_service.get_all_exchangerates(), _exchangerates_adapter)
+
+        body = await response_cache.get_or_build("exchangerates", validators.version, build)
+        return Response(body, media_type="application/json", headers=validators.headers)
+
+    limit = page.limit or settings.page_max_limit
+    exchangerates = await exchangerate_service.get_exchangerates_page(page.after_id, limit)
+    if len(exchangerates) == limit:
+        response.headers["X-Next-After-Id"] = str(exchangerates[-1].id)
     return exchangerates
 
 
 @exchange_rate_router.post(
     "/exchangeRates",
-    response_model=ExchangeRateResponse,
     status_code=status.HTTP_201_CREATED,
-    dependencies=[Depends(RateLimiter(times=settings.redis_times, seconds=settings.redis_seconds))],
+    dependencies=[Depends(RateLimit(times=settings.redis_times, seconds=settings.redis_seconds))],
     responses={
         400: {"model": ApiErrorSchema, "description": "Отсутствует нужное поле формы"},
         409: {"model": ApiErrorSchema, "description": "Валютная пара с таким кодом уже существует"},
@@ -40,28 +88,44 @@ async def get_all_exchangerates(exchangerate_service: FromDishka[ExchangeRateSer
 )
 @inject
 async def add_new_exchangerate(
-    exchangerate: Annotated[ExchangeRateSchema, Form()],
-    currency_service: FromDishka[CurrencyService],
-    exchangerate_service: FromDishka[ExchangeRateService],
-) -> ExchangeRate:
-    try:
-        base_currency = await currency_service.get_currency_by(exchangerate.base_currency_code)
-        target_currency = await currency_service.get_currency_by(exchangerate.target_currency_code)
-    except CurrencyNotFoundError as e:
-        raise HTTPException(
-            status_code=e.code, detail="Одна (или обе) валюта из валютной пары не существует в БД"
-        ) from e
-
-    created_exchange_rate = await exchangerate_service.add_exchangerate(
-        exchangerate, base_currency.id, target_currency.id
-    )
+    exchangerate: Annotated[ExchangeRateSchema, Form()], exchangerate_service: FromDishka[ExchangeRateService]
+) -> ExchangeRateResponse:
+    created_exchange_rate = await exchangerate_service.add_exchangerate(exchangerate)
     return created_exchange_rate
 
 
+@exchange_rate_router.post(
+    "/exchangeRates/bulk",
+    dependencies=[Depends(RateLimit(times=settings.redis_times, seconds=settings.redis_seconds))],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": _upsert_items_adapter.json_schema(by_alias=True)},
+                CSV_MEDIA_TYPE: {"schema": {"type": "string", "example": "baseCurrencyCode,targetCurrencyCode,rate"}},
+            },
+        }
+    },
+    responses={
+        400: {"model": ApiErrorSchema, "description": "Некорректный список курсов"},
+        500: {"model": ApiErrorSchema, "description": "База данных недоступна"},
+    },
+)
+@inject
+async def upsert_exchangerates(
+    request: Request, exchangerate_service: FromDishka[ExchangeRateService]
+) -> list[ExchangeRateUpsertResult]:
+    exchangerates = await _read_list_body(request, _upsert_items_adapter, settings.exchangerate_bulk_max_items)
+    results = await exchangerate_service.upsert_exchangerates(exchangerates)
+    return results
+
+
 @exchange_rate_router.get(
     "/exchangeRate/{codepair}",
     response_model=ExchangeRateResponse,
+    dependencies=[Depends(_conditional_get)],
     responses={
+        304: {"description": "Данные не менялись с версии из If-None-Match"},
         400: {"model": ApiErrorSchema, "description": "Коды валют пары отсутствуют в адресе"},
         404: {"model": ApiErrorSchema, "description": "Обменный курс для пары не найден"},
         500: {"model": ApiErrorSchema, "description": "База данных недоступна"},
@@ -70,7 +134,7 @@ async def add_new_exchangerate(
 @inject
 async def get_exchangerate_by_codepair(
     codes: Annotated[tuple[str, str], Depends(_divide_codepair)], exchangerate_service: FromDishka[ExchangeRateService]
-) -> ExchangeRate:
+) -> ExchangeRateRow:
     base_code, target_code = codes
     exchangerate = await exchangerate_service.get_exchangerate_by_codepair(base_code, target_code)
     return exchangerate
@@ -78,7 +142,6 @@ async def get_exchangerate_by_codepair(
 
 @exchange_rate_router.patch(
     "/exchangeRate/{codepair}",
-    response_model=ExchangeRateResponse,
     responses={
         400: {"model": ApiErrorSchema, "description": "Отсутствует нужное поле формы"},
         404: {"model": ApiErrorSchema, "description": "Валютная пара отсутствует в базе данных"},
@@ -90,7 +153,30 @@ async def change_exchangerate_by_codepair(
     codes: Annotated[tuple[str, str], Depends(_divide_codepair)],
     rate: Annotated[InputDecimal, Form()],
     exchangerate_service: FromDishka[ExchangeRateService],
-) -> ExchangeRate:
+) -> ExchangeRateResponse:
     base_code, target_code = codes
     new_exchangerate = await exchangerate_service.update_exchangerate(base_code, target_code, rate)
     return new_exchangerate
+
+
+@exchange_rate_router.get(
+    "/exchangeRate/{codepair}/candles",
+    dependencies=[Depends(_conditional_get)],
+    responses={
+        304: {"description": "Данные не менялись с версии из If-None-Match"},
+        400: {"model": ApiErrorSchema, "description": "Коды валют пары отсутствуют в адресе"},
+        500: {"model": ApiErrorSchema, "description": "База данных недоступна"},
+    },
+)
+@inject
+async def get_exchangerate_candles(
+    codes: Annotated[tuple[str, str], Depends(_divide_codepair)],
+    exchangerate_service: FromDishka[ExchangeRateService],
+    interval: CandleInterval = "day",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    limit: Annotated[int, Query(ge=1, le=settings.page_max_limit)] = settings.page_max_limit,
+) -> list[CandleResponse]:
+    base_code, target_code = codes
+    candles = await exchangerate_service.get_candles(base_code, target_code, interval, start, end, limit)
+    return candles
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Request, Response, status
+
+from app.schemas import HealthResponse, Readiness
+
+health_router = APIRouter(prefix="/health", tags=["Служебные"])
+
+
+@health_router.get("/live")
+async def live() -> HealthResponse:
+    """Процесс жив и обрабатывает запросы."""
+    return HealthResponse(status="ok")
+
+
+@health_router.get(
+    "/ready", responses={503: {"model": HealthResponse, "description": "Воркер ещё прогревается или останавливается"}}
+)
+async def ready(request: Request, response: Response) -> HealthResponse:
+    """Воркер прогрет и готов принимать трафик."""
+    readiness: Readiness = getattr(request.app.state, "readiness", "starting")
+    if readiness != "ok":
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return HealthResponse(status=readiness)
@@ -0,0 +1,28 @@
+from dishka.integrations.fastapi import FromDishka, inject
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app import metrics
+from app.engine import pool_status
+from app.schemas import PoolStatusResponse
+from app.sessions import ReplicaEngine
+
+internal_router = APIRouter(prefix="/internal", tags=["Служебные"])
+metrics_router = APIRouter(tags=["Служебные"])
+
+
+@internal_router.get("/pool")
+@inject
+async def get_pool_status(engine: FromDishka[AsyncEngine]) -> PoolStatusResponse:
+    return pool_status(engine)
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+@inject
+async def get_metrics(engine: FromDishka[AsyncEngine], replica_engine: FromDishka[ReplicaEngine]) -> PlainTextResponse:
+    """Метрики воркера в формате Prometheus. Счётчики у каждого воркера свои."""
+    pools = [("primary", pool_status(engine))]
+    if replica_engine is not engine:
+        pools.append(("replica", pool_status(replica_engine)))
+    return PlainTextResponse(metrics.render(pools), media_type="text/plain; version=0.0.4; charset=utf-8")
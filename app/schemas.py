@@ -1,10 +1,16 @@
+import sys
+from datetime import datetime
 from decimal import Decimal
-from typing import Annotated, Self
+from typing import Annotated, Literal, Self
 
 from pydantic import AfterValidator, BaseModel, BeforeValidator, ConfigDict, Field, PlainSerializer, model_validator
 
 from app.config import settings
 
+# Границы считаются один раз: валидаторы вызываются для каждого кода и каждой суммы в запросе
+_MIN_DECIMAL = Decimal(10) ** -settings.db_scale
+_MAX_DECIMAL = Decimal(10) ** settings.db_integer_digits
+
 
 def _pre_validate_code(value: str) -> str:
     value = str(value).strip().upper()
@@ -17,7 +23,9 @@ def _after_validate_code(value: str) -> str:
     if not value.isalpha():
         raise ValueError("Можно использовать только буквы для задания кода валюты")
 
-    return value
+    # Один объект строки на код: поиск в словарях снимка курсов сравнивает строки по ссылке.
+    # Интернируются только ASCII-коды — их не больше 26³, так что таблица строк не разрастается
+    return sys.intern(value) if value.isascii() else value
 
 
 def _round_decimal(value: Decimal) -> Decimal:
@@ -28,14 +36,15 @@ def _after_validate_decimal(value: Decimal) -> Decimal:
     if value <= 0:
         raise ValueError("Число должно быть больше или равно 0")
 
-    if value < Decimal(10) ** -settings.db_scale:
+    if value < _MIN_DECIMAL:
         raise ValueError("Слишком маленькое число.")
 
-    if int(value.normalize().as_tuple().exponent) < -settings.db_scale:
-        raise ValueError("Число знаков после запятой не должно превышать {settings.db_scale}")
-    limit = Decimal(10) ** settings.db_integer_digits
-    if value >= limit:
-        raise ValueError("Слишком большое число. Максимум {settings.db_integer_digits} целых чисел")
+    # normalize нужен только когда знаков больше допустимого: возможно, лишние знаки — это нули в конце
+    exponent = value.as_tuple().exponent
+    if int(exponent) < -settings.db_scale and int(value.normalize().as_tuple().exponent) < -settings.db_scale:
+        raise ValueError(f"Число знаков после запятой не должно превышать {settings.db_scale}")
+    if value >= _MAX_DECIMAL:
+        raise ValueError(f"Слишком большое число. Максимум {settings.db_integer_digits} целых чисел")
 
     return value
 
@@ -76,6 +85,8 @@ RoundedDecimal = Annotated[
 ]
 InputDecimal = Annotated[Decimal, BeforeValidator(_pre_validate_decimal), AfterValidator(_after_validate_decimal)]
 CurrencyCodepair = Annotated[str, AfterValidator(_is_valid_codepair)]
+UpsertStatus = Literal["created", "updated", "duplicate", "currency_not_found"]
+CandleInterval = Literal["minute", "hour", "day"]
 
 
 class IdMixin(BaseModel):
@@ -130,5 +141,54 @@ class ConvertedExchangeRateResponse(ConvertedExchangeRate):
     model_config = ConfigDict(alias_generator=_to_lower_camel, populate_by_name=True)
 
 
+class ExchangeRateUpsertResult(BaseModel):
+    base_currency_code: str
+    target_currency_code: str
+    status: UpsertStatus
+
+    model_config = ConfigDict(alias_generator=_to_lower_camel, populate_by_name=True)
+
+
+class ExchangeBatchItem(BaseModel):
+    from_: CurrencyCode = Field(alias="from", examples=["USD"])
+    to: CurrencyCode = Field(examples=["RUB"])
+    amount: InputDecimal = Field(examples=[10])
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class CandleResponse(BaseModel):
+    bucket_start: datetime
+    open: RoundedDecimal
+    high: RoundedDecimal
+    low: RoundedDecimal
+    close: RoundedDecimal
+    average: RoundedDecimal
+    samples: int
+
+    model_config = ConfigDict(alias_generator=_to_lower_camel, populate_by_name=True)
+
+
 class ApiErrorSchema(BaseModel):
     message: str
+
+
+class PoolStatusResponse(BaseModel):
+    pool_class: str
+    size: int | None = None
+    checked_in: int | None = None
+    checked_out: int | None = None
+    overflow: int | None = None
+    wait_count: int = 0
+    wait_seconds_total: float = 0
+    wait_seconds_max: float = 0
+    timeouts: int = 0
+
+    model_config = ConfigDict(alias_generator=_to_lower_camel, populate_by_name=True)
+
+
+Readiness = Literal["ok", "starting", "stopping"]
+
+
+class HealthResponse(BaseModel):
+    status: Readiness
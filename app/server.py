@@ -0,0 +1,155 @@
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from types import FrameType
+
+import uvicorn
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+APP_FACTORY = "app.app_factory:create_app"
+# Число воркеров, запущенных через run(); процессы воркеров (и процесс перезагрузки в dev) наследуют переменную
+WORKERS_ENV = "APP_SERVER_WORKERS"
+
+
+def run() -> None:
+    """Запускает сервер в режиме из настройки server_mode."""
+    if settings.server_mode == "dev":
+        os.environ[WORKERS_ENV] = "1"
+        uvicorn.run(APP_FACTORY, host=settings.server_host, port=settings.server_port, factory=True, reload=True)
+        return
+
+    workers = settings.server_workers or os.cpu_count() or 1
+    os.environ[WORKERS_ENV] = str(workers)
+    if not hasattr(os, "fork"):
+        # Без fork (Windows) предзагрузка невозможна — каждый воркер uvicorn импортирует приложение сам
+        uvicorn.run(APP_FACTORY, factory=True, workers=workers, **_server_options())
+        return
+
+    from app.app_factory import create_app
+
+    # Приложение и настройки загружаются один раз до fork, воркеры получают их готовыми.
+    # Соединения с БД и Redis создаются позже, в lifespan каждого воркера
+    config = uvicorn.Config(create_app(), **_server_options())
+    if workers == 1:
+        uvicorn.Server(config).run()
+        return
+
+    sock = config.bind_socket()
+    try:
+        _supervise(config, sock, workers)
+    finally:
+        sock.close()
+
+
+def is_single_worker() -> bool:
+    """Запущено ли приложение через run() ровно одним процессом.
+
+    Если приложение запущено иначе (uvicorn --workers, gunicorn, тестовый стенд), число воркеров
+    неизвестно, и считается, что их может быть несколько.
+    """
+    return os.environ.get(WORKERS_ENV) == "1"
+
+
+def _server_options() -> dict:
+    return {
+        "host": settings.server_host,
+        "port": settings.server_port,
+        "loop": "uvloop",
+        "http": "httptools",
+        # По SIGTERM сервер перестаёт принимать соединения и ждёт завершения начатых запросов
+        "timeout_graceful_shutdown": settings.server_graceful_timeout,
+        "timeout_keep_alive": settings.server_keepalive_timeout,
+    }
+
+
+def _supervise(config: uvicorn.Config, sock: socket.socket, workers: int) -> None:
+    """Держит workers воркеров на общем сокете и перезапускает упавшие.
+
+    Перезапуск откладывается тем дольше, чем больше воркеров упало за последние server_restart_window секунд.
+    Если их набралось server_restart_max_failures, остальные воркеры останавливаются и процесс завершается
+    с кодом 1, чтобы перезапуском занялся внешний супервизор (Docker, systemd).
+    """
+    children: set[int] = set()
+    stopping = False
+    # Будит ожидание перед перезапуском, чтобы сигнал остановки не ждал окончания задержки
+    wake = threading.Event()
+    failures: deque[float] = deque()
+
+    def stop(signum: int, frame: FrameType | None) -> None:
+        nonlocal stopping
+        stopping = True
+        wake.set()
+        # SIGINT из терминала воркеры и так получили всей группой процессов,
+        # а повторный сигнал uvicorn воспринял бы как команду завершиться немедленно
+        if signum != signal.SIGINT:
+            for pid in children:
+                os.kill(pid, signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        children.add(_spawn(config, sock))
+    logger.info("Запущено воркеров: %d", workers)
+
+    gave_up = False
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if stopping:
+            continue
+
+        now = time.monotonic()
+        failures.append(now)
+        while failures[0] < now - settings.server_restart_window:
+            failures.popleft()
+        code = os.waitstatus_to_exitcode(status)
+        if len(failures) >= settings.server_restart_max_failures:
+            logger.error(
+                "Воркер %d завершился с кодом %d: за %g с упало воркеров — %d, останавливаем сервер",
+                pid,
+                code,
+                settings.server_restart_window,
+                len(failures),
+            )
+            gave_up = True
+            stop(signal.SIGTERM, None)
+            continue
+
+        delay = settings.server_restart_backoff * 2 ** (len(failures) - 1)
+        logger.warning("Воркер %d завершился с кодом %d, запускаем новый через %g с", pid, code, delay)
+        wake.wait(delay)
+        if not stopping:
+            children.add(_spawn(config, sock))
+    logger.info("Все воркеры остановлены")
+    if gave_up:
+        sys.exit(1)
+
+
+def _spawn(config: uvicorn.Config, sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = 0
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException:
+        logger.exception("Воркер %d аварийно завершился", os.getpid())
+        code = 1
+    finally:
+        # Воркер не должен возвращаться в код родителя
+        os._exit(code)
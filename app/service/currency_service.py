@@ -1,20 +1,56 @@
+from collections.abc import AsyncIterator
+
+from app.cache.rate_cache import RateCache
+from app.cache.single_flight import SingleFlight
+from app.exceptions import CurrencyNotFoundError
 from app.models.currency import Currency
 from app.repositories.currency_repository import CurrencyRepository
-from app.schemas import CurrencySchema
+from app.repositories.rows import CurrencyRow
+from app.schemas import CurrencyResponse, CurrencySchema
+from app.sessions import SessionsFactory
 
 
 class CurrencyService:
-    def __init__(self, rep: CurrencyRepository):
+    def __init__(
+        self,
+        rep: CurrencyRepository,
+        rate_cache: RateCache,
+        single_flight: SingleFlight,
+        sessions_factory: SessionsFactory,
+    ):
         self.rep = rep
+        self.rate_cache = rate_cache
+        self.single_flight = single_flight
+        self.sessions_factory = sessions_factory
 
-    async def get_all_currencies(self) -> list[Currency]:
+    async def get_all_currencies(self) -> list[CurrencyRow]:
         return await self.rep.get_all()
 
-    async def get_currency_by(self, code: str) -> Currency:
-        currency = await self.rep.get_currency_by(code)
+    async def get_currencies_page(self, after_id: int | None, limit: int) -> list[CurrencyRow]:
+        return await self.rep.get_page(after_id, limit)
+
+    def stream_currencies(self, chunk_size: int) -> AsyncIterator[CurrencyRow]:
+        return self.rep.stream_all(chunk_size)
+
+    async def get_currency_by(self, code: str) -> CurrencyRow:
+        # Неизвестный снимку код — 404 без запроса к БД
+        if self.rate_cache.knows_currency(code) is False:
+            raise CurrencyNotFoundError
+        # Одновременные запросы одной валюты ждут один SELECT. Загрузка идёт в своих сессиях:
+        # сессии первого запроса закроются вместе с ним, а результат ждут и остальные
+        try:
+            currency = await self.single_flight.do(
+                ("currency", code),
+                lambda: self.sessions_factory.run(
+                    lambda sessions: self.rep.with_sessions(sessions).get_currency_by(code)
+                ),
+            )
+        except CurrencyNotFoundError:
+            self.rate_cache.remember_missing([code])
+            raise
         return currency
 
     async def add_currency(self, currency: CurrencySchema) -> Currency:
-        await self.rep.add_currency(currency)
-        created_currency = await self.rep.get_currency_by(currency.code)
+        created_currency = await self.rep.add_currency(currency)
+        await self.rate_cache.add_currency(CurrencyResponse.model_validate(created_currency))
         return created_currency
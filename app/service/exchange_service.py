@@ -1,21 +1,43 @@
+from collections.abc import Sequence
+from datetime import datetime
 from decimal import Decimal
 
-from app.schemas import ConvertedExchangeRateResponse
+from app.cache.conversion_cache import ConversionCache
+from app.schemas import ConvertedExchangeRate, ConvertedExchangeRateResponse, ExchangeBatchItem
 from app.service.exchangerate_service import ExchangeRateService
 
 
 class ExchangeService:
-    def __init__(self, service: ExchangeRateService):
+    def __init__(self, service: ExchangeRateService, conversion_cache: ConversionCache):
         self.service = service
+        self.conversion_cache = conversion_cache
 
-    async def convert(self, from_: str, to: str, amount: Decimal) -> ConvertedExchangeRateResponse:
-        converted = await self.service.get_effective_rate(from_, to)
+    async def convert(
+        self, from_: str, to: str, amount: Decimal, at: datetime | None = None
+    ) -> ConvertedExchangeRateResponse:
+        if at is not None:
+            return self._build_response(await self.service.get_effective_rate_at(from_, to, at), amount)
 
-        response = ConvertedExchangeRateResponse(
+        cached = self.conversion_cache.get(from_, to, amount)
+        if cached is not None:
+            return cached
+        # Поколение запоминаем до расчёта: если курс изменится, пока он идёт, результат не сохранится
+        generation = self.conversion_cache.generation
+        response = self._build_response(await self.service.get_effective_rate(from_, to), amount)
+        self.conversion_cache.put(from_, to, amount, response, generation)
+        return response
+
+    async def convert_many(self, items: Sequence[ExchangeBatchItem]) -> list[ConvertedExchangeRateResponse]:
+        # Сначала один раз получаем курсы для всех различных пар, затем считаем суммы одним проходом
+        rates = await self.service.get_effective_rates((item.from_, item.to) for item in items)
+        return [self._build_response(rates[(item.from_, item.to)], item.amount) for item in items]
+
+    @staticmethod
+    def _build_response(converted: ConvertedExchangeRate, amount: Decimal) -> ConvertedExchangeRateResponse:
+        return ConvertedExchangeRateResponse(
             base_currency=converted.base_currency,
             target_currency=converted.target_currency,
             rate=converted.rate,
             amount=amount,
             converted_amount=converted.rate * amount,
         )
-        return response
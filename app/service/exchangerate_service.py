@@ -1,56 +1,405 @@
 import logging
+from collections.abc import AsyncIterator, Iterable, Mapping, Sequence
+from datetime import UTC, datetime
 from decimal import Decimal
+from typing import Self
 
-from app.exceptions import ExchangeRateNotFoundError
-from app.models.exchangerate import ExchangeRate
+from app import metrics
+from app.cache.rate_cache import RateCache
+from app.cache.rate_graph import CodePair, CrossRateGraph
+from app.cache.single_flight import SingleFlight
+from app.exceptions import CurrencyNotFoundError, ExchangeRateNotFoundError
+from app.models.exchangerate_candle import bucket_start
 from app.repositories.currency_repository import CurrencyRepository
 from app.repositories.exchangerate_repository import ExchangeRateRepository
-from app.schemas import ConvertedExchangeRate, CurrencyResponse, ExchangeRateSchema
+from app.repositories.rows import CurrencyRow, ExchangeRateRow
+from app.schemas import (
+    CandleInterval,
+    CandleResponse,
+    ConvertedExchangeRate,
+    CurrencyResponse,
+    ExchangeRateResponse,
+    ExchangeRateSchema,
+    ExchangeRateUpsertResult,
+    UpsertStatus,
+)
+from app.sessions import DatabaseSessions, SessionsFactory
 
 logger = logging.getLogger(__name__)
 
 
 class ExchangeRateService:
-    def __init__(self, exchangerate_rep: ExchangeRateRepository, currency_rep: CurrencyRepository):
+    def __init__(
+        self,
+        exchangerate_rep: ExchangeRateRepository,
+        currency_rep: CurrencyRepository,
+        rate_cache: RateCache,
+        single_flight: SingleFlight,
+        sessions_factory: SessionsFactory,
+    ):
         self.exchangerate_rep = exchangerate_rep
         self.currency_rep = currency_rep
+        self.rate_cache = rate_cache
+        self.single_flight = single_flight
+        self.sessions_factory = sessions_factory
 
-    async def get_all_exchangerates(self) -> list[ExchangeRate]:
+    async def get_all_exchangerates(self) -> list[ExchangeRateRow]:
         return await self.exchangerate_rep.get_all()
 
-    async def get_exchangerate_by_codepair(self, base_code: str, target_code: str) -> ExchangeRate:
+    async def get_exchangerates_page(self, after_id: int | None, limit: int) -> list[ExchangeRateRow]:
+        return await self.exchangerate_rep.get_page(after_id, limit)
+
+    def stream_exchangerates(self, chunk_size: int) -> AsyncIterator[ExchangeRateRow]:
+        return self.exchangerate_rep.stream_all(chunk_size)
+
+    async def get_exchangerate_by_codepair(self, base_code: str, target_code: str) -> ExchangeRateRow:
+        if not self._may_exist(base_code, target_code):
+            raise ExchangeRateNotFoundError
         exchangerate = await self.exchangerate_rep.get_exchangerate_by_codepair(base_code, target_code)
         return exchangerate
 
-    async def update_exchangerate(self, base_code: str, target_code: str, rate: Decimal) -> ExchangeRate:
-        await self.exchangerate_rep.update_exchangerate(base_code, target_code, rate)
-        return await self.get_exchangerate_by_codepair(base_code, target_code)
+    async def update_exchangerate(self, base_code: str, target_code: str, rate: Decimal) -> ExchangeRateResponse:
+        currencies = await self._get_currency_pair(base_code, target_code)
+        if currencies is None:
+            raise ExchangeRateNotFoundError(message="Валютная пара отсутствует в базе данных")
+
+        exchangerate_id, stored_rate = await self.exchangerate_rep.update_exchangerate(base_code, target_code, rate)
+        updated_exchangerate = ExchangeRateResponse(
+            id=exchangerate_id, base_currency=currencies[0], target_currency=currencies[1], rate=stored_rate
+        )
+        await self.rate_cache.set_rate(updated_exchangerate)
+        return updated_exchangerate
+
+    async def add_exchangerate(self, exchangerate: ExchangeRateSchema) -> ExchangeRateResponse:
+        currencies = await self._get_currency_pair(exchangerate.base_currency_code, exchangerate.target_currency_code)
+        if currencies is None:
+            raise CurrencyNotFoundError(message="Одна (или обе) валюта из валютной пары не существует в БД")
+
+        base_currency, target_currency = currencies
+        exchangerate_id = await self.exchangerate_rep.add_exchangerate(
+            exchangerate, base_currency.id, target_currency.id
+        )
+        created_exchangerate = ExchangeRateResponse(
+            id=exchangerate_id, base_currency=base_currency, target_currency=target_currency, rate=exchangerate.rate
+        )
+        await self.rate_cache.set_rate(created_exchangerate)
+        return created_exchangerate
+
+    async def upsert_exchangerates(self, exchangerates: Sequence[ExchangeRateSchema]) -> list[ExchangeRateUpsertResult]:
+        currencies = await self._get_currencies(
+            {code for rate in exchangerates for code in (rate.base_currency_code, rate.target_currency_code)}
+        )
+        # Если пара встречается в листе несколько раз, применяется последнее значение
+        last_index = {
+            (rate.base_currency_code, rate.target_currency_code): index for index, rate in enumerate(exchangerates)
+        }
+        statuses: list[UpsertStatus] = []
+        to_write: list[int] = []
+        for index, rate in enumerate(exchangerates):
+            if rate.base_currency_code not in currencies or rate.target_currency_code not in currencies:
+                statuses.append("currency_not_found")
+            elif last_index[(rate.base_currency_code, rate.target_currency_code)] != index:
+                statuses.append("duplicate")
+            else:
+                statuses.append("updated")
+                to_write.append(index)
+
+        written = await self.exchangerate_rep.upsert_exchangerates(
+            [
+                (
+                    currencies[exchangerates[index].base_currency_code].id,
+                    currencies[exchangerates[index].target_currency_code].id,
+                    exchangerates[index].rate,
+                )
+                for index in to_write
+            ]
+        )
+        upserted_exchangerates = []
+        for index, (exchangerate_id, created) in zip(to_write, written, strict=True):
+            rate = exchangerates[index]
+            if created:
+                statuses[index] = "created"
+            upserted_exchangerates.append(
+                ExchangeRateResponse(
+                    id=exchangerate_id,
+                    base_currency=currencies[rate.base_currency_code],
+                    target_currency=currencies[rate.target_currency_code],
+                    rate=rate.rate,
+                )
+            )
+        await self.rate_cache.set_rates(upserted_exchangerates)
+
+        return [
+            ExchangeRateUpsertResult(
+                base_currency_code=rate.base_currency_code,
+                target_currency_code=rate.target_currency_code,
+                status=status,
+            )
+            for rate, status in zip(exchangerates, statuses, strict=True)
+        ]
 
-    async def add_exchangerate(self, exchangerate: ExchangeRateSchema, base_id: int, target_id: int) -> ExchangeRate:
-        await self.exchangerate_rep.add_exchangerate(exchangerate, base_id, target_id)
-        return await self.get_exchangerate_by_codepair(
-            exchangerate.base_currency_code, exchangerate.target_currency_code
+    async def get_candles(
+        self,
+        base_code: str,
+        target_code: str,
+        interval: CandleInterval,
+        start: datetime | None,
+        end: datetime | None,
+        limit: int,
+    ) -> list[CandleResponse]:
+        candles = await self.exchangerate_rep.get_candles(
+            base_code,
+            target_code,
+            interval,
+            None if start is None else _as_utc(start),
+            None if end is None else _as_utc(end),
+            limit,
         )
+        return [
+            CandleResponse(
+                bucket_start=bucket_start(candle.bucket_start, interval),
+                open=candle.open,
+                high=candle.high,
+                low=candle.low,
+                close=candle.close,
+                average=candle.rate_sum / candle.samples,
+                samples=candle.samples,
+            )
+            for candle in candles
+        ]
+
+    async def _get_currency_pair(
+        self, base_code: str, target_code: str
+    ) -> tuple[CurrencyResponse, CurrencyResponse] | None:
+        currencies = await self._get_currencies({base_code, target_code})
+        if base_code not in currencies or target_code not in currencies:
+            return None
+        return currencies[base_code], currencies[target_code]
+
+    async def _get_currencies(self, codes: set[str]) -> dict[str, CurrencyResponse]:
+        # Метаданные валют берём из снимка, в БД идём только за теми, о которых снимок не знает
+        snapshot = await self.rate_cache.get_snapshot(self._load_snapshot)
+        currencies = {code: snapshot.currencies[code] for code in codes if code in snapshot.currencies}
+        missing = {code for code in codes - currencies.keys() if self._may_exist(code)}
+        if missing:
+            for currency in await self.currency_rep.get_currencies_by_codes(missing):
+                currencies[currency.code] = CurrencyResponse.model_validate(currency)
+            self.rate_cache.remember_missing(missing - currencies.keys())
+        return currencies
+
+    async def _load_snapshot(self) -> tuple[list[CurrencyResponse], list[ExchangeRateResponse]]:
+        currencies = [CurrencyResponse.model_validate(currency) for currency in await self.currency_rep.get_all()]
+        exchangerates = [
+            ExchangeRateResponse.model_validate(exchangerate, from_attributes=True)
+            for exchangerate in await self.exchangerate_rep.get_all()
+        ]
+        return currencies, exchangerates
+
+    async def warm_up(self) -> None:
+        """Загружает снимок валют и курсов заранее, чтобы первые запросы не ждали БД."""
+        await self.rate_cache.get_snapshot(self._load_snapshot)
 
     async def get_effective_rate(self, from_: str, to: str) -> ConvertedExchangeRate:
+        snapshot = await self.rate_cache.get_snapshot(self._load_snapshot)
+        converted = snapshot.get_effective_rate(from_, to)
+        if converted is not None:
+            metrics.conversions.inc(snapshot.path_kind(from_, to), "cache")
+            return converted
+
+        return await self._get_missing_effective_rate(from_, to)
+
+    async def get_effective_rates(self, pairs: Iterable[CodePair]) -> dict[CodePair, ConvertedExchangeRate]:
+        snapshot = await self.rate_cache.get_snapshot(self._load_snapshot)
+        result = {}
+        missing = []
+        for from_, to in set(pairs):
+            converted = snapshot.get_effective_rate(from_, to)
+            if converted is None:
+                missing.append((from_, to))
+            else:
+                metrics.conversions.inc(snapshot.path_kind(from_, to), "cache")
+                result[(from_, to)] = converted
+        if not missing:
+            return result
+
+        # Все пары, которых нет в снимке, читаются из БД одним запросом, а снимок сбрасывается не больше одного раза
+        found = await self._get_effective_rates_from_db([pair for pair in missing if self._may_exist(*pair)])
+        if found:
+            logger.info("Снимок курсов устарел: %d пар найдено только в БД", len(found))
+            await self.rate_cache.invalidate()
+        for from_, to in missing:
+            if (from_, to) not in found:
+                if from_ == to:
+                    raise CurrencyNotFoundError
+                raise ExchangeRateNotFoundError(message=f"Обменный курс для пары {from_}{to} не найден")
+        result.update(found)
+        return result
+
+    async def _get_missing_effective_rate(self, from_: str, to: str) -> ConvertedExchangeRate:
+        if not self._may_exist(from_, to):
+            raise CurrencyNotFoundError if from_ == to else ExchangeRateNotFoundError
+        # Всплеск запросов одной пары, которой нет в снимке, выполняет один запрос к БД на всех.
+        # Загрузка идёт в своих сессиях: сессии первого запроса закроются вместе с ним, а результат ждут и остальные
+        return await self.single_flight.do(
+            ("effective_rate", from_, to),
+            lambda: self.sessions_factory.run(
+                lambda sessions: self._with_sessions(sessions)._load_missing_effective_rate(from_, to)
+            ),
+        )
+
+    def _with_sessions(self, sessions: DatabaseSessions) -> Self:
+        return type(self)(
+            exchangerate_rep=self.exchangerate_rep.with_sessions(sessions),
+            currency_rep=self.currency_rep.with_sessions(sessions),
+            rate_cache=self.rate_cache,
+            single_flight=self.single_flight,
+            sessions_factory=self.sessions_factory,
+        )
+
+    async def _load_missing_effective_rate(self, from_: str, to: str) -> ConvertedExchangeRate:
+        converted = (await self._get_effective_rates_from_db([(from_, to)])).get((from_, to))
+        if converted is None:
+            raise CurrencyNotFoundError if from_ == to else ExchangeRateNotFoundError
+        # В БД курс нашёлся, а в снимке его нет — снимок устарел (курс добавил другой воркер)
+        logger.info("Снимок курсов устарел: пара %s%s найдена только в БД", from_, to)
+        await self.rate_cache.invalidate()
+        return converted
+
+    async def get_effective_rate_at(self, from_: str, to: str, at: datetime) -> ConvertedExchangeRate:
+        """Курс, действовавший в момент at, по истории курсов."""
         if from_ == to:
-            currency = CurrencyResponse.model_validate(await self.currency_rep.get_currency_by(from_))
-            return ConvertedExchangeRate(base_currency=currency, target_currency=currency, rate=Decimal(1))
-        try:
-            exchange_rate = await self.exchangerate_rep.get_exchangerate_by_codepair(from_, to)
-            rate = exchange_rate.rate
-            base_currency = CurrencyResponse.model_validate(exchange_rate.base_currency)
-            target_currency = CurrencyResponse.model_validate(exchange_rate.target_currency)
-        except ExchangeRateNotFoundError:
-            try:
-                exchange_rate = await self.exchangerate_rep.get_exchangerate_by_codepair(to, from_)
-                rate = 1 / exchange_rate.rate
-                base_currency = CurrencyResponse.model_validate(exchange_rate.target_currency)
-                target_currency = CurrencyResponse.model_validate(exchange_rate.base_currency)
-            except ExchangeRateNotFoundError:
-                usd_from = await self.exchangerate_rep.get_exchangerate_by_codepair("USD", from_)
-                usd_to = await self.exchangerate_rep.get_exchangerate_by_codepair("USD", to)
-                base_currency = CurrencyResponse.model_validate(usd_from.target_currency)
-                target_currency = CurrencyResponse.model_validate(usd_to.target_currency)
-                rate = usd_to.rate / usd_from.rate
-        return ConvertedExchangeRate(base_currency=base_currency, target_currency=target_currency, rate=rate)
+            return await self._get_same_currency_rate(from_, "history")
+        if not self._may_exist(from_, to):
+            raise ExchangeRateNotFoundError
+
+        at = _as_utc(at)
+        # Прямой или обратный курс — всегда кратчайший путь в графе, для него хватает двух пар
+        rates = await self.exchangerate_rep.get_rates_at([(from_, to), (to, from_)], at)
+        converted = _pick_effective_rate(
+            from_,
+            to,
+            {(base.code, target.code): (base, target, rate) for base, target, rate in rates if rate is not None},
+            "history",
+        )
+        if converted is None:
+            converted = await self._resolve_cross_rate_at(from_, to, at)
+        return converted
+
+    async def _resolve_cross_rate_at(self, from_: str, to: str, at: datetime) -> ConvertedExchangeRate:
+        """Кросс-курс на момент at по тому же графу и тем же опорным валютам, что и текущий кросс-курс."""
+        currencies: dict[str, CurrencyRow] = {}
+        rates: dict[CodePair, Decimal] = {}
+        for base, target, rate in await self.exchangerate_rep.get_rates_at(None, at):
+            if rate is not None:
+                currencies[base.code] = base
+                currencies[target.code] = target
+                rates[(base.code, target.code)] = rate
+
+        rate = CrossRateGraph(rates, self.rate_cache.pivots, sources=[from_]).resolve(from_, to)
+        if rate is None:
+            raise ExchangeRateNotFoundError
+        metrics.conversions.inc("cross", "history")
+        return ConvertedExchangeRate(
+            base_currency=CurrencyResponse.model_validate(currencies[from_]),
+            target_currency=CurrencyResponse.model_validate(currencies[to]),
+            rate=rate,
+        )
+
+    async def _get_effective_rates_from_db(self, pairs: Sequence[CodePair]) -> dict[CodePair, ConvertedExchangeRate]:
+        """Курсы пар по БД: один запрос за валютами пар из одной валюты и один за курсами всех остальных пар.
+
+        Пары, курс которых не нашёлся, в результат не попадают.
+        """
+        codes = {from_ for from_, to in pairs if from_ == to}
+        currencies = {}
+        if codes:
+            currencies = {
+                currency.code: CurrencyResponse.model_validate(currency)
+                for currency in await self.currency_rep.get_currencies_by_codes(codes)
+            }
+            self.rate_cache.remember_missing(codes - currencies.keys())
+        pivots = self.rate_cache.pivots
+        exchangerates = await self.exchangerate_rep.get_exchangerates_by_codepairs(
+            {candidate for from_, to in pairs if from_ != to for candidate in _candidate_codepairs(from_, to, pivots)}
+        )
+        rates = {
+            (rate.base_currency.code, rate.target_currency.code): (rate.base_currency, rate.target_currency, rate.rate)
+            for rate in exchangerates
+        }
+        currency_rows = {
+            currency.code: currency for rate in exchangerates for currency in (rate.base_currency, rate.target_currency)
+        }
+        # Пути считаем только из валют пар без прямого и обратного курса
+        graph = CrossRateGraph(
+            {pair: rate for pair, (_, _, rate) in rates.items()},
+            pivots,
+            sources={
+                from_ for from_, to in pairs if from_ != to and (from_, to) not in rates and (to, from_) not in rates
+            },
+        )
+
+        result = {}
+        for from_, to in pairs:
+            converted: ConvertedExchangeRate | None
+            if from_ == to:
+                converted = None
+                if (currency := currencies.get(from_)) is not None:
+                    metrics.conversions.inc("same", "database")
+                    converted = ConvertedExchangeRate(base_currency=currency, target_currency=currency, rate=Decimal(1))
+            else:
+                converted = _pick_effective_rate(from_, to, rates, "database")
+                if converted is None and (rate := graph.resolve(from_, to)) is not None:
+                    metrics.conversions.inc("cross", "database")
+                    converted = ConvertedExchangeRate(
+                        base_currency=CurrencyResponse.model_validate(currency_rows[from_]),
+                        target_currency=CurrencyResponse.model_validate(currency_rows[to]),
+                        rate=rate,
+                    )
+            if converted is not None:
+                result[(from_, to)] = converted
+        return result
+
+    def _may_exist(self, *codes: str) -> bool:
+        """False, только если снимок точно знает, что какой-то из валют нет, — тогда в БД идти незачем."""
+        return all(self.rate_cache.knows_currency(code) is not False for code in codes)
+
+    async def _get_same_currency_rate(self, code: str, source: str) -> ConvertedExchangeRate:
+        if not self._may_exist(code):
+            raise CurrencyNotFoundError
+        currency = CurrencyResponse.model_validate(await self.currency_rep.get_currency_by(code))
+        metrics.conversions.inc("same", source)
+        return ConvertedExchangeRate(base_currency=currency, target_currency=currency, rate=Decimal(1))
+
+
+def _as_utc(moment: datetime) -> datetime:
+    # Время без часового пояса считаем UTC
+    return moment.astimezone(UTC) if moment.tzinfo is not None else moment.replace(tzinfo=UTC)
+
+
+def _candidate_codepairs(from_: str, to: str, pivots: Sequence[str]) -> set[CodePair]:
+    # Прямой и обратный курс, ноги к опорным валютам и курсы между ними забираем одним запросом,
+    # а путь по ним ищет тот же граф, что и в снимке
+    codes = [from_, to, *pivots]
+    return {
+        (base, target) for base in codes for target in codes if base != target and (base in pivots or target in pivots)
+    } | {(from_, to), (to, from_)}
+
+
+def _pick_effective_rate(
+    from_: str, to: str, rates: Mapping[CodePair, tuple[CurrencyRow, CurrencyRow, Decimal]], source: str
+) -> ConvertedExchangeRate | None:
+    if (direct := rates.get((from_, to))) is not None:
+        base_currency, target_currency, rate = direct
+        path = "direct"
+    elif (reverse := rates.get((to, from_))) is not None:
+        target_currency, base_currency, reverse_rate = reverse
+        rate = 1 / reverse_rate
+        path = "reverse"
+    else:
+        return None
+    metrics.conversions.inc(path, source)
+    return ConvertedExchangeRate(
+        base_currency=CurrencyResponse.model_validate(base_currency),
+        target_currency=CurrencyResponse.model_validate(target_currency),
+        rate=rate,
+    )
@@ -0,0 +1,98 @@
+from collections.abc import Awaitable, Callable
+from typing import Any, NewType
+
+from sqlalchemy import Result
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.sql.selectable import TypedReturnsRows
+
+from app.cache.data_version import DataVersion
+
+ReplicaEngine = NewType("ReplicaEngine", AsyncEngine)
+ReplicaSessionmaker = NewType("ReplicaSessionmaker", async_sessionmaker[AsyncSession])
+
+
+class DatabaseSessions:
+    """Сессии одного запроса.
+
+    Чтение идёт в реплику, запись — в основную БД. После первой записи
+    всё чтение в рамках запроса тоже идёт в основную БД, чтобы видеть свои изменения.
+    Сессии создаются при первом обращении, поэтому запрос, ответ на который нашёлся в кеше,
+    не создаёт их вовсе, а execute_read отдаёт соединение обратно в пул сразу после чтения.
+    """
+
+    def __init__(self, primary: Callable[[], AsyncSession], replica: Callable[[], AsyncSession] | None = None):
+        self._primary_factory = primary
+        self._replica_factory = replica
+        self._primary: AsyncSession | None = None
+        self._replica: AsyncSession | None = None
+        self._pinned = False
+
+    @property
+    def read(self) -> AsyncSession:
+        if self._pinned or self._replica_factory is None:
+            return self._get_primary()
+        if self._replica is None:
+            self._replica = self._replica_factory()
+        return self._replica
+
+    @property
+    def write(self) -> AsyncSession:
+        self._pinned = True
+        return self._get_primary()
+
+    async def execute_read[T: tuple[Any, ...]](self, statement: TypedReturnsRows[T]) -> Result[T]:
+        """Выполняет чтение и сразу возвращает соединение в пул.
+
+        Строки результата AsyncSession.execute уже прочитаны, а связи загружаются в том же запросе,
+        поэтому возвращённые объекты остаются пригодными и после закрытия сессии.
+        """
+        session = self.read
+        try:
+            result: Result[T] = await session.execute(statement)
+            return result
+        finally:
+            # Закрытая сессия снова готова к работе: следующий запрос возьмёт соединение заново
+            await session.close()
+
+    async def close(self) -> None:
+        for session in (self._primary, self._replica):
+            if session is not None:
+                await session.close()
+
+    def _get_primary(self) -> AsyncSession:
+        if self._primary is None:
+            self._primary = self._primary_factory()
+        return self._primary
+
+
+class SessionsFactory:
+    """Создаёт DatabaseSessions — для запроса и для загрузок, которые живут дольше запроса.
+
+    Сразу после записи реплика может её ещё не содержать. Ответ, собранный из реплики, закешировался бы
+    под новой версией и отдавался бы (и подтверждался через 304) до следующей записи — поэтому
+    в течение max_lag секунд после изменения данных чтение идёт в основную БД.
+    """
+
+    def __init__(
+        self,
+        primary: async_sessionmaker[AsyncSession],
+        replica: async_sessionmaker[AsyncSession] | None,
+        data_version: DataVersion,
+        max_lag: float,
+    ):
+        self._primary = primary
+        self._replica = replica
+        self._data_version = data_version
+        self.max_lag = max_lag
+
+    def __call__(self) -> DatabaseSessions:
+        use_replica = self._replica is not None and not self._data_version.changed_within(self.max_lag)
+        return DatabaseSessions(self._primary, self._replica if use_replica else None)
+
+    async def run[T](self, call: Callable[[DatabaseSessions], Awaitable[T]]) -> T:
+        """Выполняет call со своими сессиями и закрывает их, не завися от сессий запроса."""
+        sessions = self()
+        try:
+            return await call(sessions)
+        finally:
+            await sessions.close()
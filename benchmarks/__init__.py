@@ -0,0 +1,21 @@
+"""Нагрузочные замеры HTTP API.
+
+Запуск: python -m benchmarks.run --help
+"""
+
+import os
+
+# Бенчмарк не должен упираться в лимитер и требовать Redis, а для sqlite — настройки PostgreSQL
+for _name, _value in {
+    "POSTGRES_USER": "postgres",
+    "POSTGRES_PASSWORD": "postgres",
+    "HOST_DB": "localhost",
+    "PORT_DB": "5432",
+    "POSTGRES_DB": "currency_exchange_db",
+    "DB_SCALE": "6",
+    "DB_INTEGER_DIGITS": "15",
+    "REDIS_ENABLED": "false",
+    "RATE_LIMITER_BACKEND": "memory",
+    "REDIS_TIMES": "1000000000",
+}.items():
+    os.environ.setdefault(_name, _value)
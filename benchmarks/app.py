@@ -0,0 +1,44 @@
+import os
+import re
+from collections.abc import Mapping
+
+from dishka import Scope, provide
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.app_factory import create_app
+from app.config import settings
+from app.dependencies import MyProvider
+from app.engine import engine_options
+from app.instrumentation import instrument_engine
+
+DATABASE_URL_ENV = "BENCHMARK_DATABASE_URL"
+_SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def create_engine(database_url: str) -> AsyncEngine:
+    if database_url.startswith("sqlite"):
+        return create_async_engine(database_url)
+    return create_async_engine(database_url, **engine_options(settings))
+
+
+class BenchmarkProvider(MyProvider):
+    def __init__(self, database_url: str):
+        super().__init__()
+        self._database_url = database_url
+
+    @provide(scope=Scope.APP)
+    def get_engine(self) -> AsyncEngine:
+        engine = create_engine(self._database_url)
+        instrument_engine(engine)
+        return engine
+
+
+def query_count(headers: Mapping[str, str]) -> int | None:
+    """Число SQL-запросов из заголовка Server-Timing, который выставляет приложение."""
+    match = _SERVER_TIMING_QUERIES.search(headers.get("server-timing", ""))
+    return None if match is None else int(match.group(1))
+
+
+def create_benchmark_app(database_url: str | None = None) -> FastAPI:
+    return create_app(BenchmarkProvider(database_url or os.environ[DATABASE_URL_ENV]))
@@ -0,0 +1,25 @@
+import argparse
+import json
+from pathlib import Path
+
+METRICS = ("rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сравнение двух результатов benchmarks.run")
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("candidate", type=Path)
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text())["results"]
+    candidate = json.loads(args.candidate.read_text())["results"]
+    print(f"{'scenario':<16}{'metric':<22}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    for name in [name for name in baseline if name in candidate]:
+        for metric in METRICS:
+            old, new = baseline[name][metric], candidate[name][metric]
+            change = f"{(new - old) / old:+.1%}" if old and new is not None else "-"
+            print(f"{name:<16}{metric:<22}{old!s:>12}{new!s:>12}{change:>10}")
+
+
+if __name__ == "__main__":
+    main()
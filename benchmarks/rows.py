@@ -0,0 +1,129 @@
+"""Сравнение чтения списков через ORM-объекты и через запросы Core по нужным колонкам.
+
+Запуск: python -m benchmarks.rows --currencies 2000 --direct-pairs 20000
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Awaitable, Callable, Sequence
+from typing import Any
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import joinedload
+
+from app.cache.data_version import DataVersion
+from app.cache.response_cache import dump_json_list
+from app.models.currency import Currency
+from app.models.exchangerate import ExchangeRate
+from app.repositories.currency_repository import CurrencyRepository
+from app.repositories.exchangerate_repository import ExchangeRateRepository
+from app.schemas import CurrencyResponse, ExchangeRateResponse
+from app.sessions import DatabaseSessions
+from benchmarks.app import create_engine
+from benchmarks.seed import seed_database
+
+Load = Callable[[], Awaitable[Sequence[Any]]]
+
+
+async def _measure(load: Load, adapter: TypeAdapter[Any], repeat: int) -> dict[str, float]:
+    """Лучшее время чтения и сериализации на строку и пик памяти на строку."""
+    best = float("inf")
+    rows = 0
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = await load()
+        dump_json_list(result, adapter)
+        best = min(best, time.perf_counter() - started)
+        rows = len(result)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = await load()
+    dump_json_list(result, adapter)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"rows": rows, "us_per_row": round(best / rows * 1e6, 2), "bytes_per_row": round(peak / rows)}
+
+
+async def run(args: argparse.Namespace) -> dict[str, dict[str, dict[str, float]]]:
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(directory, 'rows.sqlite')}"
+        engine = create_engine(database_url)
+        try:
+            await seed_database(engine, args.currencies, args.direct_pairs, args.seed)
+            sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+
+            def orm(query: Any) -> Load:
+                # Прежний путь: ORM-объекты в identity map с загрузкой связей
+                async def load() -> Sequence[Any]:
+                    session: AsyncSession
+                    async with sessionmaker() as session:
+                        return (await session.execute(query)).scalars().unique().all()
+
+                return load
+
+            def core(method: Callable[[DatabaseSessions], Awaitable[Sequence[Any]]]) -> Load:
+                async def load() -> Sequence[Any]:
+                    sessions = DatabaseSessions(sessionmaker)
+                    try:
+                        return await method(sessions)
+                    finally:
+                        await sessions.close()
+
+                return load
+
+            currencies = TypeAdapter(list[CurrencyResponse])
+            exchangerates = TypeAdapter(list[ExchangeRateResponse])
+            exchangerates_query = select(ExchangeRate).options(
+                joinedload(ExchangeRate.base_currency), joinedload(ExchangeRate.target_currency)
+            )
+            return {
+                "currencies": {
+                    "orm": await _measure(orm(select(Currency)), currencies, args.repeat),
+                    "core": await _measure(
+                        core(lambda sessions: CurrencyRepository(sessions, DataVersion()).get_all()),
+                        currencies,
+                        args.repeat,
+                    ),
+                },
+                "exchangerates": {
+                    "orm": await _measure(orm(exchangerates_query), exchangerates, args.repeat),
+                    "core": await _measure(
+                        core(lambda sessions: ExchangeRateRepository(sessions, DataVersion()).get_all()),
+                        exchangerates,
+                        args.repeat,
+                    ),
+                },
+            }
+        finally:
+            await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Чтение списков через ORM и через Core: время и память на строку")
+    parser.add_argument("--database-url", help="по умолчанию — файл sqlite во временном каталоге")
+    parser.add_argument("--currencies", type=int, default=2000)
+    parser.add_argument("--direct-pairs", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    columns = ("rows", "us_per_row", "bytes_per_row")
+    print(f"{'list':<16}{'path':<8}" + "".join(f"{column:>16}" for column in columns))
+    for name, paths in report.items():
+        for path, summary in paths.items():
+            print(f"{name:<16}{path:<8}" + "".join(f"{summary[column]!s:>16}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
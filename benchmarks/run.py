@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import httpx
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from benchmarks.app import DATABASE_URL_ENV, create_benchmark_app, create_engine, query_count
+from benchmarks.seed import seed_database
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+RequestSpec = tuple[str, str, dict[str, Any]]
+RequestFactory = Callable[[random.Random], RequestSpec]
+
+
+def _scenarios(pairs: list[tuple[str, str]]) -> dict[str, RequestFactory]:
+    codes = sorted({code for pair in pairs for code in pair})
+
+    def exchange(generator: random.Random) -> RequestSpec:
+        # Половина запросов — по сохранённым парам, остальные — обратные и кросс-курсы через USD
+        if generator.random() < 0.5:
+            from_, to = generator.choice(pairs)
+        else:
+            from_, to = generator.sample(codes, 2)
+        return "GET", "/exchange", {"params": {"from": from_, "to": to, "amount": generator.randint(1, 1000)}}
+
+    def exchange_rates(generator: random.Random) -> RequestSpec:
+        return "GET", "/exchangeRates", {}
+
+    def exchange_rate(generator: random.Random) -> RequestSpec:
+        base, target = generator.choice(pairs)
+        return "GET", f"/exchangeRate/{base}{target}", {}
+
+    def write(generator: random.Random) -> RequestSpec:
+        base, target = generator.choice(pairs)
+        return "PATCH", f"/exchangeRate/{base}{target}", {"data": {"rate": str(generator.randint(1, 10**6) / 100)}}
+
+    return {"exchange": exchange, "exchange_rates": exchange_rates, "exchange_rate": exchange_rate, "write": write}
+
+
+@dataclass
+class ScenarioResult:
+    latencies: list[float] = field(default_factory=list)
+    queries: list[int] = field(default_factory=list)
+    errors: int = 0
+    seconds: float = 0
+
+    def summary(self) -> dict[str, float | int | None]:
+        latencies = sorted(self.latencies)
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "rps": round(len(latencies) / self.seconds, 1) if self.seconds else 0,
+            "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "p99_ms": _percentile(latencies, 99),
+            "max_ms": round(latencies[-1], 3) if latencies else None,
+            "queries_per_request": round(sum(self.queries) / len(self.queries), 2) if self.queries else None,
+        }
+
+
+def _percentile(sorted_values: list[float], percent: float) -> float | None:
+    if not sorted_values:
+        return None
+    # Метод ближайшего ранга: значение, которое не превышают percent% замеров
+    rank = max(int(len(sorted_values) * percent / 100 + 0.999999) - 1, 0)
+    return round(sorted_values[rank], 3)
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, factory: RequestFactory, requests: int, concurrency: int, seed: int
+) -> ScenarioResult:
+    result = ScenarioResult()
+    remaining = iter(range(requests))
+
+    async def worker(number: int) -> None:
+        generator = random.Random(seed * 1000 + number)
+        for _ in remaining:
+            method, url, options = factory(generator)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **options)
+                await response.aread()
+            except Exception:
+                # Обрыв соединения или исключение приложения (ASGI-транспорт пробрасывает его как есть)
+                # считаем ошибкой запроса, а не поводом прервать весь замер
+                logger.debug("Запрос %s %s завершился исключением", method, url, exc_info=True)
+                result.latencies.append((time.perf_counter() - started) * 1000)
+                result.errors += 1
+                continue
+            result.latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                result.errors += 1
+            if (queries := query_count(response.headers)) is not None:
+                result.queries.append(queries)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+@asynccontextmanager
+async def asgi_client(database_url: str) -> AsyncIterator[httpx.AsyncClient]:
+    app = create_benchmark_app(database_url)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+            yield client
+    finally:
+        # Провайдер не закрывает движок сам, а без dispose потоки aiosqlite не дают процессу завершиться
+        engine = await app.state.dishka_container.get(AsyncEngine)
+        await engine.dispose()
+        await app.state.dishka_container.close()
+
+
+@asynccontextmanager
+async def uvicorn_client(database_url: str, workers: int) -> AsyncIterator[httpx.AsyncClient]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "benchmarks.app:create_benchmark_app",
+        "--factory",
+        "--port",
+        str(port),
+        "--workers",
+        str(workers),
+        "--log-level",
+        "warning",
+        env={**os.environ, DATABASE_URL_ENV: database_url},
+    )
+    try:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            async with asyncio.timeout(30):
+                await _wait_until_ready(client, server)
+            yield client
+    finally:
+        if server.returncode is None:
+            server.terminate()
+        await server.wait()
+
+
+async def _wait_until_ready(client: httpx.AsyncClient, server: asyncio.subprocess.Process) -> None:
+    while True:
+        if server.returncode is not None:
+            raise RuntimeError("Сервер uvicorn завершился при запуске")
+        try:
+            await client.get("/openapi.json")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    database_url = args.database_url or f"sqlite+aiosqlite:///{Path(tempfile.gettempdir()) / 'benchmark.sqlite3'}"
+    engine = create_engine(database_url)
+    pairs = await seed_database(engine, args.currencies, args.direct_pairs, args.seed)
+    await engine.dispose()
+
+    scenarios = _scenarios(pairs)
+    selected = args.scenarios or list(scenarios)
+    client_factory = (
+        asgi_client(database_url) if args.transport == "asgi" else uvicorn_client(database_url, args.workers)
+    )
+    results = {}
+    async with client_factory as client:
+        for name in selected:
+            await run_scenario(client, scenarios[name], args.warmup, args.concurrency, args.seed)
+            result = await run_scenario(client, scenarios[name], args.requests, args.concurrency, args.seed)
+            results[name] = result.summary()
+            logger.info("%s: %s", name, results[name])
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now(UTC).isoformat(),
+            "transport": args.transport,
+            "workers": args.workers if args.transport == "uvicorn" else None,
+            "database": database_url.split("://", 1)[0],
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "currencies": args.currencies,
+            "direct_pairs": args.direct_pairs,
+            "seed": args.seed,
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+
+
+def _print_table(report: dict[str, Any]) -> None:
+    columns = ("rps", "p50_ms", "p95_ms", "p99_ms", "errors", "queries_per_request")
+    print(f"{'scenario':<16}" + "".join(f"{column:>21}" for column in columns))
+    for name, summary in report["results"].items():
+        print(f"{name:<16}" + "".join(f"{summary[column]!s:>21}" for column in columns))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный замер эндпоинтов API")
+    parser.add_argument("--transport", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--database-url", help="по умолчанию — файл sqlite во временном каталоге")
+    parser.add_argument("--scenarios", nargs="+", choices=("exchange", "exchange_rates", "exchange_rate", "write"))
+    parser.add_argument("--requests", type=int, default=2000, help="запросов на сценарий")
+    parser.add_argument("--warmup", type=int, default=50, help="прогревочных запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--currencies", type=int, default=50)
+    parser.add_argument("--direct-pairs", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="по умолчанию — benchmarks/results/<commit>-<transport>.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = asyncio.run(run(args))
+    _print_table(report)
+
+    output = args.output or RESULTS_DIR / f"{(report['meta']['commit'] or 'local')[:12]}-{args.transport}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Результаты сохранены в {output}")
+
+
+if __name__ == "__main__":
+    main()
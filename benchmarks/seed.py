@@ -0,0 +1,64 @@
+import random
+from decimal import Decimal
+from itertools import product
+from string import ascii_uppercase
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.database import Base
+from app.models.currency import Currency
+from app.models.exchangerate import ExchangeRate
+from app.models.exchangerate_candle import ExchangeRateCandle
+from app.models.exchangerate_history import ExchangeRateHistory
+
+# Все модели должны быть импортированы до create_all
+MODELS = (Currency, ExchangeRate, ExchangeRateHistory, ExchangeRateCandle)
+
+
+def currency_codes(count: int) -> list[str]:
+    codes = ["USD"]
+    for letters in product(ascii_uppercase, repeat=3):
+        if len(codes) >= count:
+            break
+        code = "".join(letters)
+        if code != "USD":
+            codes.append(code)
+    return codes
+
+
+def seeded_pairs(codes: list[str], direct_pairs: int, seed: int) -> list[tuple[str, str]]:
+    """Курс USD к каждой валюте и несколько случайных прямых пар без USD."""
+    pairs = [("USD", code) for code in codes[1:]]
+    others = [(base, target) for base, target in product(codes[1:], repeat=2) if base != target]
+    pairs += random.Random(seed).sample(others, min(direct_pairs, len(others)))
+    return pairs
+
+
+async def seed_database(engine: AsyncEngine, currencies: int, direct_pairs: int, seed: int) -> list[tuple[str, str]]:
+    """Пересоздаёт схему и заполняет её одинаковыми при одинаковом seed данными."""
+    codes = currency_codes(currencies)
+    pairs = seeded_pairs(codes, direct_pairs, seed)
+    generator = random.Random(seed)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        # id не задаём явно, чтобы последовательность в PostgreSQL осталась согласованной с таблицей
+        created = await conn.execute(
+            insert(Currency).returning(Currency.id, Currency.code, sort_by_parameter_order=True),
+            [{"code": code, "name": f"Currency {code}", "sign": code[0]} for code in codes],
+        )
+        ids = {code: currency_id for currency_id, code in created.all()}
+        await conn.execute(
+            insert(ExchangeRate),
+            [
+                {
+                    "base_currency_id": ids[base],
+                    "target_currency_id": ids[target],
+                    "rate": Decimal(generator.randint(1, 10_000_000)) / 10_000,
+                }
+                for base, target in pairs
+            ],
+        )
+    return pairs
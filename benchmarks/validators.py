@@ -0,0 +1,61 @@
+"""Микробенчмарк валидаторов входных данных: кодов валют, сумм и курсов.
+
+Запуск: python -m benchmarks.validators --number 20000
+"""
+
+import argparse
+import timeit
+from collections.abc import Callable
+from typing import Any
+
+from pydantic import TypeAdapter
+
+from app.cache.rate_cache import RateSnapshot
+from app.schemas import CurrencyCode, CurrencyResponse, ExchangeBatchItem, ExchangeRateSchema, InputDecimal
+
+_codes = TypeAdapter(CurrencyCode)
+_decimals = TypeAdapter(InputDecimal)
+_snapshot = RateSnapshot.build(
+    [
+        CurrencyResponse(id=i, name="Currency", code=f"A{chr(65 + i // 26)}{chr(65 + i % 26)}", sign="$")
+        for i in range(500)
+    ],
+    [],
+)
+
+CASES: dict[str, Callable[[], Any]] = {
+    "code": lambda: _codes.validate_python(" usd "),
+    "decimal": lambda: _decimals.validate_python("123.45"),
+    "decimal_comma": lambda: _decimals.validate_python("1,5"),
+    "decimal_min": lambda: _decimals.validate_python("0.000001"),
+    # Лишние знаки после запятой — нули: единственный случай, где нужен normalize
+    "decimal_trailing_zeros": lambda: _decimals.validate_python("1.50000000"),
+    "batch_item": lambda: ExchangeBatchItem.model_validate({"from": "usd", "to": "rub", "amount": "10.5"}),
+    "exchangerate": lambda: ExchangeRateSchema.model_validate(
+        {"baseCurrencyCode": "USD", "targetCurrencyCode": "RUB", "rate": "77.75"}
+    ),
+    "known_code": lambda: "AAZ" in _snapshot.currencies,
+    "unknown_code": lambda: "ZZZ" in _snapshot.currencies,
+}
+
+
+def run(number: int, repeat: int) -> dict[str, float]:
+    """Лучшее время одного вызова в наносекундах для каждого случая."""
+    return {
+        name: round(min(timeit.repeat(case, number=number, repeat=repeat)) / number * 1e9)
+        for name, case in CASES.items()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Время валидации кодов валют и сумм, нс на вызов")
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, ns in run(args.number, args.repeat).items():
+        print(f"{name:<24}{ns:>10} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,13 @@ from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from app.app_factory import create_app
 from app.database import Base
 from app.dependencies import MyProvider
+from app.instrumentation import instrument_engine
 from app.repositories.currency_repository import CurrencyRepository
 from app.repositories.exchangerate_repository import ExchangeRateRepository
 from app.schemas import CurrencySchema, ExchangeRateSchema
 from app.service.currency_service import CurrencyService
 from app.service.exchange_service import ExchangeService
+from app.service.exchangerate_service import ExchangeRateService
 
 
 @pytest.fixture
@@ -25,7 +27,9 @@ def test_app() -> FastAPI:
 class MockMyProvider(MyProvider):
     @provide(scope=Scope.APP)
     def get_engine(self) -> AsyncEngine:
-        return create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+        instrument_engine(engine)
+        return engine
 
 
 @pytest.fixture()
@@ -48,6 +52,13 @@ async def currency_service(container, test_app):
         yield service
 
 
+@pytest.fixture
+async def exchangerate_service(container, test_app):
+    async with container() as mini_container:
+        service = await mini_container.get(ExchangeRateService)
+        yield service
+
+
 @pytest.fixture
 async def container(test_app):
     mock_container = make_async_container(MockMyProvider())
@@ -1,5 +1,20 @@
+import json
+import logging
+import re
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime
+
 import pytest
 from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app import metrics
+from app.config import settings
+from app.lifespan import warm_up
+from app.models.exchangerate_history import ExchangeRateHistory
+from app.repositories.currency_repository import CurrencyRepository
+from app.repositories.exchangerate_repository import ExchangeRateRepository
+from app.schemas import CurrencySchema, ExchangeRateSchema
 
 
 @pytest.mark.anyio
@@ -77,3 +92,351 @@ async def test_add_already_existent_currency(client: AsyncClient, usd_currency)
     assert response.status_code == 409
     assert "message" in response.json()
     assert "Валюта с таким кодом уже существует" in response.json()["message"]
+
+
+@pytest.mark.anyio
+async def test_exchange_batch(client: AsyncClient, exchange_rate_usd_rub, exchange_rate_usd_eur) -> None:
+    items = [{"from": "USD", "to": "RUB", "amount": 2}, {"from": "EUR", "to": "RUB", "amount": 24}]
+    response = await client.post("/exchange/batch", json=items)
+    assert response.status_code == 200
+    assert response.json()[0]["convertedAmount"] == 155.5
+    assert response.json()[1]["convertedAmount"] == 2195.294118
+
+
+@pytest.mark.anyio
+async def test_exchange_batch_ndjson(client: AsyncClient, exchange_rate_usd_rub) -> None:
+    body = '{"from": "USD", "to": "RUB", "amount": 1}\n{"from": "RUB", "to": "USD", "amount": 77.75}\n'
+    response = await client.post("/exchange/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["convertedAmount"] for line in lines] == [77.75, 1]
+
+
+@pytest.mark.anyio
+async def test_exchange_batch_ndjson_stops_reading_over_limit(client: AsyncClient, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "exchange_batch_max_items", 2)
+    sent = 0
+
+    async def lines() -> AsyncIterator[bytes]:
+        nonlocal sent
+        for _ in range(100):
+            sent += 1
+            yield b'{"from": "USD", "to": "RUB", "amount": 1}\n'
+
+    response = await client.post("/exchange/batch", content=lines(), headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 400
+    # Тело разбирается по мере поступления: после третьего элемента дальше его не читаем
+    assert sent == 3
+
+
+@pytest.mark.anyio
+async def test_exchange_batch_unknown_pair(client: AsyncClient, exchange_rate_usd_rub) -> None:
+    response = await client.post("/exchange/batch", json=[{"from": "USD", "to": "GBP", "amount": 1}])
+    assert response.status_code == 404
+    assert "USDGBP" in response.json()["message"]
+
+
+@pytest.mark.anyio
+async def test_exchange_batch_loads_stale_pairs_in_one_query(
+    client: AsyncClient, container, usd_currency, eur_currency, exchange_rate_usd_rub
+) -> None:
+    assert (await client.get("/exchange?from=USD&to=RUB&amount=1")).status_code == 200
+    # Курс добавлен в обход кеша — в загруженном снимке его нет
+    async with container() as mini_container:
+        rep = await mini_container.get(ExchangeRateRepository)
+        rate = ExchangeRateSchema.model_validate({"baseCurrencyCode": "USD", "targetCurrencyCode": "EUR", "rate": 0.85})
+        await rep.add_exchangerate(rate, usd_currency.id, eur_currency.id)
+
+    items = [
+        {"from": "EUR", "to": "RUB", "amount": 24},
+        {"from": "USD", "to": "EUR", "amount": 1},
+        {"from": "EUR", "to": "USD", "amount": 1},
+    ]
+    response = await client.post("/exchange/batch", json=items)
+    assert response.status_code == 200
+    assert [item["convertedAmount"] for item in response.json()] == [2195.294118, 0.85, 1.176471]
+    assert 'desc="1 queries"' in response.headers["server-timing"]
+
+
+@pytest.mark.anyio
+async def test_post_exchange_rate_unknown_currency(client: AsyncClient, usd_currency) -> None:
+    form_data = {"baseCurrencyCode": "USD", "targetCurrencyCode": "GBP", "rate": 120}
+    response = await client.post("/exchangeRates", data=form_data)
+    assert response.status_code == 404
+    assert "Одна (или обе) валюта из валютной пары не существует в БД" in response.json()["message"]
+
+
+@pytest.mark.anyio
+async def test_patch_non_existent_exchange_rate(client: AsyncClient, usd_currency, rub_currency) -> None:
+    response = await client.patch("exchangeRate/USDRUB", data={"rate": 10})
+    assert response.status_code == 404
+    assert "Валютная пара отсутствует в базе данных" in response.json()["message"]
+
+
+@pytest.mark.anyio
+async def test_bulk_upsert_exchange_rates(client: AsyncClient, exchange_rate_usd_rub, eur_currency) -> None:
+    items = [
+        {"baseCurrencyCode": "USD", "targetCurrencyCode": "RUB", "rate": 80},
+        {"baseCurrencyCode": "USD", "targetCurrencyCode": "EUR", "rate": 0.9},
+        {"baseCurrencyCode": "USD", "targetCurrencyCode": "GBP", "rate": 0.7},
+    ]
+    response = await client.post("/exchangeRates/bulk", json=items)
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()] == ["updated", "created", "currency_not_found"]
+
+    response = await client.get("/exchangeRate/USDRUB")
+    assert response.json()["rate"] == 80
+
+
+@pytest.mark.anyio
+async def test_bulk_upsert_exchange_rates_csv(client: AsyncClient, usd_currency, eur_currency) -> None:
+    body = "baseCurrencyCode,targetCurrencyCode,rate\nUSD,EUR,0.8\nUSD,EUR,0.85\n"
+    response = await client.post("/exchangeRates/bulk", content=body, headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()] == ["duplicate", "created"]
+
+    response = await client.get("/exchange", params={"from": "EUR", "to": "USD", "amount": 0.85})
+    assert response.json()["convertedAmount"] == 1
+
+
+@pytest.mark.anyio
+async def test_get_currencies_page(client: AsyncClient, usd_currency, eur_currency, rub_currency) -> None:
+    response = await client.get("/currencies", params={"limit": 2})
+    assert [currency["code"] for currency in response.json()] == ["USD", "EUR"]
+
+    after_id = response.headers["X-Next-After-Id"]
+    response = await client.get("/currencies", params={"after_id": after_id, "limit": 2})
+    assert [currency["code"] for currency in response.json()] == ["RUB"]
+    assert "X-Next-After-Id" not in response.headers
+
+
+@pytest.mark.anyio
+async def test_stream_exchange_rates(client: AsyncClient, exchange_rate_usd_eur, exchange_rate_usd_rub) -> None:
+    response = await client.get("/exchangeRates", params={"stream": True})
+    assert response.status_code == 200
+    assert [rate["targetCurrency"]["code"] for rate in response.json()] == ["EUR", "RUB"]
+    assert response.json()[1]["rate"] == 77.75
+
+
+@pytest.mark.anyio
+async def test_get_pool_status(client: AsyncClient) -> None:
+    response = await client.get("/internal/pool")
+    assert response.status_code == 200
+    assert response.json()["poolClass"] == "StaticPool"
+
+
+@pytest.mark.anyio
+async def test_exchange_rates_not_modified(client: AsyncClient, exchange_rate_usd_rub) -> None:
+    response = await client.get("/exchangeRates")
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"].startswith("public")
+    assert "last-modified" in response.headers
+
+    not_modified = await client.get("/exchangeRates", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+
+    await client.patch("/exchangeRate/USDRUB", data={"rate": "80"})
+    changed = await client.get("/exchangeRates", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+@pytest.mark.anyio
+async def test_cached_list_matches_response_model(
+    client: AsyncClient, exchange_rate_usd_eur, exchange_rate_usd_rub
+) -> None:
+    cached = await client.get("/exchangeRates")
+    again = await client.get("/exchangeRates")
+    serialized = await client.get("/exchangeRates", params={"limit": 100})
+    assert cached.content == again.content
+    assert cached.json() == serialized.json()
+
+    await client.get("/currencies")
+    await client.post("/currencies", data={"name": "Pound Sterling", "code": "GBP", "sign": "£"})
+    currencies = await client.get("/currencies")
+    assert "GBP" in {currency["code"] for currency in currencies.json()}
+
+
+@pytest.mark.anyio
+async def test_memory_rate_limiter(client: AsyncClient, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "rate_limiter_backend", "memory")
+    for _ in range(settings.redis_times):
+        response = await client.post("/currencies", data={"name": "Currency", "code": "AAA", "sign": "$"})
+        assert response.status_code != 429
+
+    response = await client.post("/currencies", data={"name": "Currency", "code": "AAA", "sign": "$"})
+    assert response.status_code == 429
+    assert "retry-after" in response.headers
+
+
+@pytest.mark.anyio
+async def test_exchange_at_historical_timestamp(client: AsyncClient, container, exchange_rate_usd_rub) -> None:
+    sessionmaker = await container.get(async_sessionmaker[AsyncSession])
+    async with sessionmaker() as session:
+        usd_id, rub_id = 1, 2
+        session.add_all(
+            [
+                ExchangeRateHistory(
+                    base_currency_id=usd_id,
+                    target_currency_id=rub_id,
+                    rate=50,
+                    valid_from=datetime(2020, 1, 1, tzinfo=UTC),
+                ),
+                ExchangeRateHistory(
+                    base_currency_id=usd_id,
+                    target_currency_id=rub_id,
+                    rate=60,
+                    valid_from=datetime(2021, 1, 1, tzinfo=UTC),
+                ),
+            ]
+        )
+        await session.commit()
+
+    params = {"from": "USD", "to": "RUB", "amount": "10"}
+    response = await client.get("/exchange", params={**params, "at": "2020-06-01T00:00:00Z"})
+    assert response.status_code == 200
+    assert response.json()["rate"] == 50
+
+    response = await client.get(
+        "/exchange", params={"from": "RUB", "to": "USD", "amount": "10", "at": "2021-06-01T03:00:00+03:00"}
+    )
+    assert response.json()["rate"] == round(1 / 60, 6)
+
+    response = await client.get("/exchange", params={**params, "at": "2019-01-01T00:00:00Z"})
+    assert response.status_code == 404
+
+    response = await client.get("/exchange", params=params)
+    assert response.json()["rate"] == 77.75
+
+
+@pytest.mark.anyio
+async def test_exchange_at_uses_multi_hop_path(
+    client: AsyncClient, exchange_rate_usd_rub, exchange_rate_usd_eur
+) -> None:
+    await client.post("/currencies", data={"name": "Tenge", "code": "KZT", "sign": "₸"})
+    await client.post("/exchangeRates", data={"baseCurrencyCode": "RUB", "targetCurrencyCode": "KZT", "rate": "5"})
+
+    params = {"from": "EUR", "to": "KZT", "amount": "1"}
+    current = await client.get("/exchange", params=params)
+    historical = await client.get("/exchange", params={**params, "at": "2100-01-01T00:00:00Z"})
+
+    assert historical.status_code == 200
+    assert historical.json()["rate"] == current.json()["rate"]
+    assert historical.json()["baseCurrency"]["code"] == "EUR"
+    assert historical.json()["targetCurrency"]["code"] == "KZT"
+
+
+@pytest.mark.anyio
+async def test_exchange_rate_candles(client: AsyncClient, exchange_rate_usd_rub) -> None:
+    await client.patch("/exchangeRate/USDRUB", data={"rate": "80"})
+    await client.patch("/exchangeRate/USDRUB", data={"rate": "70"})
+
+    response = await client.get("/exchangeRate/USDRUB/candles", params={"interval": "day"})
+    assert response.status_code == 200
+    candles = response.json()
+    assert sum(candle["samples"] for candle in candles) == 3
+    assert max(candle["high"] for candle in candles) == 80
+    assert min(candle["low"] for candle in candles) == 70
+    assert candles[0]["open"] == 77.75
+    assert candles[-1]["close"] == 70
+
+    response = await client.get("/exchangeRate/USDEUR/candles")
+    assert response.json() == []
+
+
+@pytest.mark.anyio
+async def test_server_timing_counts_queries(client: AsyncClient, exchange_rate_usd_rub) -> None:
+    response = await client.get("/exchangeRate/USDRUB")
+    assert response.status_code == 200
+    assert re.search(r'db;dur=[\d.]+;desc="1 queries", total;dur=[\d.]+', response.headers["server-timing"])
+
+
+@pytest.mark.anyio
+async def test_cached_conversion_is_purged_when_rate_changes(client: AsyncClient, exchange_rate_usd_rub) -> None:
+    # Загрузка снимка курсов сбрасывает кеш конвертаций, поэтому снимок загружаем заранее
+    await client.get("/exchange?from=USD&to=RUB&amount=1")
+    url = "/exchange?from=RUB&to=USD&amount=155.5"
+    assert (await client.get(url)).json()["rate"] == pytest.approx(1 / 77.75, abs=1e-6)
+    hits = metrics.cache_requests.value("conversions", "hit")
+    assert (await client.get(url)).json()["rate"] == pytest.approx(1 / 77.75, abs=1e-6)
+    assert metrics.cache_requests.value("conversions", "hit") == hits + 1
+
+    await client.patch("/exchangeRate/USDRUB", data={"rate": "80"})
+    response = await client.get(url)
+    assert response.json()["rate"] == pytest.approx(1 / 80, abs=1e-6)
+    assert response.json()["convertedAmount"] == pytest.approx(155.5 / 80, abs=1e-6)
+
+
+@pytest.mark.anyio
+async def test_unknown_currency_is_rejected_without_query(client: AsyncClient, exchange_rate_usd_rub) -> None:
+    # Валюту мог добавить другой воркер, поэтому отсутствие в снимке проверяется по БД,
+    # а код, которого нет и в БД, какое-то время отсекается без запроса к ней
+    assert (await client.get("/exchange?from=USD&to=RUB&amount=1")).status_code == 200
+    response = await client.get("/currency/XYZ")
+    assert response.status_code == 404
+    assert 'desc="1 queries"' in response.headers["server-timing"]
+
+    for url in ("/currency/XYZ", "/exchangeRate/USDXYZ", "/exchange?from=USD&to=XYZ&amount=1"):
+        response = await client.get(url)
+        assert response.status_code == 404
+        assert 'desc="0 queries"' in response.headers["server-timing"]
+
+
+@pytest.mark.anyio
+async def test_currency_added_by_other_worker_is_found(client: AsyncClient, container, exchange_rate_usd_rub) -> None:
+    assert (await client.get("/exchange?from=USD&to=RUB&amount=1")).status_code == 200
+
+    # Запись в обход кеша этого воркера — как если бы валюту добавил другой воркер
+    async with container() as mini_container:
+        rep = await mini_container.get(CurrencyRepository)
+        await rep.add_currency(CurrencySchema(name="Euro", code="EUR", sign="€"))
+
+    assert (await client.get("/currency/EUR")).status_code == 200
+    response = await client.post(
+        "/exchangeRates", data={"baseCurrencyCode": "EUR", "targetCurrencyCode": "RUB", "rate": "90"}
+    )
+    assert response.status_code == 201
+
+
+@pytest.mark.anyio
+async def test_slow_request_logs_statements(client: AsyncClient, usd_currency, monkeypatch, caplog) -> None:
+    monkeypatch.setattr(settings, "slow_request_threshold_ms", 0)
+    with caplog.at_level(logging.WARNING, logger="app.instrumentation"):
+        response = await client.get("/currency/USD")
+
+    assert response.status_code == 200
+    [record] = caplog.records
+    assert record.db_queries == 1
+    assert record.path == "/currency/USD"
+    assert "FROM currencies" in record.getMessage()
+
+
+@pytest.mark.anyio
+async def test_metrics(client: AsyncClient, exchange_rate_usd_rub) -> None:
+    await client.get("/exchange", params={"from": "RUB", "to": "USD", "amount": 10})
+    await client.get("/exchangeRate/USDRUB")
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_requests_total{method="GET",route="/exchangeRate/{codepair}",status="200"}' in response.text
+    assert 'exchange_conversions_total{path="reverse",source="cache"}' in response.text
+    assert 'db_pool_size{pool="primary"}' not in response.text
+
+
+@pytest.mark.anyio
+async def test_health_ready_after_warm_up(client: AsyncClient, test_app, exchange_rate_usd_rub) -> None:
+    assert (await client.get("/health/live")).json() == {"status": "ok"}
+    response = await client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json() == {"status": "starting"}
+
+    await warm_up(test_app)
+
+    response = await client.get("/health/ready")
+    assert response.status_code == 200
+    # Снимок курсов уже в памяти: конвертация не обращается к БД
+    response = await client.get("/exchange", params={"from": "USD", "to": "RUB", "amount": 1})
+    assert 'desc="0 queries"' in response.headers["server-timing"]
@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from app.cache.conversion_cache import ConversionCache
+from app.schemas import ConvertedExchangeRateResponse, CurrencyResponse
+
+USD = CurrencyResponse(id=1, name="US Dollar", code="USD", sign="$")
+RUB = CurrencyResponse(id=2, name="Russian Ruble", code="RUB", sign="R")
+
+
+def _converted(amount: str) -> ConvertedExchangeRateResponse:
+    return ConvertedExchangeRateResponse(
+        base_currency=USD,
+        target_currency=RUB,
+        rate=Decimal(80),
+        amount=Decimal(amount),
+        converted_amount=Decimal(amount) * 80,
+    )
+
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    cache = ConversionCache(ttl=60, max_entries=2)
+    for amount in ("1", "2"):
+        cache.put("USD", "RUB", Decimal(amount), _converted(amount), cache.generation)
+    assert cache.get("USD", "RUB", Decimal(1)) is not None
+
+    cache.put("USD", "RUB", Decimal(3), _converted("3"), cache.generation)
+    assert len(cache) == 2
+    assert cache.get("USD", "RUB", Decimal(2)) is None
+    assert cache.get("USD", "RUB", Decimal(1)) is not None
+
+
+def test_expired_entry_is_a_miss() -> None:
+    cache = ConversionCache(ttl=0, max_entries=10)
+    cache.put("USD", "RUB", Decimal(1), _converted("1"), cache.generation)
+    assert cache.get("USD", "RUB", Decimal(1)) is None
+    assert len(cache) == 0
+
+
+def test_rate_change_purges_only_dependent_pairs() -> None:
+    cache = ConversionCache(ttl=60, max_entries=10)
+    cache.put("USD", "RUB", Decimal(1), _converted("1"), cache.generation)
+    cache.put("RUB", "USD", Decimal(1), _converted("1"), cache.generation)
+    cache.put("EUR", "GBP", Decimal(1), _converted("1"), cache.generation)
+
+    cache.invalidate({("USD", "RUB"), ("RUB", "USD")})
+    assert cache.get("USD", "RUB", Decimal(1)) is None
+    assert cache.get("RUB", "USD", Decimal(1)) is None
+    assert cache.get("EUR", "GBP", Decimal(1)) is not None
+
+
+def test_result_computed_before_rate_change_is_not_stored() -> None:
+    cache = ConversionCache(ttl=60, max_entries=10)
+    generation = cache.generation
+    cache.invalidate({("USD", "RUB")})
+    cache.put("USD", "RUB", Decimal(1), _converted("1"), generation)
+    assert cache.get("USD", "RUB", Decimal(1)) is None
@@ -0,0 +1,44 @@
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+from app.engine import TimedQueuePool, engine_options, pool_status
+from app.lifespan import _open_connections
+
+
+def test_pgbouncer_mode_disables_statement_caches() -> None:
+    options = engine_options(settings.model_copy(update={"db_pgbouncer_mode": True}))
+    assert options["connect_args"]["statement_cache_size"] == 0
+    assert options["connect_args"]["prepared_statement_cache_size"] == 0
+
+
+@pytest.mark.anyio
+async def test_pool_status_counts_checkouts() -> None:
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=TimedQueuePool, pool_size=2)
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+        assert pool_status(engine).checked_out == 1
+
+    status = pool_status(engine)
+    assert status.checked_out == 0
+    assert status.wait_count == 1
+    await engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_warm_up_returns_opened_connections_when_one_fails(tmp_path) -> None:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite'}", poolclass=TimedQueuePool, pool_size=4)
+    connects = 0
+
+    @event.listens_for(engine.sync_engine, "do_connect")
+    def refuse_second(*args: object) -> None:
+        nonlocal connects
+        connects += 1
+        if connects == 2:
+            raise ConnectionRefusedError
+
+    with pytest.raises(ConnectionRefusedError):
+        await _open_connections(engine, 4)
+    assert pool_status(engine).checked_out == 0
+    await engine.dispose()
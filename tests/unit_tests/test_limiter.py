@@ -0,0 +1,35 @@
+from app.limiter import LocalRateLimiter
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_local_limiter_blocks_after_limit() -> None:
+    clock = FakeClock()
+    limiter = LocalRateLimiter(times=3, milliseconds=10_000, clock=clock)
+
+    assert [limiter.hit("127.0.0.1:/exchange") for _ in range(3)] == [0, 0, 0]
+    assert limiter.hit("127.0.0.1:/exchange") == 10_000
+    # У другого клиента свой счётчик
+    assert limiter.hit("10.0.0.1:/exchange") == 0
+
+
+def test_local_limiter_window_slides() -> None:
+    clock = FakeClock()
+    limiter = LocalRateLimiter(times=4, milliseconds=10_000, clock=clock)
+    for _ in range(4):
+        limiter.hit("client")
+
+    # Через половину следующего окна из предыдущего учитывается половина запросов
+    clock.now = 115.0
+    assert limiter.hit("client") == 0
+    assert limiter.hit("client") == 0
+    assert limiter.hit("client") > 0
+
+    clock.now = 200.0
+    assert limiter.hit("client") == 0
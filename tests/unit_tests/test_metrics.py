@@ -0,0 +1,33 @@
+from app import metrics
+from app.metrics import Counter, Histogram, render
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    histogram = Histogram("latency_seconds", "Задержка", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, "/exchange")
+
+    samples = {(suffix, labels): value for suffix, _, labels, value in histogram.samples()}
+    assert samples[("_bucket", ("/exchange", "0.1"))] == 2
+    assert samples[("_bucket", ("/exchange", "1"))] == 3
+    assert samples[("_bucket", ("/exchange", "+Inf"))] == 4
+    assert samples[("_count", ("/exchange",))] == 4
+    assert samples[("_sum", ("/exchange",))] == 3.65
+
+
+def test_counter_labels_are_escaped(monkeypatch) -> None:
+    counter = Counter("requests", "Запросы", ("route",))
+    counter.inc('/a"b\\c\nd')
+    counter.inc('/a"b\\c\nd', amount=2)
+    monkeypatch.setattr(metrics, "REGISTRY", (counter,))
+
+    assert list(counter.samples()) == [("_total", ("route",), ('/a"b\\c\nd',), 3)]
+    assert 'requests_total{route="/a\\"b\\\\c\\nd"} 3\n' in render()
+
+
+def test_render_exposes_registered_metrics() -> None:
+    text = render()
+
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert "# TYPE exchange_conversions counter" in text
+    assert "db_pool_size" not in text
@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+import pytest
+
+from app.cache.data_version import DataVersion
+from app.cache.rate_cache import RateCache
+from app.cache.redis_store import dump_exchangerate, load_exchangerate
+from app.schemas import CurrencyResponse, ExchangeRateResponse
+
+USD = CurrencyResponse(id=1, name="US Dollar", code="USD", sign="$")
+RUB = CurrencyResponse(id=2, name="Russian Ruble", code="RUB", sign="R")
+
+
+def _usd_rub(rate: str) -> ExchangeRateResponse:
+    return ExchangeRateResponse(id=1, base_currency=USD, target_currency=RUB, rate=Decimal(rate))
+
+
+def test_exchangerate_serialization_keeps_precision() -> None:
+    exchangerate = _usd_rub("123456789012345.123456")
+    assert load_exchangerate(dump_exchangerate(exchangerate)).rate == Decimal("123456789012345.123456")
+
+
+@pytest.mark.anyio
+async def test_message_from_other_worker_updates_snapshot() -> None:
+    rate_cache = RateCache(ttl=60)
+
+    async def loader() -> tuple[list[CurrencyResponse], list[ExchangeRateResponse]]:
+        return [USD, RUB], [_usd_rub("80")]
+
+    await rate_cache.get_snapshot(loader)
+    rate_cache.handle_message({"event": "exchangerates", "data": [dump_exchangerate(_usd_rub("90"))]})
+
+    snapshot = rate_cache.peek()
+    assert snapshot is not None
+    converted = snapshot.get_effective_rate("RUB", "USD")
+    assert converted is not None
+    assert converted.rate == 1 / Decimal(90)
+
+    rate_cache.handle_message({"event": "invalidate"})
+    assert rate_cache.peek() is None
+
+
+def test_message_from_other_worker_advances_data_version() -> None:
+    data_version = DataVersion(100)
+    rate_cache = RateCache(ttl=60, data_version=data_version)
+    etag = data_version.etag
+
+    rate_cache.handle_message({"event": "exchangerates", "data": [dump_exchangerate(_usd_rub("90"))], "version": 200})
+    assert data_version.value == 200
+    assert not data_version.matches(etag)
+
+    rate_cache.handle_message({"event": "currency", "data": USD.model_dump(), "version": 150})
+    assert data_version.value == 200
+    assert data_version.matches(f'W/{data_version.etag}, "other"')
+
+
+@pytest.mark.anyio
+async def test_knows_currency_trusts_absence_only_in_single_process() -> None:
+    async def loader() -> tuple[list[CurrencyResponse], list[ExchangeRateResponse]]:
+        return [USD, RUB], [_usd_rub("80")]
+
+    single = RateCache(ttl=60, single_process=True)
+    assert single.knows_currency("EUR") is None
+    await single.get_snapshot(loader)
+    assert single.knows_currency("USD") is True
+    assert single.knows_currency("EUR") is False
+
+    # Валюту мог добавить другой воркер — отсутствию в снимке верить нельзя, пока его не подтвердила БД
+    shared = RateCache(ttl=60, negative_ttl=60)
+    await shared.get_snapshot(loader)
+    assert shared.knows_currency("USD") is True
+    assert shared.knows_currency("EUR") is None
+
+    shared.remember_missing(["EUR"])
+    assert shared.knows_currency("EUR") is False
+    # Добавление валюты (своё или пришедшее от другого воркера) сразу снимает отметку
+    shared.handle_message({"event": "currency", "data": {"id": 3, "name": "Euro", "code": "EUR", "sign": "€"}})
+    assert shared.knows_currency("EUR") is True
@@ -0,0 +1,42 @@
+from decimal import Decimal
+
+from app.cache.rate_graph import CrossRateGraph
+
+
+def test_resolve_multi_hop_rate() -> None:
+    graph = CrossRateGraph({("EUR", "USD"): Decimal(2), ("USD", "RUB"): Decimal(80), ("RUB", "KZT"): Decimal(5)})
+
+    assert graph.path("EUR", "KZT") == ("EUR", "USD", "RUB", "KZT")
+    assert graph.resolve("EUR", "KZT") == Decimal(800)
+    assert graph.resolve("KZT", "EUR") == Decimal(1) / Decimal(800)
+    assert graph.resolve("EUR", "GBP") is None
+
+
+def test_pivot_preference_between_equal_paths() -> None:
+    rates = {
+        ("AAA", "EUR"): Decimal(1),
+        ("AAA", "USD"): Decimal(1),
+        ("EUR", "BBB"): Decimal(2),
+        ("USD", "BBB"): Decimal(3),
+    }
+
+    assert CrossRateGraph(rates, pivots=["USD"]).path("AAA", "BBB") == ("AAA", "USD", "BBB")
+    assert CrossRateGraph(rates, pivots=["EUR", "USD"]).path("AAA", "BBB") == ("AAA", "EUR", "BBB")
+
+
+def test_set_rate_recomputes_only_dependent_pairs() -> None:
+    graph = CrossRateGraph({("USD", "RUB"): Decimal(80), ("USD", "EUR"): Decimal(2), ("GBP", "CHF"): Decimal(1)})
+
+    affected = graph.set_rate("USD", "RUB", Decimal(100))
+
+    assert ("GBP", "CHF") not in affected
+    assert affected == {("USD", "RUB"), ("RUB", "USD"), ("EUR", "RUB"), ("RUB", "EUR")}
+    assert graph.resolve("EUR", "RUB") == Decimal(50)
+
+
+def test_sources_limit_precomputed_paths() -> None:
+    rates = {("EUR", "USD"): Decimal(2), ("USD", "RUB"): Decimal(80), ("RUB", "KZT"): Decimal(5)}
+    graph = CrossRateGraph(rates, sources=["EUR"])
+
+    assert graph.resolve("EUR", "KZT") == CrossRateGraph(rates).resolve("EUR", "KZT")
+    assert graph.resolve("KZT", "EUR") is None
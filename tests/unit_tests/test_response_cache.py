@@ -0,0 +1,42 @@
+import time
+
+import pytest
+
+from app.cache.data_version import DataVersion
+from app.cache.response_cache import ResponseCache
+
+
+@pytest.mark.anyio
+async def test_response_is_rebuilt_only_for_new_version() -> None:
+    response_cache = ResponseCache()
+    builds = 0
+
+    async def build() -> bytes:
+        nonlocal builds
+        builds += 1
+        return f"[{builds}]".encode()
+
+    assert await response_cache.get_or_build("currencies", 1, build) == b"[1]"
+    assert await response_cache.get_or_build("currencies", 1, build) == b"[1]"
+    assert await response_cache.get_or_build("currencies", 2, build) == b"[2]"
+
+    # Ответ, собранный по устаревшей версии, не вытесняет более свежий
+    response_cache.put("currencies", 1, b"[]")
+    assert response_cache.get("currencies", 2) == b"[2]"
+
+
+def test_unshared_data_version_expires_on_its_own(monkeypatch) -> None:
+    clock = 12_000_000_000
+    monkeypatch.setattr(time, "time_ns", lambda: clock)
+    shared = DataVersion(1)
+    local = DataVersion(1, refresh_every=5)
+    etag = local.etag
+    assert local.value == 10_000_000_000
+
+    # О записи в другом воркере этот воркер не узнает, но через refresh_every ETag всё равно сменится
+    clock = 16_000_000_000
+    assert local.etag != etag
+    assert local.value == 15_000_000_000
+    assert shared.value == 1
+
+    assert local.bump() == clock
@@ -0,0 +1,19 @@
+from decimal import Decimal
+
+from app.repositories.rows import exchangerate_rows
+from app.schemas import ExchangeRateResponse
+
+
+def test_exchangerate_rows_share_currencies_and_feed_response_model() -> None:
+    usd = (1, "US Dollar", "USD", "$")
+    rows = [
+        (1, Decimal("80.5"), *usd, 2, "Russian Ruble", "RUB", "R"),
+        (2, Decimal("0.9"), *usd, 3, "Euro", "EUR", "E"),
+    ]
+
+    first, second = exchangerate_rows(rows)  # type: ignore[arg-type]
+
+    assert first.base_currency is second.base_currency
+    response = ExchangeRateResponse.model_validate(first, from_attributes=True)
+    assert response.target_currency.code == "RUB"
+    assert response.rate == Decimal("80.5")
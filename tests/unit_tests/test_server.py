@@ -0,0 +1,40 @@
+import os
+import signal
+from itertools import count
+
+import pytest
+
+from app import server
+from app.config import settings
+
+
+def test_supervisor_gives_up_after_repeated_failures(monkeypatch) -> None:
+    pids = count(1)
+    alive: list[int] = []
+    killed: list[int] = []
+
+    def spawn(config, sock) -> int:
+        pid = next(pids)
+        alive.append(pid)
+        return pid
+
+    def wait() -> tuple[int, int]:
+        if not alive:
+            raise ChildProcessError
+        # Каждый воркер падает с кодом 1
+        return alive.pop(0), 1 << 8
+
+    monkeypatch.setattr(server, "_spawn", spawn)
+    monkeypatch.setattr(os, "wait", wait)
+    monkeypatch.setattr(os, "kill", lambda pid, signum: killed.append(pid))
+    monkeypatch.setattr(signal, "signal", lambda signum, handler: None)
+    monkeypatch.setattr(settings, "server_restart_backoff", 0)
+    monkeypatch.setattr(settings, "server_restart_max_failures", 3)
+
+    with pytest.raises(SystemExit) as exc_info:
+        server._supervise(None, None, workers=2)  # type: ignore[arg-type]
+
+    assert exc_info.value.code == 1
+    # Два первых падения перезапускаются, на третьем оставшийся воркер останавливается
+    assert next(pids) == 5
+    assert killed == [4]
@@ -1,10 +1,22 @@
+import asyncio
 from decimal import Decimal
 
 import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
+from app.cache.data_version import DataVersion
+from app.config import settings
+from app.database import Base
 from app.exceptions import CurrencyNotFoundError
+from app.repositories import exchangerate_repository
+from app.repositories.currency_repository import CurrencyRepository
+from app.repositories.exchangerate_repository import ExchangeRateRepository
+from app.repositories.rows import CurrencyRow, ExchangeRateRow
+from app.schemas import CurrencySchema, ExchangeRateSchema
 from app.service.currency_service import CurrencyService
 from app.service.exchange_service import ExchangeService
+from app.service.exchangerate_service import ExchangeRateService
+from app.sessions import DatabaseSessions, SessionsFactory
 
 
 @pytest.mark.anyio
@@ -37,3 +49,150 @@ async def test_convert_eur_rub(
 async def test_get_non_existent_currency(currency_service: CurrencyService) -> None:
     with pytest.raises(CurrencyNotFoundError):
         await currency_service.get_currency_by("USD")
+
+
+@pytest.mark.anyio
+async def test_effective_rate_served_from_cache(
+    exchange_service: ExchangeService, container, exchange_rate_usd_rub
+) -> None:
+    await exchange_service.convert("USD", "RUB", Decimal(1))
+    async with container() as mini_container:
+        rep = await mini_container.get(ExchangeRateRepository)
+        await rep.update_exchangerate("USD", "RUB", Decimal(100))
+
+    # Запись мимо сервиса снимок не инвалидирует — ответ берётся из памяти
+    response = await exchange_service.convert("USD", "RUB", Decimal(1))
+    assert response.rate == Decimal("77.75")
+
+
+@pytest.mark.anyio
+async def test_update_exchangerate_invalidates_cache(
+    exchange_service: ExchangeService, exchangerate_service: ExchangeRateService, exchange_rate_usd_rub
+) -> None:
+    await exchange_service.convert("USD", "RUB", Decimal(1))
+    await exchangerate_service.update_exchangerate("USD", "RUB", Decimal(100))
+
+    response = await exchange_service.convert("USD", "RUB", Decimal(1))
+    assert response.rate == Decimal(100)
+
+
+@pytest.mark.anyio
+async def test_stale_snapshot_falls_back_to_single_query(
+    exchange_service: ExchangeService, container, usd_currency, eur_currency, rub_currency, exchange_rate_usd_rub
+) -> None:
+    await exchange_service.convert("USD", "RUB", Decimal(1))
+    async with container() as mini_container:
+        rep = await mini_container.get(ExchangeRateRepository)
+        rate = ExchangeRateSchema.model_validate({"baseCurrencyCode": "USD", "targetCurrencyCode": "EUR", "rate": 0.85})
+        await rep.add_exchangerate(rate, usd_currency.id, eur_currency.id)
+
+        exchangerates = await rep.get_exchangerates_by_codepairs([("EUR", "RUB"), ("USD", "EUR"), ("USD", "RUB")])
+        assert len(exchangerates) == 2
+
+    response = await exchange_service.convert("EUR", "RUB", Decimal("24"))
+    assert response.converted_amount == Decimal("2195.294118")
+
+
+@pytest.mark.anyio
+async def test_stale_snapshot_fallback_uses_configured_pivots(
+    container, usd_currency, eur_currency, rub_currency, monkeypatch
+) -> None:
+    monkeypatch.setattr(settings, "cross_rate_pivots", ["EUR"])
+    async with container() as mini_container:
+        rep = await mini_container.get(ExchangeRateRepository)
+        exchange_service = await mini_container.get(ExchangeService)
+        rate = ExchangeRateSchema.model_validate({"baseCurrencyCode": "EUR", "targetCurrencyCode": "USD", "rate": 1.1})
+        await rep.add_exchangerate(rate, eur_currency.id, usd_currency.id)
+        await exchange_service.convert("EUR", "USD", Decimal(1))
+
+        # Курса EUR -> RUB в снимке нет, а путь USD -> RUB идёт только через опорную EUR
+        rate = ExchangeRateSchema.model_validate({"baseCurrencyCode": "EUR", "targetCurrencyCode": "RUB", "rate": 90})
+        await rep.add_exchangerate(rate, eur_currency.id, rub_currency.id)
+        response = await exchange_service.convert("USD", "RUB", Decimal(11))
+
+    assert response.converted_amount == Decimal(900)
+
+
+@pytest.mark.anyio
+async def test_codepairs_are_split_into_chunks(
+    container, exchange_rate_usd_rub, exchange_rate_usd_eur, monkeypatch
+) -> None:
+    monkeypatch.setattr(exchangerate_repository, "CODEPAIRS_PER_QUERY", 2)
+    async with container() as mini_container:
+        rep = await mini_container.get(ExchangeRateRepository)
+        exchangerates = await rep.get_exchangerates_by_codepairs([("USD", "RUB"), ("EUR", "RUB"), ("USD", "EUR")])
+
+    assert {(rate.base_currency.code, rate.target_currency.code) for rate in exchangerates} == {
+        ("USD", "RUB"),
+        ("USD", "EUR"),
+    }
+
+
+@pytest.mark.anyio
+async def test_single_flight_load_uses_own_sessions(container, usd_currency, monkeypatch) -> None:
+    used: list[DatabaseSessions] = []
+    get_currency_by = CurrencyRepository.get_currency_by
+
+    async def recording_get_currency_by(self: CurrencyRepository, code: str) -> CurrencyRow:
+        used.append(self._sessions)
+        return await get_currency_by(self, code)
+
+    monkeypatch.setattr(CurrencyRepository, "get_currency_by", recording_get_currency_by)
+    async with container() as mini_container:
+        request_sessions = await mini_container.get(DatabaseSessions)
+        service = await mini_container.get(CurrencyService)
+        assert (await service.get_currency_by("USD")).code == "USD"
+
+    # Загрузку ждут и другие запросы, поэтому сессии запроса, который её начал, она не использует
+    assert len(used) == 1
+    assert used[0] is not request_sessions
+
+
+@pytest.mark.anyio
+async def test_concurrent_updates_after_reads(tmp_path) -> None:
+    # Файловая БД: у тестовой БД в памяти одно соединение на всех, конкурентные транзакции на нём не разойдутся
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite'}")
+    data_version = DataVersion()
+    sessions_factory = SessionsFactory(async_sessionmaker(engine, expire_on_commit=False), None, data_version, 0)
+
+    def currencies(sessions: DatabaseSessions) -> CurrencyRepository:
+        return CurrencyRepository(sessions, data_version)
+
+    def exchangerates(sessions: DatabaseSessions) -> ExchangeRateRepository:
+        return ExchangeRateRepository(sessions, data_version)
+
+    async def add_currency(code: str) -> int:
+        schema = CurrencySchema(name="Currency", code=code, sign="$")
+        return (await sessions_factory.run(lambda sessions: currencies(sessions).add_currency(schema))).id
+
+    async def add_rate(usd_id: int, code: str) -> None:
+        target_id = await add_currency(code)
+        schema = ExchangeRateSchema.model_validate({"baseCurrencyCode": "USD", "targetCurrencyCode": code, "rate": 2})
+        await sessions_factory.run(lambda sessions: exchangerates(sessions).add_exchangerate(schema, usd_id, target_id))
+
+    async def read(code: str) -> ExchangeRateRow:
+        return await sessions_factory.run(
+            lambda sessions: exchangerates(sessions).get_exchangerate_by_codepair("USD", code)
+        )
+
+    async def update(code: str, rate: Decimal) -> tuple[int, Decimal]:
+        return await sessions_factory.run(
+            lambda sessions: exchangerates(sessions).update_exchangerate("USD", code, rate)
+        )
+
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        usd_id = await add_currency("USD")
+        for code in ("RUB", "EUR"):
+            await add_rate(usd_id, code)
+
+        # После конкурентных чтений колонки RETURNING у UPDATE путались, и каждый PATCH падал
+        await asyncio.gather(*[read(code) for code in ("RUB", "EUR") * 10])
+        updated = await asyncio.gather(
+            *[update(code, Decimal(value)) for value in range(1, 11) for code in ("RUB", "EUR")]
+        )
+
+        assert sorted(rate for _, rate in updated) == sorted(Decimal(value) for value in range(1, 11) for _ in range(2))
+    finally:
+        await engine.dispose()
@@ -0,0 +1,82 @@
+import pytest
+from dishka import Scope, make_async_container, provide
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import QueuePool
+
+from app.cache.data_version import DataVersion
+from app.config import settings
+from app.dependencies import MyProvider
+from app.sessions import DatabaseSessions, ReplicaSessionmaker, SessionsFactory
+
+
+def test_reads_are_pinned_to_primary_after_write() -> None:
+    primary, replica = AsyncSession(), AsyncSession()
+    sessions = DatabaseSessions(lambda: primary, lambda: replica)
+
+    assert sessions.read is replica
+    assert sessions.write is primary
+    assert sessions.read is primary
+
+
+def test_reads_use_primary_without_replica() -> None:
+    primary = AsyncSession()
+    assert DatabaseSessions(lambda: primary).read is primary
+
+
+@pytest.mark.anyio
+async def test_sessions_are_created_lazily_and_released_after_read(tmp_path) -> None:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite'}")
+    created: list[AsyncSession] = []
+
+    def make_session() -> AsyncSession:
+        created.append(AsyncSession(engine))
+        return created[-1]
+
+    sessions = DatabaseSessions(make_session)
+    try:
+        assert created == []
+
+        result = await sessions.execute_read(select(1))
+        assert result.scalar_one() == 1
+        assert len(created) == 1
+        # Соединение уже вернулось в пул, хотя запрос ещё не закончился
+        assert isinstance(engine.pool, QueuePool)
+        assert engine.pool.checkedout() == 0
+    finally:
+        await sessions.close()
+        await engine.dispose()
+
+
+def test_replica_url_uses_primary_credentials() -> None:
+    replica_settings = settings.model_copy(update={"host_db_replica": "replica", "port_db_replica": None})
+    assert replica_settings.database_replica_url == settings.database_url.replace(f"@{settings.host_db}:", "@replica:")
+
+
+class ReplicaProvider(MyProvider):
+    @provide(scope=Scope.APP)
+    def get_engine(self) -> AsyncEngine:
+        return create_async_engine("sqlite+aiosqlite:///:memory:")
+
+    @provide(scope=Scope.APP)
+    async def get_replica_sessionmaker(self, engine: AsyncEngine) -> ReplicaSessionmaker:
+        return ReplicaSessionmaker(async_sessionmaker(engine, info={"replica": True}))
+
+
+@pytest.mark.anyio
+async def test_reads_go_to_primary_right_after_data_change(monkeypatch) -> None:
+    container = make_async_container(ReplicaProvider())
+    try:
+        monkeypatch.setattr(settings, "db_replica_max_lag", 0)
+        async with container() as request_container:
+            sessions = await request_container.get(DatabaseSessions)
+            assert sessions.read.info.get("replica")
+
+        # Реплика может ещё не содержать только что записанное — тело ответа собирается из основной БД
+        monkeypatch.setattr(await container.get(SessionsFactory), "max_lag", 60)
+        (await container.get(DataVersion)).bump()
+        async with container() as request_container:
+            sessions = await request_container.get(DatabaseSessions)
+            assert not sessions.read.info.get("replica")
+    finally:
+        await container.close()
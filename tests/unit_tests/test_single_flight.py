@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from app.cache.single_flight import SingleFlight
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_share_one_load() -> None:
+    single_flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def load() -> int:
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return 42
+
+    waiters = [asyncio.create_task(single_flight.do(("currency", "USD"), load)) for _ in range(10)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == [42] * 10
+    assert calls == 1
+    assert single_flight.in_flight() == 0
+    # После завершения загрузки следующий вызов снова идёт в источник
+    assert await single_flight.do(("currency", "USD"), load) == 42
+    assert calls == 2
+
+
+@pytest.mark.anyio
+async def test_error_is_shared_and_cancelled_waiter_does_not_cancel_load() -> None:
+    single_flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def load() -> int:
+        await release.wait()
+        raise LookupError
+
+    first = asyncio.create_task(single_flight.do("key", load))
+    second = asyncio.create_task(single_flight.do("key", load))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    with pytest.raises(LookupError):
+        await second
+    assert first.cancelled()